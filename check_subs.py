@@ -1,22 +1,24 @@
-from src.database.core import SessionLocal
-from src.database.models import Task, SubCategory
-from sqlalchemy import func
-
-session = SessionLocal()
-try:
-    # Check what sub_categories exist
-    results = session.query(Task.sub_category, func.count(Task.id)).group_by(Task.sub_category).all()
-    print("Existing Sub Categories:")
-    for sub, count in results:
-        print(f"'{sub}': {count}")
-        
-    print("-" * 20)
-    
-    # Check if 'sub_maintenance' exists in SubCategory table?
-    subs = session.query(SubCategory).all()
-    print("Defined Sub Categories:")
-    for s in subs:
-        print(f"ID: {s.id}, Name: {s.name}, Parent: {s.parent}")
-        
-finally:
-    session.close()
+from src.database.core import SessionLocal, GENERAL_CATEGORY_NAME
+from src.database.models import Task, SubCategory
+from sqlalchemy import func
+
+session = SessionLocal()
+try:
+    # Check which sub_categories tasks point at
+    results = session.query(Task.sub_category_id, SubCategory.name, func.count(Task.id)).outerjoin(
+        SubCategory, Task.sub_category_id == SubCategory.id
+    ).group_by(Task.sub_category_id, SubCategory.name).all()
+    print("Existing Sub Categories:")
+    for sub_id, name, count in results:
+        print(f"{sub_id} '{name or GENERAL_CATEGORY_NAME}': {count}")
+        
+    print("-" * 20)
+    
+    # Check if 'sub_maintenance' exists in SubCategory table?
+    subs = session.query(SubCategory).all()
+    print("Defined Sub Categories:")
+    for s in subs:
+        print(f"ID: {s.id}, Name: {s.name}, Parent: {s.parent}")
+        
+finally:
+    session.close()
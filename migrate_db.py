@@ -1,39 +1,400 @@
-from sqlalchemy import text
-import logging
-
-logger = logging.getLogger(__name__)
-
-# Raw SQL migrations. Use portable types only:
-#   - VARCHAR, BIGINT, INTEGER work on both SQLite and PostgreSQL
-#   - Use TIMESTAMP (not DATETIME) for date/time columns — PostgreSQL
-#     does not recognize DATETIME as a type
-MIGRATIONS = [
-    ("tasks", "recurrence", "ALTER TABLE tasks ADD COLUMN recurrence VARCHAR"),
-    ("sub_categories", "chat_id", "ALTER TABLE sub_categories ADD COLUMN chat_id BIGINT"),
-    ("tasks", "is_shared", "ALTER TABLE tasks ADD COLUMN is_shared INTEGER DEFAULT 0"),
-    ("tasks", "completed_at", "ALTER TABLE tasks ADD COLUMN completed_at TIMESTAMP"),
-]
-
-def migrate():
-    from src.database.core import SessionLocal, DATABASE_URL
-    is_postgres = not DATABASE_URL.startswith("sqlite")
-
-    for table, column, sql in MIGRATIONS:
-        # PostgreSQL supports IF NOT EXISTS (avoids noisy error on existing columns)
-        if is_postgres:
-            sql = sql.replace("ADD COLUMN ", "ADD COLUMN IF NOT EXISTS ")
-
-        session = SessionLocal()
-        try:
-            session.execute(text(sql))
-            session.commit()
-            logger.info(f"Migration OK: '{column}' on '{table}'")
-        except Exception as e:
-            session.rollback()
-            logger.info(f"Migration skipped: '{column}' on '{table}': {e}")
-        finally:
-            session.close()
-
-if __name__ == "__main__":
-    logging.basicConfig(level=logging.INFO)
-    migrate()
+import os
+import re
+import sys
+import time
+from sqlalchemy import text, inspect
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Raw SQL migrations. Use portable types only:
+#   - VARCHAR, BIGINT, INTEGER, SMALLINT work on both SQLite and PostgreSQL
+#   - Use TIMESTAMP (not DATETIME) for date/time columns — PostgreSQL
+#     does not recognize DATETIME as a type
+MIGRATIONS = [
+    ("tasks", "recurrence", "ALTER TABLE tasks ADD COLUMN recurrence VARCHAR"),
+    ("sub_categories", "chat_id", "ALTER TABLE sub_categories ADD COLUMN chat_id BIGINT"),
+    ("tasks", "completed_at", "ALTER TABLE tasks ADD COLUMN completed_at TIMESTAMP"),
+    # Compact enum encodings (see EnumCode in models.py). Legacy string columns
+    # are backfilled into these, then dropped by _contract_legacy_columns().
+    ("tasks", "priority_code", "ALTER TABLE tasks ADD COLUMN priority_code SMALLINT"),
+    ("tasks", "status_code", "ALTER TABLE tasks ADD COLUMN status_code SMALLINT"),
+    ("tasks", "category_code", "ALTER TABLE tasks ADD COLUMN category_code SMALLINT"),
+    ("tasks", "shared_flag", "ALTER TABLE tasks ADD COLUMN shared_flag SMALLINT DEFAULT 0"),
+    # Sub-category foreign key, backfilled from the legacy free-text sub_category
+    ("tasks", "sub_category_id", "ALTER TABLE tasks ADD COLUMN sub_category_id INTEGER REFERENCES sub_categories(id)"),
+    # Household scoping for shared tasks and categories (replaces chat_id=0)
+    ("tasks", "household_id", "ALTER TABLE tasks ADD COLUMN household_id INTEGER REFERENCES households(id)"),
+    ("sub_categories", "household_id", "ALTER TABLE sub_categories ADD COLUMN household_id INTEGER REFERENCES households(id)"),
+    ("tasks_archive", "household_id", "ALTER TABLE tasks_archive ADD COLUMN household_id INTEGER"),
+]
+
+# Indexes for tables that already existed before the index was declared on the
+# model (create_all only creates indexes together with their table).
+INDEXES = [
+    ("ix_tasks_status_chat_priority", "tasks", "status_code, chat_id, priority_code"),
+    ("ix_tasks_sub_category_id", "tasks", "sub_category_id"),
+    ("ix_tasks_household_status", "tasks", "household_id, status_code"),
+    ("ix_sub_categories_household_id", "sub_categories", "household_id"),
+    ("ix_tasks_archive_household_completed", "tasks_archive", "household_id, completed_at"),
+]
+
+# Legacy column -> SET clause producing its compact replacement.
+# Codes must match the tuple positions in models.PRIORITY_CODES etc.
+LEGACY_ENUM_BACKFILL = {
+    "priority": "priority_code = CASE priority WHEN 'urgent' THEN 0 WHEN 'low' THEN 2 ELSE 1 END",
+    "status": "status_code = CASE status WHEN 'done' THEN 1 ELSE 0 END",
+    "parent_category": "category_code = CASE parent_category WHEN 'work' THEN 1 ELSE 0 END",
+    "is_shared": "shared_flag = COALESCE(is_shared, 0)",
+}
+
+# Legacy tasks.sub_category held the category *name*. Shared tasks used the
+# shared categories (chat_id=0 sentinel); 'כללי' was a label, not a category.
+# Templates take the tasks table alias as {t}.
+_TASK_CATEGORY_OWNER = "CASE WHEN {t}.shared_flag = 1 THEN 0 ELSE {t}.chat_id END"
+_TASK_CATEGORY_PARENT = "CASE {t}.category_code WHEN 1 THEN 'work' ELSE 'home' END"
+_MATCHING_CATEGORY = (
+    "FROM sub_categories sc WHERE sc.name = {t}.sub_category "
+    f"AND sc.parent = {_TASK_CATEGORY_PARENT} AND sc.chat_id = {_TASK_CATEGORY_OWNER}"
+)
+_UNMAPPED_TASKS = "t.sub_category_id IS NULL AND t.sub_category IS NOT NULL AND t.sub_category <> 'כללי'"
+
+# Dropping the legacy columns (the contract step) is a separate, later step:
+# the release that stops writing them only relaxes them, so the release before
+# it keeps working during a rolling deploy. Rows it inserts or updates in the
+# meantime get their code columns from a sync trigger (PostgreSQL; dropped at
+# contract), and the backfills re-run on every start. Run the contract once
+# every instance is on the new model — the old release drained, not just
+# stopped routing: MIGRATE_CONTRACT=1, or `python migrate_db.py --contract`.
+MIGRATE_CONTRACT = os.getenv("MIGRATE_CONTRACT", "0") == "1"
+
+BACKFILL_BATCH_SIZE = 500
+BACKFILL_PAUSE = 0.05  # seconds between batches — keeps row locks short
+
+def _columns(table):
+    from src.database.core import engine
+    return {c["name"] for c in inspect(engine).get_columns(table)}
+
+def _add_columns(is_postgres):
+    from src.database.core import SessionLocal
+
+    for table, column, sql in MIGRATIONS:
+        # PostgreSQL supports IF NOT EXISTS (avoids noisy error on existing columns)
+        if is_postgres:
+            sql = sql.replace("ADD COLUMN ", "ADD COLUMN IF NOT EXISTS ")
+
+        session = SessionLocal()
+        try:
+            session.execute(text(sql))
+            session.commit()
+            logger.info(f"Migration OK: '{column}' on '{table}'")
+        except Exception as e:
+            session.rollback()
+            logger.info(f"Migration skipped: '{column}' on '{table}': {e}")
+        finally:
+            session.close()
+
+def run_batched_update(sql, params=None, label="backfill"):
+    """Runs an UPDATE repeatedly, one short transaction per batch, until it
+    touches no rows. `sql` must limit itself to :batch rows per execution.
+    Returns the total number of rows updated. Other instances running
+    meanwhile are told to drop their caches afterwards."""
+    from src.database.core import SessionLocal
+    from src.database.cache_bus import publish_evict_all
+
+    params = dict(params or {}, batch=BACKFILL_BATCH_SIZE)
+    total = 0
+    while True:
+        session = SessionLocal()
+        try:
+            result = session.execute(text(sql), params)
+            session.commit()
+            count = result.rowcount or 0
+        except Exception as e:
+            session.rollback()
+            logger.error(f"{label}: batch failed after {total} rows: {e}", exc_info=True)
+            raise
+        finally:
+            session.close()
+        if count == 0:
+            break
+        total += count
+        time.sleep(BACKFILL_PAUSE)
+    if total:
+        publish_evict_all()
+        logger.info(f"{label}: updated {total} rows")
+    return total
+
+def _backfill_enum_codes():
+    """Copies legacy string enums into their SMALLINT columns in small batches."""
+    legacy = [col for col in LEGACY_ENUM_BACKFILL if col in _columns("tasks")]
+    if "priority" not in legacy:
+        return
+    assignments = ", ".join(LEGACY_ENUM_BACKFILL[col] for col in legacy)
+    run_batched_update(
+        f"UPDATE tasks SET {assignments} WHERE id IN ("
+        f"SELECT id FROM tasks WHERE priority_code IS NULL ORDER BY id LIMIT :batch)",
+        label="Enum backfill",
+    )
+
+def _backfill_sub_category_ids():
+    """Maps legacy sub_category names to sub_categories.id, per chat.
+
+    Names with no matching category (renamed or hand-edited rows) get an
+    inactive category of their own first, so every task keeps its label and
+    each batch is guaranteed to make progress.
+    """
+    from src.database.core import SessionLocal
+
+    if "sub_category" not in _columns("tasks"):
+        return
+
+    session = SessionLocal()
+    try:
+        result = session.execute(text(
+            "INSERT INTO sub_categories (chat_id, name, parent, is_active) "
+            f"SELECT DISTINCT {_TASK_CATEGORY_OWNER.format(t='t')}, t.sub_category, "
+            f"{_TASK_CATEGORY_PARENT.format(t='t')}, 0 FROM tasks t "
+            f"WHERE {_UNMAPPED_TASKS} AND NOT EXISTS (SELECT 1 {_MATCHING_CATEGORY.format(t='t')})"
+        ))
+        session.commit()
+        if result.rowcount:
+            logger.info(f"Category backfill: created {result.rowcount} inactive categories for orphan names")
+    except Exception as e:
+        session.rollback()
+        logger.error(f"Category backfill: could not create orphan categories: {e}", exc_info=True)
+        return
+    finally:
+        session.close()
+
+    # Prefer the active category when a chat has both an active and a deleted one
+    run_batched_update(
+        "UPDATE tasks SET sub_category_id = ("
+        f"SELECT sc.id {_MATCHING_CATEGORY.format(t='tasks')} ORDER BY sc.is_active DESC, sc.id LIMIT 1"
+        ") WHERE id IN ("
+        f"SELECT t.id FROM tasks t WHERE {_UNMAPPED_TASKS} AND EXISTS (SELECT 1 {_MATCHING_CATEGORY.format(t='t')}) "
+        "ORDER BY t.id LIMIT :batch)",
+        label="Category backfill",
+    )
+
+def _backfill_daily_stats():
+    """Builds the daily_stats rollups from existing tasks, once (while empty)."""
+    from src.database.core import SessionLocal
+    from src.database.stats import backfill_daily_stats
+
+    session = SessionLocal()
+    try:
+        if session.execute(text("SELECT 1 FROM daily_stats LIMIT 1")).first():
+            return
+    finally:
+        session.close()
+    try:
+        backfill_daily_stats(SessionLocal)
+    except Exception as e:
+        logger.error(f"Daily stats backfill failed: {e}", exc_info=True)
+
+# Shared rows still on the pre-household chat_id=0 sentinel (scope code 1 = 'shared')
+_UNSCOPED_SHARED = [
+    "SELECT 1 FROM tasks WHERE shared_flag = 1 AND household_id IS NULL",
+    "SELECT 1 FROM tasks_archive WHERE shared_flag = 1 AND household_id IS NULL",
+    "SELECT 1 FROM sub_categories WHERE chat_id = 0",
+    "SELECT 1 FROM daily_stats WHERE chat_id = 0 AND scope = 1",
+]
+
+def _migrate_shared_to_household():
+    """Moves the global shared scope into a default household.
+
+    Members are the allowlisted users, or every task owner while the bot is
+    open — the same people who could see shared tasks before. Re-runs pick
+    up leftovers into the oldest household.
+    """
+    from src.database.core import SessionLocal
+    from src.database.models import Household, HouseholdMember, AllowedUser, Task
+    from src.database.households import DEFAULT_HOUSEHOLD_NAME, ensure_shared_categories
+
+    session = SessionLocal()
+    try:
+        if not any(session.execute(text(f"{sql} LIMIT 1")).first() for sql in _UNSCOPED_SHARED):
+            return
+        household = session.query(Household).order_by(Household.id).first()
+        if household is None:
+            members = {row[0] for row in session.query(AllowedUser.user_id)}
+            if not members:
+                members = {row[0] for row in session.query(Task.chat_id).distinct()}
+            household = Household(name=DEFAULT_HOUSEHOLD_NAME)
+            session.add(household)
+            session.flush()
+            session.add_all(HouseholdMember(household_id=household.id, chat_id=chat_id) for chat_id in members)
+            logger.info(f"Household migration: created household {household.id} with {len(members)} member(s)")
+        household_id = household.id
+        session.execute(text(
+            "UPDATE sub_categories SET household_id = :household, chat_id = NULL WHERE chat_id = 0"
+        ), {"household": household_id})
+        session.execute(text(
+            "UPDATE daily_stats SET chat_id = :household WHERE chat_id = 0 AND scope = 1"
+        ), {"household": household_id})
+        ensure_shared_categories(session, household_id)
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        logger.error(f"Household migration failed: {e}", exc_info=True)
+        return
+    finally:
+        session.close()
+
+    for table in ("tasks", "tasks_archive"):
+        key = "id" if table == "tasks" else "archive_id"
+        run_batched_update(
+            f"UPDATE {table} SET household_id = :household WHERE {key} IN ("
+            f"SELECT {key} FROM {table} WHERE shared_flag = 1 AND household_id IS NULL ORDER BY {key} LIMIT :batch)",
+            {"household": household_id},
+            label=f"Household backfill ({table})",
+        )
+
+def _relax_legacy_columns(table, columns, remaining_sql, is_postgres):
+    """Drops NOT NULL from legacy columns the model no longer writes, so new
+    rows can be inserted while the columns are still there."""
+    from src.database.core import engine
+
+    not_null = [c["name"] for c in inspect(engine).get_columns(table)
+                if c["name"] in columns and not c["nullable"]]
+    if not not_null:
+        return
+    if not is_postgres:
+        # SQLite can only relax a constraint by rebuilding the table. Its
+        # database belongs to this one process, so no older release still
+        # reads the columns: contract right away instead.
+        _contract_legacy_columns(table, columns, remaining_sql)
+        return
+    with engine.begin() as conn:
+        for column in not_null:
+            conn.execute(text(f"ALTER TABLE {table} ALTER COLUMN {column} DROP NOT NULL"))
+    logger.info(f"Migration OK: legacy columns {not_null} on '{table}' made nullable")
+
+_LEGACY_SYNC_FUNCTION = "tasks_legacy_sync"
+_LEGACY_SYNC_TRIGGER = "tasks_legacy_sync"
+
+def _legacy_sync_body():
+    """PL/pgSQL body of the sync trigger. Rows from the old release are the
+    ones inserted without priority_code; on update, a changed legacy column
+    can only come from it too (the new model never writes them)."""
+    inserted, updated = [], []
+    for column, assignment in LEGACY_ENUM_BACKFILL.items():
+        code, value = assignment.split(" = ", 1)
+        value = re.sub(rf"\b{column}\b", f"NEW.{column}", value)
+        inserted.append(f"NEW.{code} := {value};")
+        updated.append(f"IF NEW.{column} IS DISTINCT FROM OLD.{column} THEN NEW.{code} := {value}; END IF;")
+    sub_category = (
+        f"NEW.sub_category_id := (SELECT sc.id {_MATCHING_CATEGORY.format(t='NEW')} "
+        "ORDER BY sc.is_active DESC, sc.id LIMIT 1);"
+    )
+    return (
+        "BEGIN\n"
+        "IF TG_OP = 'INSERT' THEN\n"
+        "  IF NEW.priority_code IS NULL THEN\n"
+        f"    {' '.join(inserted)}\n"
+        f"    IF NEW.sub_category_id IS NULL THEN {sub_category} END IF;\n"
+        "  END IF;\n"
+        "ELSE\n"
+        f"  {' '.join(updated)}\n"
+        f"  IF NEW.sub_category IS DISTINCT FROM OLD.sub_category THEN {sub_category} END IF;\n"
+        "END IF;\n"
+        "RETURN NEW;\n"
+        "END;"
+    )
+
+def _create_legacy_sync(is_postgres):
+    """Keeps rows written by the previous release (legacy columns only)
+    visible to the new model until the contract step drops the columns."""
+    from src.database.core import engine
+
+    if not is_postgres or not {"priority", "sub_category"} <= _columns("tasks"):
+        return
+    with engine.begin() as conn:
+        conn.execute(text(
+            f"CREATE OR REPLACE FUNCTION {_LEGACY_SYNC_FUNCTION}() RETURNS trigger "
+            f"LANGUAGE plpgsql AS $${_legacy_sync_body()}$$"
+        ))
+        conn.execute(text(f"DROP TRIGGER IF EXISTS {_LEGACY_SYNC_TRIGGER} ON tasks"))
+        conn.execute(text(
+            f"CREATE TRIGGER {_LEGACY_SYNC_TRIGGER} BEFORE INSERT OR UPDATE ON tasks "
+            f"FOR EACH ROW EXECUTE FUNCTION {_LEGACY_SYNC_FUNCTION}()"
+        ))
+    logger.info("Migration OK: legacy column sync trigger on 'tasks'")
+
+def _drop_legacy_sync(is_postgres):
+    from src.database.core import engine
+
+    if not is_postgres:
+        return
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TRIGGER IF EXISTS {_LEGACY_SYNC_TRIGGER} ON tasks"))
+        conn.execute(text(f"DROP FUNCTION IF EXISTS {_LEGACY_SYNC_FUNCTION}()"))
+
+def _contract_legacy_columns(table, columns, remaining_sql):
+    """Drops legacy columns once their backfill is complete.
+
+    `remaining_sql` counts rows still waiting for the backfill; while it is
+    non-zero nothing is dropped and this raises, as does a failed drop (the
+    drops share one transaction).
+    """
+    from src.database.core import engine
+
+    legacy = [col for col in columns if col in _columns(table)]
+    if not legacy:
+        return
+
+    with engine.begin() as conn:
+        remaining = conn.execute(text(remaining_sql)).scalar()
+        if remaining:
+            raise RuntimeError(f"Backfill incomplete on '{table}' ({remaining} rows left) — cannot drop {legacy}")
+        for column in legacy:
+            conn.execute(text(f"ALTER TABLE {table} DROP COLUMN {column}"))
+    logger.info(f"Migration OK: dropped legacy columns {legacy} on '{table}'")
+
+def _create_indexes(is_postgres):
+    from src.database.core import engine
+
+    for name, table, columns in INDEXES:
+        if is_postgres:
+            # CONCURRENTLY avoids blocking writes, but cannot run in a transaction
+            sql = f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({columns})"
+        else:
+            sql = f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})"
+        try:
+            with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                conn.execute(text(sql))
+            logger.info(f"Migration OK: index '{name}' on '{table}'")
+        except Exception as e:
+            logger.info(f"Migration skipped: index '{name}' on '{table}': {e}")
+
+_LEGACY_ENUMS_REMAINING = "SELECT COUNT(*) FROM tasks WHERE priority_code IS NULL"
+_LEGACY_SUB_CATEGORY_REMAINING = f"SELECT COUNT(*) FROM tasks t WHERE {_UNMAPPED_TASKS}"
+
+def migrate(contract=MIGRATE_CONTRACT):
+    """Brings the schema up to the current model. Raises if a step the bot
+    can't run without fails. With `contract`, also drops the legacy columns."""
+    from src.database.core import DATABASE_URL
+    is_postgres = not DATABASE_URL.startswith("sqlite")
+
+    _add_columns(is_postgres)
+    # From here on the old release's writes fill the code columns themselves;
+    # the backfills pick up everything it wrote before
+    _create_legacy_sync(is_postgres)
+    _backfill_enum_codes()
+    # Legacy priority / parent_category are NOT NULL: relaxed before the new
+    # model (which no longer writes them) inserts rows
+    _relax_legacy_columns("tasks", LEGACY_ENUM_BACKFILL, _LEGACY_ENUMS_REMAINING, is_postgres)
+    _backfill_sub_category_ids()
+    if contract:
+        # The trigger reads the legacy columns: it goes before they do
+        _drop_legacy_sync(is_postgres)
+        _contract_legacy_columns("tasks", LEGACY_ENUM_BACKFILL, _LEGACY_ENUMS_REMAINING)
+        _contract_legacy_columns("tasks", ["sub_category"], _LEGACY_SUB_CATEGORY_REMAINING)
+    _create_indexes(is_postgres)
+    _migrate_shared_to_household()
+    _backfill_daily_stats()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    migrate(contract=MIGRATE_CONTRACT or "--contract" in sys.argv[1:])
@@ -1 +1 @@
-# Bot package
+# Bot package
@@ -0,0 +1,168 @@
+from telegram import Update
+from telegram.ext import ContextTypes
+from src.database.core import ensure_user_preferences
+from src.database.unit_of_work import current_session, commit_current
+from src.bot.auth import is_admin, allow_user, deny_user, list_allowed_users
+from src.bot.utils import ALLOWED_USERS, ADMIN_USERS
+from src.database.households import primary_household_id, add_member, remove_member, create_household, list_households
+import html
+import logging
+
+logger = logging.getLogger(__name__)
+
+async def _require_admin(update: Update) -> bool:
+    if is_admin(update.effective_user.id):
+        return True
+    await update.message.reply_text("⛔ פקודה למנהלים בלבד.")
+    return False
+
+def _parse_user_id(context):
+    try:
+        return int(context.args[0])
+    except (IndexError, ValueError, TypeError):
+        return None
+
+async def users_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/users — lists the allowlist."""
+    if not await _require_admin(update):
+        return
+    users = list_allowed_users(current_session())
+    if not users and not (ALLOWED_USERS or ADMIN_USERS):
+        await update.message.reply_text("🔓 אין רשימת הרשאות — הבוט פתוח לכולם.")
+        return
+    lines = ["👥 <b>משתמשים מורשים</b>"]
+    for u in users:
+        role = " 👑" if u.is_admin else ""
+        lines.append(f"  <code>{u.user_id}</code>{role}")
+    lines.append("\n/allow &lt;id&gt; [admin] · /deny &lt;id&gt;")
+    await update.message.reply_text("\n".join(lines), parse_mode='HTML')
+
+async def allow_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/allow <user_id> [admin] — adds a household member (optionally as admin)."""
+    if not await _require_admin(update):
+        return
+    user_id = _parse_user_id(context)
+    if user_id is None:
+        await update.message.reply_text("שימוש: /allow <user_id> [admin]")
+        return
+    admin = len(context.args) > 1 and context.args[1].lower() == 'admin'
+    session = current_session()
+    try:
+        allow_user(session, user_id, added_by=update.effective_user.id, admin=admin)
+        ensure_user_preferences(session, user_id)
+        # New users join the inviting admin's household
+        household_id = primary_household_id(session, update.effective_user.id)
+        if household_id is not None:
+            add_member(session, household_id, user_id)
+        commit_current()
+        logger.info(f"User {update.effective_user.id} allowed {user_id} (admin={admin}, household={household_id})")
+        await update.message.reply_text(f"✅ המשתמש {user_id} נוסף{' כמנהל' if admin else ''}.")
+    except Exception as e:
+        session.rollback()
+        logger.error(f"Error allowing user {user_id}: {e}", exc_info=True)
+        await update.message.reply_text("❌ שגיאה בהוספת המשתמש.")
+
+async def deny_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/deny <user_id> — removes a user from the allowlist."""
+    if not await _require_admin(update):
+        return
+    user_id = _parse_user_id(context)
+    if user_id is None:
+        await update.message.reply_text("שימוש: /deny <user_id>")
+        return
+    if user_id == update.effective_user.id:
+        await update.message.reply_text("❌ אי אפשר להסיר את עצמך.")
+        return
+    session = current_session()
+    try:
+        if deny_user(session, user_id):
+            commit_current()
+            logger.info(f"User {update.effective_user.id} denied {user_id}")
+            await update.message.reply_text(f"🚫 המשתמש {user_id} הוסר.")
+        else:
+            await update.message.reply_text("המשתמש לא נמצא ברשימה.")
+    except Exception as e:
+        session.rollback()
+        logger.error(f"Error denying user {user_id}: {e}", exc_info=True)
+        await update.message.reply_text("❌ שגיאה בהסרת המשתמש.")
+
+async def queue_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/queue — outbound message queue depth and recent dead letters."""
+    if not await _require_admin(update):
+        return
+    from datetime import timedelta
+    from src.database.outbox import queue_depth, recent_dead_letters, utc_now_naive
+    from src.database.deliveries import delivery_lag
+    session = current_session()
+    depth = queue_depth(session)
+    lines = [
+        "📬 <b>תור הודעות יוצאות</b>",
+        f"ממתינות: {depth['pending']} · בשליחה: {depth['sending']}",
+        f"לשליחה עכשיו: {depth['due']} (הוותיקה: {depth['oldest_due_seconds']} שנ׳)",
+        f"נשלחו: {depth['sent']} · נכשלו סופית: {depth['dead']}",
+    ]
+    delivered, avg_lag, max_lag, undelivered = delivery_lag(session, utc_now_naive() - timedelta(days=1))
+    lines.append(f"\n⏰ תזכורות (24 שעות): {delivered} נמסרו · עיכוב ממוצע {avg_lag:.0f} שנ׳ · "
+                 f"מקסימום {max_lag:.0f} שנ׳ · {undelivered} טרם נמסרו")
+    dead = recent_dead_letters(session)
+    if dead:
+        lines.append("\n☠️ <b>כשלונות אחרונים:</b>")
+        for m in dead:
+            error = html.escape((m.last_error or "")[:80])
+            lines.append(f"  <code>{m.chat_id}</code> {html.escape(m.idempotency_key)} — {error}")
+    await update.message.reply_text("\n".join(lines), parse_mode='HTML')
+
+_HOUSEHOLD_USAGE = ("שימוש:\n/household — רשימת משקי בית\n/household new &lt;שם&gt;\n"
+                    "/household add &lt;household_id&gt; &lt;user_id&gt;\n/household remove &lt;household_id&gt; &lt;user_id&gt;")
+
+async def household_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/household [new <name> | add <hid> <uid> | remove <hid> <uid>] — manages households."""
+    if not await _require_admin(update):
+        return
+    args = context.args or []
+    action = args[0].lower() if args else None
+    session = current_session()
+    try:
+        if action is None:
+            households = list_households(session)
+            if not households:
+                await update.message.reply_text("🏠 אין משקי בית עדיין.\n\n" + _HOUSEHOLD_USAGE, parse_mode='HTML')
+                return
+            lines = ["🏠 <b>משקי בית</b>"]
+            for household, members in households:
+                member_list = ", ".join(f"<code>{m}</code>" for m in members) or "—"
+                lines.append(f"  <b>{household.id}</b> {html.escape(household.name)}: {member_list}")
+            await update.message.reply_text("\n".join(lines), parse_mode='HTML')
+        elif action == 'new' and len(args) > 1:
+            household_id = create_household(session, " ".join(args[1:]), [update.effective_user.id]).id
+            commit_current()
+            logger.info(f"User {update.effective_user.id} created household {household_id}")
+            await update.message.reply_text(f"✅ משק בית {household_id} נוצר.")
+        elif action in ('add', 'remove') and len(args) == 3:
+            try:
+                household_id, user_id = int(args[1]), int(args[2])
+            except ValueError:
+                await update.message.reply_text(_HOUSEHOLD_USAGE, parse_mode='HTML')
+                return
+            if action == 'add':
+                from src.database.models import Household
+                if session.get(Household, household_id) is None:
+                    await update.message.reply_text("משק הבית לא נמצא.")
+                    return
+                changed = add_member(session, household_id, user_id)
+            else:
+                changed = remove_member(session, household_id, user_id)
+            commit_current()
+            logger.info(f"User {update.effective_user.id}: household {household_id} {action} {user_id} (changed={changed})")
+            if not changed:
+                await update.message.reply_text("לא בוצע שינוי.")
+            elif action == 'add':
+                await update.message.reply_text(f"✅ {user_id} צורף למשק בית {household_id}.")
+            else:
+                await update.message.reply_text(f"🚫 {user_id} הוסר ממשק בית {household_id}.")
+        else:
+            await update.message.reply_text(_HOUSEHOLD_USAGE, parse_mode='HTML')
+    except Exception as e:
+        session.rollback()
+        logger.error(f"Error in /household: {e}", exc_info=True)
+        await update.message.reply_text("❌ שגיאה בעדכון משקי הבית.")
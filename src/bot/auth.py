@@ -0,0 +1,149 @@
+import os
+import time
+import logging
+from src.database.core import SessionLocal
+from src.database.models import AllowedUser
+from src.database.cache_bus import on_event
+from src.database.unit_of_work import after_commit
+from src.database.degraded import DatabaseUnavailable, db_available, is_outage
+from src.bot.utils import ALLOWED_USERS, ADMIN_USERS
+
+logger = logging.getLogger(__name__)
+
+# Authorization decisions (allowed and rejected alike) are cached per user for
+# this many seconds. Admin commands invalidate explicitly, so the TTL only
+# bounds staleness for changes made outside this process.
+AUTH_CACHE_TTL = int(os.getenv("AUTH_CACHE_TTL", "300"))
+# While the database is unreachable, decisions are re-checked this often
+AUTH_OUTAGE_RETRY = int(os.getenv("AUTH_OUTAGE_RETRY", "30"))
+
+# user_id -> (allowed, is_admin, expires_at on the monotonic clock)
+_cache = {}
+# Whether any allowlist row exists
+_populated = {'value': None, 'expires': 0.0}
+
+def _has_rows(session, now):
+    if _populated['value'] is None or now >= _populated['expires']:
+        _populated['value'] = session.query(AllowedUser.user_id).first() is not None
+        _populated['expires'] = now + AUTH_CACHE_TTL
+    return _populated['value']
+
+def _unlisted_entry(session, user_id, now):
+    """(allowed, is_admin) for a user without an allowlist row. An allowlist
+    configured in the environment restricts the bot even while the table is
+    empty (startup seeding failed or hasn't run), so that never opens it up:
+    until the table has rows the env users stand in for it, and ADMIN_USERS
+    (re-seeded on every start anyway) are always let in. Without one, an
+    empty table means unrestricted."""
+    if user_id in (ADMIN_USERS or ()):
+        return True, True
+    if ALLOWED_USERS or ADMIN_USERS:
+        return user_id in (ALLOWED_USERS or ()) and not _has_rows(session, now), False
+    return not _has_rows(session, now), False
+
+def _outage_entry(user_id, now):
+    """Decision while the database can't be reached: the stale cached entry
+    if there is one, otherwise the environment allowlist (unrestricted only
+    when none is configured and the table wasn't known to have rows)."""
+    entry = _cache.get(user_id)
+    if entry is not None:
+        return (entry[0], entry[1], now + AUTH_OUTAGE_RETRY)
+    if user_id in (ADMIN_USERS or ()):
+        return (True, True, now + AUTH_OUTAGE_RETRY)
+    if ALLOWED_USERS or ADMIN_USERS:
+        return (user_id in (ALLOWED_USERS or ()), False, now + AUTH_OUTAGE_RETRY)
+    return (not _populated['value'], False, now + AUTH_OUTAGE_RETRY)
+
+def _load(user_id):
+    now = time.monotonic()
+    try:
+        if not db_available():
+            raise DatabaseUnavailable("circuit open")
+        session = SessionLocal()
+        try:
+            row = session.get(AllowedUser, user_id)
+            if row is not None:
+                entry = (True, bool(row.is_admin), now + AUTH_CACHE_TTL)
+            else:
+                entry = (*_unlisted_entry(session, user_id, now), now + AUTH_CACHE_TTL)
+        finally:
+            session.close()
+    except Exception as e:
+        if not is_outage(e):
+            raise
+        logger.warning(f"Auth check for {user_id} without the database: {e}")
+        entry = _outage_entry(user_id, now)
+    _cache[user_id] = entry
+    return entry
+
+def is_user_allowed(user_id: int) -> bool:
+    """O(1) on the hot path: a dict hit with an unexpired entry never touches
+    the DB. Misses (and expired entries) load once and are cached — including
+    rejections, so a blocked user flooding updates costs no DB work."""
+    entry = _cache.get(user_id)
+    if entry is None or entry[2] <= time.monotonic():
+        entry = _load(user_id)
+    return entry[0]
+
+def is_admin(user_id: int) -> bool:
+    entry = _cache.get(user_id)
+    if entry is None or entry[2] <= time.monotonic():
+        entry = _load(user_id)
+    return entry[1]
+
+def invalidate_user(user_id=None):
+    """Drops cached decisions for one user (or everyone when user_id is None)."""
+    if user_id is None:
+        _cache.clear()
+    else:
+        _cache.pop(user_id, None)
+    # Adding the first / removing the last row changes who is let in unlisted
+    _populated['value'] = None
+
+@on_event('auth')
+def _evict_remote(user_id):
+    invalidate_user(user_id)
+
+def allow_user(session, user_id, added_by=None, admin=False):
+    """Adds (or promotes) a user. Does not commit; the cache is invalidated
+    once the session does."""
+    row = session.get(AllowedUser, user_id)
+    if row is None:
+        row = AllowedUser(user_id=user_id, is_admin=1 if admin else 0, added_by=added_by)
+        session.add(row)
+    elif admin:
+        row.is_admin = 1
+    after_commit(session, invalidate_user)
+
+def deny_user(session, user_id):
+    """Removes a user from the allowlist. Returns False if they weren't on it.
+    Does not commit; the cache is invalidated once the session does."""
+    row = session.get(AllowedUser, user_id)
+    if row is None:
+        return False
+    session.delete(row)
+    after_commit(session, invalidate_user)
+    return True
+
+def list_allowed_users(session):
+    return session.query(AllowedUser).order_by(AllowedUser.added_at, AllowedUser.user_id).all()
+
+def seed_allowlist(session, allowed_ids, admin_ids):
+    """Startup seeding from the environment. ALLOWED_USERS only fills an empty
+    table (so /deny sticks across restarts); ADMIN_USERS are always ensured,
+    which makes an admin lockout impossible. Returns rows added."""
+    rows = {row.user_id: row for row in session.query(AllowedUser)}
+    seeds = [(user_id, False) for user_id in (allowed_ids or ()) if not rows]
+    seeds += [(user_id, True) for user_id in (admin_ids or ())]
+    added = 0
+    for user_id, admin in seeds:
+        row = rows.get(user_id)
+        if row is None:
+            row = rows[user_id] = AllowedUser(user_id=user_id, is_admin=0)
+            session.add(row)
+            added += 1
+        if admin:
+            row.is_admin = 1
+    session.commit()
+    invalidate_user()
+    return added
@@ -1,126 +1,175 @@
-import os
-import logging
-from telegram import Update
-from telegram.ext import ApplicationBuilder, ConversationHandler, CommandHandler, MessageHandler, filters, CallbackQueryHandler, TypeHandler, ApplicationHandlerStop
-from src.bot.handlers import *
-from src.bot.constants import *
-from src.bot.handlers import shared_choice_callback
-from src.bot.utils import is_user_allowed
-
-logger = logging.getLogger(__name__)
-
-async def auth_gate(update: Update, context):
-    user = update.effective_user
-    if user is None or not is_user_allowed(user.id):
-        logger.warning(f"Unauthorized access attempt from user {user.id if user else 'unknown'}")
-        if update.message:
-            await update.message.reply_text("⛔ אין לך הרשאה להשתמש בבוט זה.")
-        elif update.callback_query:
-            await update.callback_query.answer("⛔ אין הרשאה", show_alert=True)
-        raise ApplicationHandlerStop()
-
-def create_app():
-    token = os.getenv("BOT_TOKEN")
-    if not token:
-        raise ValueError("No BOT_TOKEN in environment")
-
-    app = ApplicationBuilder().token(token).build()
-
-    # Auth gate — blocks all updates from unauthorized users (runs before all other handlers)
-    app.add_handler(TypeHandler(Update, auth_gate), group=-1)
-
-    # --- Conversation Handlers (registered first so they track state correctly) ---
-
-    # Conversation for Editing
-    edit_conv = ConversationHandler(
-        entry_points=[CallbackQueryHandler(edit_task_callback, pattern=f"^{EDIT_TASK}")],
-        states={
-            EDITING_DESCRIPTION: [MessageHandler(filters.TEXT & ~filters.COMMAND, save_edit_handler)]
-        },
-        fallbacks=[CommandHandler('cancel', cancel)]
-    )
-    app.add_handler(edit_conv)
-
-    # Quick Add Conversation
-    from src.bot.dashboard_handlers import dashboard_command, quick_add_callback
-
-    qa_conv = ConversationHandler(
-        entry_points=[CallbackQueryHandler(quick_add_callback, pattern="^quick_add_btn$")],
-        states={
-            "QUICK_ADD_WAITING": [MessageHandler(filters.TEXT & ~filters.COMMAND, quick_add_handler)]
-        },
-        fallbacks=[CommandHandler('cancel', cancel)]
-    )
-    app.add_handler(qa_conv)
-
-    # Main task creation conversation — pattern filters prevent stealing unrelated callbacks
-    conv_handler = ConversationHandler(
-        entry_points=[MessageHandler(filters.Regex(r'^(בית|עבודה)'), task_entry_handler)],
-        states={
-            DESCRIPTION: [MessageHandler(filters.TEXT & ~filters.COMMAND, description_handler)],
-            PRIORITY: [CallbackQueryHandler(priority_callback, pattern=f"^({PRIORITY_URGENT}|{PRIORITY_NORMAL}|{PRIORITY_LOW})$")],
-            SHARED_CHOICE: [CallbackQueryHandler(shared_choice_callback, pattern=f"^({SHARED_TASK_YES}|{SHARED_TASK_NO})$")],
-            SUB_CATEGORY: [CallbackQueryHandler(subcategory_callback, pattern=r"^sub_")],
-            REMINDER: [CallbackQueryHandler(reminder_callback, pattern=r"^reminder_")],
-            WAITING_CUSTOM_REMINDER: [MessageHandler(filters.TEXT & ~filters.COMMAND, custom_reminder_handler)],
-        },
-        fallbacks=[CommandHandler('cancel', cancel)]
-    )
-    app.add_handler(conv_handler)
-
-    # Categories Management
-    from src.bot.category_handlers import (
-        categories_command, add_category_callback, save_new_category,
-        delete_category_callback, cancel_category_op,
-        WAITING_NEW_CATEGORY_NAME, ADD_CAT_PREFIX, DEL_CAT_PREFIX
-    )
-
-    cat_conv = ConversationHandler(
-        entry_points=[CallbackQueryHandler(add_category_callback, pattern=f"^{ADD_CAT_PREFIX}")],
-        states={
-            WAITING_NEW_CATEGORY_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, save_new_category)]
-        },
-        fallbacks=[CommandHandler('cancel', cancel_category_op)]
-    )
-    app.add_handler(cat_conv)
-
-    # --- Command Handlers ---
-    app.add_handler(CommandHandler('list', list_tasks_command))
-    app.add_handler(CommandHandler(['start', 'dashboard'], dashboard_command))
-    app.add_handler(CommandHandler('categories', categories_command))
-
-    # --- Callback Query Handlers (standalone, pattern-matched) ---
-
-    # List actions
-    app.add_handler(CallbackQueryHandler(view_task_callback, pattern=f"^{VIEW_TASK}"))
-    app.add_handler(CallbackQueryHandler(mark_done_callback, pattern=f"^{DONE_TASK}"))
-    app.add_handler(CallbackQueryHandler(back_to_list_callback, pattern="^back_to_list$"))
-
-    # Dashboard navigation
-    app.add_handler(CallbackQueryHandler(list_tasks_command, pattern="^list_tasks_dashboard$"))
-    app.add_handler(CallbackQueryHandler(back_to_dashboard_callback, pattern="^back_to_dashboard$"))
-    app.add_handler(CallbackQueryHandler(filter_tasks_callback, pattern="^(filter_home|filter_work)$"))
-
-    # Snooze & Reminder editing
-    app.add_handler(CallbackQueryHandler(snooze_callback, pattern=f"^{SNOOZE_1H_PREFIX}"))
-    app.add_handler(CallbackQueryHandler(edit_reminder_handler, pattern=f"^{EDIT_REMINDER_PREFIX}"))
-
-    # Custom edit reminder conversation (must be before the generic update_reminder handler)
-    custom_edit_rem_conv = ConversationHandler(
-        entry_points=[CallbackQueryHandler(custom_edit_reminder_entry, pattern=rf"^{UPD_REMINDER_PREFIX}\d+_{REMINDER_CUSTOM}$")],
-        states={
-            WAITING_CUSTOM_REMINDER: [MessageHandler(filters.TEXT & ~filters.COMMAND, custom_edit_reminder_handler)]
-        },
-        fallbacks=[CommandHandler('cancel', cancel)]
-    )
-    app.add_handler(custom_edit_rem_conv)
-
-    app.add_handler(CallbackQueryHandler(update_reminder_handler, pattern=f"^{UPD_REMINDER_PREFIX}"))
-
-    # Category delete
-    app.add_handler(CallbackQueryHandler(delete_category_callback, pattern=f"^{DEL_CAT_PREFIX}"))
-
-    # Global fallback for debugging (must be last)
-    app.add_handler(MessageHandler(filters.TEXT & (~filters.COMMAND), global_fallback))
-
-    return app
+import os
+import logging
+from telegram import Update
+from telegram.ext import ApplicationBuilder, ConversationHandler, CommandHandler, MessageHandler, CallbackQueryHandler, filters, TypeHandler, ApplicationHandlerStop
+from src.bot.handlers import *
+from src.bot.constants import *
+from src.bot.handlers import shared_choice_callback
+from src.bot.callbacks import RouteHandler
+from src.bot.auth import is_user_allowed
+from src.bot.ratelimit import rate_limit_gate
+from src.bot.concurrency import PerChatUpdateProcessor
+from src.database.core import MAX_CONCURRENT_UPDATES, POOL_SIZE
+
+logger = logging.getLogger(__name__)
+
+async def auth_gate(update: Update, context):
+    user = update.effective_user
+    if user is None or not is_user_allowed(user.id):
+        logger.warning(f"Unauthorized access attempt from user {user.id if user else 'unknown'}")
+        if update.message:
+            await update.message.reply_text("⛔ אין לך הרשאה להשתמש בבוט זה.")
+        elif update.callback_query:
+            await update.callback_query.answer("⛔ אין הרשאה", show_alert=True)
+        raise ApplicationHandlerStop()
+
+async def error_handler(update, context):
+    """Logs a handler's error and rolls back the update's unit of work."""
+    from src.database.unit_of_work import fail_current
+    fail_current()
+    logger.error(f"Error while handling an update: {context.error}", exc_info=context.error)
+
+async def _start_scheduler(app):
+    """post_init: runs the scheduler on the Application's event loop, sharing its Bot."""
+    from src.scheduler.service import start_scheduler
+    start_scheduler(app.bot)
+    logger.info("Scheduler started on the bot's event loop")
+
+async def _stop_scheduler(app):
+    from src.scheduler.service import shutdown_scheduler
+    shutdown_scheduler()
+
+def create_app():
+    token = os.getenv("BOT_TOKEN")
+    if not token:
+        raise ValueError("No BOT_TOKEN in environment")
+
+    # Concurrent update handling, serialized per chat (see concurrency.py).
+    # The DB pool is sized for MAX_CONCURRENT_UPDATES (see database/core.py).
+    logger.info(f"Processing up to {MAX_CONCURRENT_UPDATES} update(s) concurrently (DB pool size {POOL_SIZE})")
+
+    app = (
+        ApplicationBuilder()
+        .token(token)
+        .concurrent_updates(PerChatUpdateProcessor(MAX_CONCURRENT_UPDATES))
+        .post_init(_start_scheduler)
+        .post_shutdown(_stop_scheduler)
+        .build()
+    )
+
+    # Auth gate — blocks all updates from unauthorized users (runs before all other handlers)
+    app.add_handler(TypeHandler(Update, auth_gate), group=-2)
+
+    # Inbound rate limiting — after auth, before any handler opens a DB session
+    # (duplicate button presses are dropped earlier, by the update processor)
+    app.add_handler(TypeHandler(Update, rate_limit_gate), group=-1)
+
+    # --- Conversation Handlers (registered first so they track state correctly) ---
+    # Buttons are routed by action (see callbacks.py): each RouteHandler only
+    # takes the actions in its table, so conversations don't steal other buttons
+
+    # Conversation for Editing
+    edit_conv = ConversationHandler(
+        entry_points=[RouteHandler({EDIT_TASK: edit_task_callback})],
+        states={
+            EDITING_DESCRIPTION: [MessageHandler(filters.TEXT & ~filters.COMMAND, save_edit_handler)]
+        },
+        fallbacks=[CommandHandler('cancel', cancel)]
+    )
+    app.add_handler(edit_conv)
+
+    # Quick Add Conversation
+    from src.bot.dashboard_handlers import dashboard_command, quick_add_callback
+
+    qa_conv = ConversationHandler(
+        entry_points=[RouteHandler({QUICK_ADD: quick_add_callback})],
+        states={
+            "QUICK_ADD_WAITING": [MessageHandler(filters.TEXT & ~filters.COMMAND, quick_add_handler)]
+        },
+        fallbacks=[CommandHandler('cancel', cancel)]
+    )
+    app.add_handler(qa_conv)
+
+    # Main task creation conversation
+    conv_handler = ConversationHandler(
+        entry_points=[MessageHandler(filters.Regex(r'^(בית|עבודה)'), task_entry_handler)],
+        states={
+            DESCRIPTION: [MessageHandler(filters.TEXT & ~filters.COMMAND, description_handler)],
+            PRIORITY: [RouteHandler({PICK_PRIORITY: priority_callback})],
+            SHARED_CHOICE: [RouteHandler({PICK_SHARED: shared_choice_callback})],
+            SUB_CATEGORY: [RouteHandler({PICK_SUB_CATEGORY: subcategory_callback})],
+            REMINDER: [RouteHandler({PICK_REMINDER: reminder_callback})],
+            WAITING_CUSTOM_REMINDER: [MessageHandler(filters.TEXT & ~filters.COMMAND, custom_reminder_handler)],
+        },
+        fallbacks=[CommandHandler('cancel', cancel)]
+    )
+    app.add_handler(conv_handler)
+
+    # Categories Management
+    from src.bot.category_handlers import (
+        categories_command, add_category_callback, save_new_category,
+        delete_category_callback, cancel_category_op,
+        WAITING_NEW_CATEGORY_NAME
+    )
+
+    cat_conv = ConversationHandler(
+        entry_points=[RouteHandler({ADD_CATEGORY: add_category_callback})],
+        states={
+            WAITING_NEW_CATEGORY_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, save_new_category)]
+        },
+        fallbacks=[CommandHandler('cancel', cancel_category_op)]
+    )
+    app.add_handler(cat_conv)
+
+    # Custom edit reminder conversation
+    custom_edit_rem_conv = ConversationHandler(
+        entry_points=[RouteHandler({UPDATE_REMINDER_CUSTOM: custom_edit_reminder_entry})],
+        states={
+            WAITING_CUSTOM_REMINDER: [MessageHandler(filters.TEXT & ~filters.COMMAND, custom_edit_reminder_handler)]
+        },
+        fallbacks=[CommandHandler('cancel', cancel)]
+    )
+    app.add_handler(custom_edit_rem_conv)
+
+    # --- Callback Queries (standalone) — one router, one lookup per button ---
+    app.add_handler(RouteHandler({
+        # List actions
+        VIEW_TASK: view_task_callback,
+        DONE_TASK: mark_done_callback,
+        BACK_TO_LIST: back_to_list_callback,
+        # Dashboard navigation
+        LIST_TASKS: list_tasks_command,
+        BACK_TO_DASHBOARD: back_to_dashboard_callback,
+        FILTER_TASKS: filter_tasks_callback,
+        # Snooze & Reminder editing
+        SNOOZE_1H: snooze_callback,
+        EDIT_REMINDER: edit_reminder_handler,
+        UPDATE_REMINDER: update_reminder_handler,
+        # Category delete
+        DELETE_CATEGORY: delete_category_callback,
+    }))
+
+    # --- Command Handlers ---
+    app.add_handler(CommandHandler('list', list_tasks_command))
+    app.add_handler(CommandHandler(['start', 'dashboard'], dashboard_command))
+    app.add_handler(CommandHandler('categories', categories_command))
+    app.add_handler(CommandHandler('stats', stats_command))
+    app.add_handler(CommandHandler('briefing', briefing_command))
+
+    # Administration: allowlist, households and outbox (admins only)
+    from src.bot.admin_handlers import users_command, allow_command, deny_command, queue_command, household_command
+    app.add_handler(CommandHandler('users', users_command))
+    app.add_handler(CommandHandler('allow', allow_command))
+    app.add_handler(CommandHandler('deny', deny_command))
+    app.add_handler(CommandHandler('queue', queue_command))
+    app.add_handler(CommandHandler('household', household_command))
+
+    # Global fallback for debugging (must be last)
+    app.add_handler(MessageHandler(filters.TEXT & (~filters.COMMAND), global_fallback))
+    # Buttons nothing above took (undecodable or out-of-state data)
+    app.add_handler(CallbackQueryHandler(stale_button_callback))
+
+    # Runs inside the failed update (same unit of work), before it commits
+    app.add_error_handler(error_handler)
+
+    return app
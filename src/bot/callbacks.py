@@ -0,0 +1,147 @@
+import logging
+from functools import lru_cache
+from telegram import Update
+from telegram.ext import BaseHandler
+from src.bot.constants import *
+
+logger = logging.getLogger(__name__)
+
+# Button callback data is "<action>[:<arg>...]": a short action code (see
+# constants.py) and its arguments, e.g. "v:42" to view task 42. Each action's
+# argument types are declared below; encode() builds the data, decode()
+# parses and type-checks it once, and RouteHandler dispatches on the action
+# with a dict lookup, so the cost of routing a button press doesn't grow with
+# the number of actions. Telegram caps callback data at 64 bytes.
+
+def _choice(*values):
+    def parse(value):
+        if value not in values:
+            raise ValueError(f"unexpected value {value!r}")
+        return value
+    return parse
+
+def _category_ref(value):
+    # A category id; legacy buttons (sub_<name>) carry the category name
+    if not value:
+        return None
+    return int(value) if value.isdigit() else value
+
+def _flag(value):
+    return _choice('0', '1')(value) == '1'
+
+_PRIORITIES = (PRIORITY_URGENT, PRIORITY_NORMAL, PRIORITY_LOW)
+_REMINDERS = (REMINDER_1H, REMINDER_TONIGHT, REMINDER_TOMORROW, REMINDER_CUSTOM, REMINDER_3D, REMINDER_1W, REMINDER_NONE)
+_REMINDER = _choice(*_REMINDERS)
+_CATEGORY = _choice(CATEGORY_HOME, CATEGORY_WORK)
+
+# action -> argument parsers (each raises ValueError on bad input)
+ARGUMENTS = {
+    VIEW_TASK: (int,),
+    DONE_TASK: (int,),
+    EDIT_TASK: (int,),
+    SNOOZE_1H: (int,),
+    EDIT_REMINDER: (int,),
+    UPDATE_REMINDER: (int, _REMINDER),
+    UPDATE_REMINDER_CUSTOM: (int,),
+    LIST_TASKS: (),
+    BACK_TO_LIST: (),
+    BACK_TO_DASHBOARD: (),
+    FILTER_TASKS: (_CATEGORY,),
+    QUICK_ADD: (),
+    PICK_PRIORITY: (_choice(*_PRIORITIES),),
+    PICK_SHARED: (_flag,),
+    PICK_SUB_CATEGORY: (_category_ref,),  # empty: no category ('כללי')
+    PICK_REMINDER: (_REMINDER,),
+    ADD_CATEGORY: (_CATEGORY,),
+    DELETE_CATEGORY: (int,),
+    NOOP: (),
+}
+
+def encode(action, *args):
+    """Callback data for `action` with `args` (None -> empty, bools -> 0/1)."""
+    parts = [action]
+    for arg in args:
+        parts.append("" if arg is None else str(int(arg)) if isinstance(arg, bool) else str(arg))
+    return ":".join(parts)
+
+# Data of buttons sent before the compact encoding, still on old messages
+_LEGACY_EXACT = {
+    'back_to_list': (BACK_TO_LIST,),
+    'back_to_dashboard': (BACK_TO_DASHBOARD,),
+    'list_tasks_dashboard': (LIST_TASKS,),
+    'filter_home': (FILTER_TASKS, CATEGORY_HOME),
+    'filter_work': (FILTER_TASKS, CATEGORY_WORK),
+    'quick_add_btn': (QUICK_ADD,),
+    'shared_yes': (PICK_SHARED, '1'),
+    'shared_no': (PICK_SHARED, '0'),
+    'sub_none': (PICK_SUB_CATEGORY, ''),
+    'ignore': (NOOP,),
+    **{p: (PICK_PRIORITY, p) for p in _PRIORITIES},
+    **{r: (PICK_REMINDER, r) for r in _REMINDERS},
+}
+_LEGACY_PREFIXES = (
+    ('view_task_', VIEW_TASK), ('done_task_', DONE_TASK), ('edit_task_', EDIT_TASK),
+    ('snooze_1h_', SNOOZE_1H), ('edit_rem_', EDIT_REMINDER), ('upd_rem_', UPDATE_REMINDER),
+    ('sub_', PICK_SUB_CATEGORY), ('add_cat_', ADD_CATEGORY), ('del_cat_', DELETE_CATEGORY),
+)
+
+def _split_legacy(data):
+    if data in _LEGACY_EXACT:
+        return _LEGACY_EXACT[data]
+    for prefix, action in _LEGACY_PREFIXES:
+        if data.startswith(prefix):
+            rest = data[len(prefix):]
+            if action == UPDATE_REMINDER:
+                # upd_rem_<task_id>_<reminder choice>
+                task_id, _, choice = rest.partition('_')
+                return (UPDATE_REMINDER_CUSTOM, task_id) if choice == REMINDER_CUSTOM else (action, task_id, choice)
+            return action, rest
+    return None
+
+@lru_cache(maxsize=1024)
+def decode(data):
+    """(action, args) for callback data, args converted to their declared
+    types; None for data that isn't a valid action. Memoized: the same
+    button is checked by several handlers for one update."""
+    if not isinstance(data, str):
+        return None
+    parts = data.split(":")
+    if parts[0] not in ARGUMENTS:
+        parts = _split_legacy(data)
+        if parts is None:
+            return None
+    action, raw = parts[0], parts[1:]
+    parsers = ARGUMENTS[action]
+    if len(raw) != len(parsers):
+        return None
+    try:
+        return action, tuple(parse(value) for parse, value in zip(parsers, raw))
+    except ValueError:
+        logger.warning(f"Malformed callback data: {data!r}")
+        return None
+
+class RouteHandler(BaseHandler):
+    """Handles callback queries for the actions in `routes` ({action:
+    callback}). The callback gets the decoded arguments as context.args.
+    Works as a ConversationHandler entry point or state handler too; its
+    return value is the conversation's next state."""
+    __slots__ = ("routes",)
+
+    def __init__(self, routes, block=True):
+        super().__init__(self._route, block=block)
+        self.routes = routes
+
+    def check_update(self, update):
+        if not isinstance(update, Update) or update.callback_query is None:
+            return None
+        decoded = decode(update.callback_query.data)
+        if decoded is None or decoded[0] not in self.routes:
+            return None
+        return decoded
+
+    def collect_additional_context(self, context, update, application, check_result):
+        context.args = list(check_result[1])
+
+    async def _route(self, update, context):
+        action, _ = decode(update.callback_query.data)  # memoized by check_update
+        return await self.routes[action](update, context)
@@ -0,0 +1,93 @@
+import asyncio
+import logging
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+from src.database.unit_of_work import unit_of_work
+from src.bot.ratelimit import claim_callback, release_callback
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on updates accepted into processing at once (running + waiting
+# for their chat). Only a cap on memory; real parallelism is handler_slots.
+_MAX_QUEUED_UPDATES = 256
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """Processes updates from different chats in parallel while keeping each
+    chat's updates strictly in arrival order.
+
+    ConversationHandler state is per (chat, user), so serializing per chat
+    preserves its one-at-a-time assumption. Updates waiting behind an earlier
+    update of the same chat don't hold one of the `handler_slots`, so a single
+    busy chat can't starve the others. A button press identical to one still
+    queued or running is answered and dropped before it waits for its chat.
+
+    Each update runs as one unit of work (see database/unit_of_work.py): all
+    its handlers share one session. Handlers commit their writes before they
+    reply; what is left is committed once they are done.
+    """
+
+    __slots__ = ("_handler_slots", "_chat_locks", "_handler_limit")
+
+    def __init__(self, handler_slots: int):
+        super().__init__(max(_MAX_QUEUED_UPDATES, handler_slots))
+        self._handler_limit = handler_slots
+        self._handler_slots = asyncio.BoundedSemaphore(handler_slots)
+        # chat_id -> [lock, number of updates holding or waiting for it]
+        self._chat_locks = {}
+
+    @property
+    def handler_limit(self) -> int:
+        return self._handler_limit
+
+    async def do_process_update(self, update, coroutine) -> None:
+        if not claim_callback(update):
+            coroutine.close()  # never awaited
+            try:
+                await update.callback_query.answer()
+            except Exception as e:
+                logger.debug(f"Could not answer a duplicate callback: {e}")
+            return
+        try:
+            await self._process(update, coroutine)
+        finally:
+            release_callback(update)
+
+    async def _process(self, update, coroutine):
+        chat = update.effective_chat if isinstance(update, Update) else None
+        if chat is None:
+            async with self._handler_slots:
+                await self._run(None, coroutine)
+            return
+
+        entry = self._chat_locks.get(chat.id)
+        if entry is None:
+            entry = self._chat_locks[chat.id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            # asyncio.Lock wakes waiters FIFO, and updates reach this point in
+            # the order the fetcher created their tasks
+            async with entry[0]:
+                async with self._handler_slots:
+                    await self._run(chat.id, coroutine)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._chat_locks[chat.id]
+
+    @staticmethod
+    async def _run(chat_id, coroutine):
+        # Handler errors are caught by the Application (and roll the unit back
+        # through the error handler); what gets here is the final commit
+        # failing. Handlers commit their writes before confirming them, so a
+        # write still pending here was never confirmed to the user.
+        try:
+            with unit_of_work(chat_id):
+                await coroutine
+        except Exception as e:
+            logger.error(f"Update for chat {chat_id} left writes that failed to commit: {e}", exc_info=True)
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
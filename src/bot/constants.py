@@ -1,54 +1,69 @@
-# States
-(
-    DESCRIPTION,
-    PRIORITY,
-    SUB_CATEGORY,
-    REMINDER
-) = range(4)
-
-# Callback Data Prefixes and Values
-PRIORITY_URGENT = 'urgent'
-PRIORITY_NORMAL = 'normal'
-PRIORITY_LOW = 'low'
-
-REMINDER_1H = 'reminder_1h'
-REMINDER_TONIGHT = 'reminder_tonight'
-REMINDER_TOMORROW = 'reminder_tomorrow'
-REMINDER_CUSTOM = 'reminder_custom'
-REMINDER_3D = 'reminder_3d'
-REMINDER_1W = 'reminder_1w'
-REMINDER_NONE = 'reminder_none'
-
-SNOOZE_1H_PREFIX = 'snooze_1h_'
-
-CATEGORY_HOME = 'home'
-CATEGORY_WORK = 'work'
-
-# Valid Callbacks Prefixes
-VIEW_TASK = 'view_task_'
-DONE_TASK = 'done_task_'
-EDIT_TASK = 'edit_task_'
-EDIT_REMINDER_PREFIX = 'edit_rem_'
-UPD_REMINDER_PREFIX = 'upd_rem_'
-
-# Recurrence
-REC_DAILY = 'daily'
-REC_WEEKLY = 'weekly'
-REC_MONTHLY = 'monthly'
-REC_NONE = 'rec_none'
-
-# Recurrence Callbacks
-SET_REC_PREFIX = 'set_rec_'
-UPD_REC_PREFIX = 'upd_rec_'
-
-# Edit State
-EDITING_DESCRIPTION = 10
-
-# Custom Reminder State
-WAITING_CUSTOM_REMINDER = 11
-
-# Shared Task State & Callbacks
-SHARED_CHOICE = 12
-SHARED_TASK_YES = 'shared_yes'
-SHARED_TASK_NO = 'shared_no'
-SHARED_ICON = '👥'
+# States
+(
+    DESCRIPTION,
+    PRIORITY,
+    SUB_CATEGORY,
+    REMINDER
+) = range(4)
+
+# Callback Data Prefixes and Values
+PRIORITY_URGENT = 'urgent'
+PRIORITY_NORMAL = 'normal'
+PRIORITY_LOW = 'low'
+
+REMINDER_1H = 'reminder_1h'
+REMINDER_TONIGHT = 'reminder_tonight'
+REMINDER_TOMORROW = 'reminder_tomorrow'
+REMINDER_CUSTOM = 'reminder_custom'
+REMINDER_3D = 'reminder_3d'
+REMINDER_1W = 'reminder_1w'
+REMINDER_NONE = 'reminder_none'
+
+CATEGORY_HOME = 'home'
+CATEGORY_WORK = 'work'
+
+# Callback Actions — button data is "<action>[:<arg>...]", built with
+# callbacks.encode() (argument types are declared in src/bot/callbacks.py)
+VIEW_TASK = 'v'
+DONE_TASK = 'd'
+EDIT_TASK = 'e'
+SNOOZE_1H = 'z'
+EDIT_REMINDER = 'r'
+UPDATE_REMINDER = 'u'
+UPDATE_REMINDER_CUSTOM = 'uc'
+LIST_TASKS = 'l'
+BACK_TO_LIST = 'bl'
+BACK_TO_DASHBOARD = 'bd'
+FILTER_TASKS = 'f'
+QUICK_ADD = 'qa'
+PICK_PRIORITY = 'p'
+PICK_SHARED = 's'
+PICK_SUB_CATEGORY = 'c'
+PICK_REMINDER = 'm'
+ADD_CATEGORY = 'ca'
+DELETE_CATEGORY = 'cd'
+NOOP = 'n'
+
+# Recurrence
+REC_DAILY = 'daily'
+REC_WEEKLY = 'weekly'
+REC_MONTHLY = 'monthly'
+REC_NONE = 'rec_none'
+
+# Recurrence Callbacks
+SET_REC_PREFIX = 'set_rec_'
+UPD_REC_PREFIX = 'upd_rec_'
+
+# Edit State
+EDITING_DESCRIPTION = 10
+
+# Custom Reminder State
+WAITING_CUSTOM_REMINDER = 11
+
+# Shared Task State
+SHARED_CHOICE = 12
+SHARED_ICON = '👥'
+
+# Degraded Mode (database unreachable)
+OFFLINE_MESSAGE = "⚠️ אין כרגע חיבור למסד הנתונים. נסו שוב בעוד כמה דקות."
+OFFLINE_QUEUED_NOTE = "📡 אין חיבור — השינוי יסונכרן כשהחיבור יחזור."
@@ -1,106 +1,110 @@
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import ContextTypes
-from src.database.core import SessionLocal
-from src.database.models import Task
-from src.bot.constants import CATEGORY_HOME, CATEGORY_WORK, PRIORITY_URGENT
-from datetime import datetime, timedelta
-from src.bot.utils import get_now, get_accessible_filter
-
-async def dashboard_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    session = SessionLocal()
-    try:
-        chat_id = update.effective_chat.id
-        now = get_now()
-
-        # 1. Stats
-        active_tasks = session.query(Task).filter(
-            get_accessible_filter(chat_id),
-            Task.status == 'pending'
-        ).all()
-
-        home_personal = sum(1 for t in active_tasks if t.parent_category == CATEGORY_HOME and not t.is_shared)
-        home_shared = sum(1 for t in active_tasks if t.parent_category == CATEGORY_HOME and t.is_shared)
-        work_count = sum(1 for t in active_tasks if t.parent_category == CATEGORY_WORK)
-        total = len(active_tasks)
-
-        urgent_personal = sum(1 for t in active_tasks if t.priority == PRIORITY_URGENT and not t.is_shared)
-        urgent_shared = sum(1 for t in active_tasks if t.priority == PRIORITY_URGENT and t.is_shared)
-
-        # 2. Upcoming Reminders (Today)
-        end_of_day = now.replace(hour=23, minute=59, second=59)
-        now_naive = now.replace(tzinfo=None)
-        end_of_day_naive = end_of_day.replace(tzinfo=None)
-
-        reminders = session.query(Task).filter(
-            get_accessible_filter(chat_id),
-            Task.status == 'pending',
-            Task.reminder_time >= now_naive,
-            Task.reminder_time <= end_of_day_naive
-        ).order_by(Task.reminder_time).all()
-
-        # 3. Urgent Tasks (Top 3)
-        urgent_tasks = [t for t in active_tasks if t.priority == 'urgent']
-        urgent_tasks.sort(key=lambda t: t.created_at or now)
-        top_urgent = urgent_tasks[:3]
-
-        # Build Message
-        greeting_time = "בוקר" if 5 <= now.hour < 12 else "צהריים" if 12 <= now.hour < 18 else "ערב"
-        date_str = now.strftime("%d/%m")
-
-        msg = f"👋 <b>{greeting_time} טוב!</b>\n"
-        msg += f"📅 {date_str}\n\n"
-
-        # KPI row
-        msg += f"🏠 בית: <b>{home_personal}</b>"
-        msg += f"  ·  👥 משותף: <b>{home_shared}</b>"
-        msg += f"  ·  💼 עבודה: <b>{work_count}</b>\n"
-        msg += f"סה״כ: <b>{total}</b> משימות פתוחות\n"
-
-        if urgent_personal or urgent_shared:
-            parts = []
-            if urgent_personal:
-                parts.append(f"{urgent_personal} אישי")
-            if urgent_shared:
-                parts.append(f"{urgent_shared} משותף")
-            msg += f"🔴 דחוף: {' · '.join(parts)}\n"
-
-        if top_urgent:
-            msg += "\n🔥 <b>דחוף:</b>\n"
-            for t in top_urgent:
-                shared = " 👥" if t.is_shared else ""
-                cat = "🏠" if t.parent_category == CATEGORY_HOME else "💼"
-                msg += f"  {cat} {t.text}{shared}\n"
-
-        if reminders:
-            msg += "\n🔔 <b>תזכורות:</b>\n"
-            for t in reminders:
-                t_str = t.reminder_time.strftime("%H:%M")
-                shared = " 👥" if t.is_shared else ""
-                msg += f"  {t_str} — {t.text}{shared}\n"
-
-        # Build Keyboard
-        keyboard = [
-            [
-                InlineKeyboardButton(f"🏠 בית ({home_personal + home_shared})", callback_data="filter_home"),
-                InlineKeyboardButton(f"💼 עבודה ({work_count})", callback_data="filter_work")
-            ]
-        ]
-
-        markup = InlineKeyboardMarkup(keyboard)
-
-        if update.message:
-            await update.message.reply_text(msg, reply_markup=markup, parse_mode='HTML')
-        elif update.callback_query:
-            await update.callback_query.edit_message_text(msg, reply_markup=markup, parse_mode='HTML')
-
-    finally:
-        session.close()
-
-async def quick_add_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    query = update.callback_query
-    await query.answer()
-    await query.edit_message_text(
-        "⚡ **הוספה מהירה**\nכתוב את המשימה שלך (היא תתווסף ל'כללי' בעדיפות רגילה):",
-        parse_mode='Markdown'
-    )
-    return "QUICK_ADD_WAITING" # Needs state definition
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.ext import ContextTypes
+from src.database.core import ensure_user_preferences
+from src.database.degraded import DatabaseUnavailable, best_effort, stale_banner
+from src.database.unit_of_work import current_session, commit_current
+from src.bot.constants import CATEGORY_HOME, CATEGORY_WORK, PRIORITY_URGENT, OFFLINE_MESSAGE, FILTER_TASKS
+from src.bot.callbacks import encode
+from datetime import datetime, timedelta
+from src.bot.utils import get_now, get_pending_tasks
+from src.bot.render import edit_view, send_view
+
+def render_dashboard(session, chat_id):
+    """Builds the dashboard for `chat_id`. Returns (html_text, reply_markup)."""
+    now = get_now()
+
+    # 1. Stats
+    active_tasks = get_pending_tasks(session, chat_id)
+
+    home_personal = sum(1 for t in active_tasks if t.parent_category == CATEGORY_HOME and not t.is_shared)
+    home_shared = sum(1 for t in active_tasks if t.parent_category == CATEGORY_HOME and t.is_shared)
+    work_count = sum(1 for t in active_tasks if t.parent_category == CATEGORY_WORK)
+    total = len(active_tasks)
+
+    urgent_personal = sum(1 for t in active_tasks if t.priority == PRIORITY_URGENT and not t.is_shared)
+    urgent_shared = sum(1 for t in active_tasks if t.priority == PRIORITY_URGENT and t.is_shared)
+
+    # 2. Upcoming Reminders (Today)
+    end_of_day = now.replace(hour=23, minute=59, second=59)
+    now_naive = now.replace(tzinfo=None)
+    end_of_day_naive = end_of_day.replace(tzinfo=None)
+
+    reminders = sorted(
+        (t for t in active_tasks if t.reminder_time and now_naive <= t.reminder_time <= end_of_day_naive),
+        key=lambda t: t.reminder_time
+    )
+
+    # 3. Urgent Tasks (Top 3)
+    urgent_tasks = [t for t in active_tasks if t.priority == 'urgent']
+    urgent_tasks.sort(key=lambda t: t.created_at or now)
+    top_urgent = urgent_tasks[:3]
+
+    # Build Message
+    greeting_time = "בוקר" if 5 <= now.hour < 12 else "צהריים" if 12 <= now.hour < 18 else "ערב"
+    date_str = now.strftime("%d/%m")
+
+    msg = stale_banner(active_tasks)
+    msg += f"👋 <b>{greeting_time} טוב!</b>\n"
+    msg += f"📅 {date_str}\n\n"
+
+    # KPI row
+    msg += f"🏠 בית: <b>{home_personal}</b>"
+    msg += f"  ·  👥 משותף: <b>{home_shared}</b>"
+    msg += f"  ·  💼 עבודה: <b>{work_count}</b>\n"
+    msg += f"סה״כ: <b>{total}</b> משימות פתוחות\n"
+
+    if urgent_personal or urgent_shared:
+        parts = []
+        if urgent_personal:
+            parts.append(f"{urgent_personal} אישי")
+        if urgent_shared:
+            parts.append(f"{urgent_shared} משותף")
+        msg += f"🔴 דחוף: {' · '.join(parts)}\n"
+
+    if top_urgent:
+        msg += "\n🔥 <b>דחוף:</b>\n"
+        for t in top_urgent:
+            shared = " 👥" if t.is_shared else ""
+            cat = "🏠" if t.parent_category == CATEGORY_HOME else "💼"
+            msg += f"  {cat} {t.text}{shared}\n"
+
+    if reminders:
+        msg += "\n🔔 <b>תזכורות:</b>\n"
+        for t in reminders:
+            t_str = t.reminder_time.strftime("%H:%M")
+            shared = " 👥" if t.is_shared else ""
+            msg += f"  {t_str} — {t.text}{shared}\n"
+
+    # Build Keyboard
+    keyboard = [
+        [
+            InlineKeyboardButton(f"🏠 בית ({home_personal + home_shared})", callback_data=encode(FILTER_TASKS, CATEGORY_HOME)),
+            InlineKeyboardButton(f"💼 עבודה ({work_count})", callback_data=encode(FILTER_TASKS, CATEGORY_WORK))
+        ]
+    ]
+
+    return msg, InlineKeyboardMarkup(keyboard)
+
+async def dashboard_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    session = current_session()
+    try:
+        chat_id = update.effective_chat.id
+        best_effort(ensure_user_preferences, session, chat_id)
+        best_effort(commit_current)  # a first visit's preferences row
+        msg, markup = render_dashboard(session, chat_id)
+    except DatabaseUnavailable:
+        msg, markup = OFFLINE_MESSAGE, None
+
+    if update.message:
+        await send_view(update.message, msg, reply_markup=markup, parse_mode='HTML')
+    elif update.callback_query:
+        await edit_view(update.callback_query, msg, reply_markup=markup, parse_mode='HTML')
+
+async def quick_add_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    await edit_view(query,
+        "⚡ **הוספה מהירה**\nכתוב את המשימה שלך (היא תתווסף ל'כללי' בעדיפות רגילה):",
+        parse_mode='Markdown'
+    )
+    return "QUICK_ADD_WAITING" # Needs state definition
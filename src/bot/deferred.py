@@ -0,0 +1,54 @@
+import logging
+from telegram.error import BadRequest
+from telegram.ext import ContextTypes
+from src.database.routing import ReadSession
+from src.bot.dashboard_handlers import render_dashboard
+from src.bot.render import edit_view_by_id
+
+logger = logging.getLogger(__name__)
+
+# Views a deferred follow-up can re-render into an existing message.
+# Each renderer takes (session, chat_id) and returns (html_text, reply_markup).
+VIEWS = {
+    'dashboard': render_dashboard,
+}
+
+def _job_name(chat_id, message_id):
+    return f"refresh_{chat_id}_{message_id}"
+
+def schedule_refresh(context: ContextTypes.DEFAULT_TYPE, view, chat_id, message_id, delay):
+    """Re-renders `view` into message (chat_id, message_id) after `delay` seconds.
+
+    Runs on the job queue, so the calling handler returns right away and
+    releases its DB session. A newer refresh for the same message replaces
+    a pending one — only the last request renders.
+    """
+    if view not in VIEWS:
+        raise ValueError(f"Unknown view {view!r}")
+    name = _job_name(chat_id, message_id)
+    for job in context.job_queue.get_jobs_by_name(name):
+        job.schedule_removal()
+    context.job_queue.run_once(
+        _refresh_job, delay, name=name, chat_id=chat_id,
+        data={'view': view, 'message_id': message_id}
+    )
+
+async def _refresh_job(context: ContextTypes.DEFAULT_TYPE):
+    job = context.job
+    chat_id, view, message_id = job.chat_id, job.data['view'], job.data['message_id']
+
+    session = ReadSession(chat_id)
+    try:
+        text, markup = VIEWS[view](session, chat_id)
+    except Exception as e:
+        logger.error(f"Deferred {view} render failed for chat {chat_id}: {e}", exc_info=True)
+        return
+    finally:
+        session.close()
+
+    try:
+        await edit_view_by_id(context.bot, chat_id, message_id, text,
+                              reply_markup=markup, parse_mode='HTML')
+    except BadRequest as e:
+        # Message deleted, or the user already navigated it elsewhere
+        logger.info(f"Deferred {view} refresh skipped for message {chat_id}/{message_id}: {e}")
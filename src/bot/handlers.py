@@ -1,811 +1,982 @@
-import re
-import random
-import asyncio
-import logging
-from datetime import datetime, timedelta
-from src.bot.utils import get_now, to_naive_israel, ISRAEL_TZ, get_accessible_filter, get_accessible_task
-from telegram import Update
-from telegram.ext import ContextTypes, ConversationHandler
-from src.bot.constants import *
-from src.bot.keyboards import get_priority_keyboard, get_subcategory_keyboard, get_reminder_keyboard, get_shared_choice_keyboard
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup
-from src.database.core import SessionLocal
-from src.database.models import Task, SubCategory
-from src.scheduler.service import add_reminder_job
-
-logger = logging.getLogger(__name__)
-
-# Sarcastic feedback phrases (plural Hebrew) by completion-time bucket
-_DONE_PHRASES = {
-    'obsessive': [  # < 5 hours
-        "פחות מ-5 שעות? ישבתם וחיכיתם ליד הטלפון שזה יקרה? לכו לנשום אוויר 🧘‍♂️💨",
-        "מהירים כמו ברק! חשבתי שזה באג, אף אחד לא מסיים כל כך מהר 😱⚡",
-        "רגע, סיימתם את זה ככה מהר? בטוח שעשיתם את זה כמו שצריך? 🤔🏃",
-        "אוקיי, הבנו, אתם יעילים. אפשר גם קצת להירגע 😤✨",
-    ],
-    'normal': [  # 5 – 48 hours
-        "קצב של צב עם אישיות, אבל העיקר שזה נעשה 🐌😏",
-        "סבבה, לקח לכם קצת זמן אבל עדיין בטווח הנורמלי. כל הכבוד 👏🎭",
-        "יום-יומיים? קלאסי שלכם. לא מהר מדי, לא לאט מדי 📊😌",
-        "הו, נזכרתם! חשבתי שכבר שכחתם. נחמד שהפתעתם 🎉😏",
-    ],
-    'procrastinator': [  # 2 – 7 days
-        "אני בהלם, באמת נזכרתם בזה? הופתעתי לטובה מהתפקוד המאוחר 🧐👏",
-        "שבוע כמעט עבר ורק עכשיו? טוב, עדיף מאוחר מאשר... רגע, זה כבר מאוחר 😅⏰",
-        "אחרי כמה ימים של התלבטות סוף סוף עשיתם את זה. גיבורים 🦸‍♂️🐢",
-        "חשבתי שהמשימה הזו כבר פרשה לגמלאות, אבל הנה, הפתעה! 🎊😲",
-    ],
-    'archeologist': [  # > 7 days
-        "נס חנוכה! אחרי יותר משבוע נזכרתם בזה? כמעט העברתי את זה לירושה 👵👴",
-        "חפירה ארכיאולוגית! מצאתם משימה עתיקה ואפילו סיימתם אותה 🏛️🪨",
-        "חשבתי שהמשימה הזו כבר קיבלה אזרחות. שבוע+! שיא חדש 🏆🗓️",
-        "המשימה הזו כבר הספיקה ללמוד שפה חדשה. אתם? רק סיימתם אותה 📚🌍",
-    ],
-}
-
-def _get_done_phrase(created_at) -> str:
-    """Pick a random sarcastic phrase based on how long the task was open."""
-    if not created_at:
-        return random.choice(_DONE_PHRASES['normal'])
-    now_naive = get_now().replace(tzinfo=None)
-    elapsed = now_naive - created_at
-    hours = elapsed.total_seconds() / 3600
-    if hours < 5:
-        bucket = 'obsessive'
-    elif hours < 48:
-        bucket = 'normal'
-    elif hours < 168:  # 7 days
-        bucket = 'procrastinator'
-    else:
-        bucket = 'archeologist'
-    return random.choice(_DONE_PHRASES[bucket])
-
-def parse_custom_time(text: str):
-    """Parse HH:MM or DD/MM HH:MM into an aware Israel datetime.
-    Returns (datetime, error_message). On success error_message is None."""
-    text = text.strip()
-    now = get_now()
-
-    # Try DD/MM HH:MM
-    m = re.match(r'^(\d{1,2})/(\d{1,2})\s+(\d{1,2}):(\d{2})$', text)
-    if m:
-        day, month, hour, minute = int(m.group(1)), int(m.group(2)), int(m.group(3)), int(m.group(4))
-        try:
-            reminder = now.replace(month=month, day=day, hour=hour, minute=minute, second=0, microsecond=0)
-        except ValueError:
-            return None, "תאריך לא תקין. נסה שוב בפורמט DD/MM HH:MM"
-        if reminder <= now:
-            return None, "הזמן שהוזן כבר עבר. הזן זמן עתידי."
-        return reminder, None
-
-    # Try HH:MM
-    m = re.match(r'^(\d{1,2}):(\d{2})$', text)
-    if m:
-        hour, minute = int(m.group(1)), int(m.group(2))
-        if hour > 23 or minute > 59:
-            return None, "שעה לא תקינה. נסה שוב בפורמט HH:MM"
-        reminder = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
-        if reminder <= now:
-            reminder += timedelta(days=1)
-        return reminder, None
-
-    return None, "פורמט לא תקין. שלח HH:MM או DD/MM HH:MM"
-
-async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text("אנא התחל משימה עם 'בית' או 'עבודה'.")
-    return ConversationHandler.END
-
-async def task_entry_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    text = update.message.text
-    if text.startswith('בית'):
-        context.user_data['parent'] = CATEGORY_HOME
-        rest = text[3:].strip()
-    elif text.startswith('עבודה'):
-        context.user_data['parent'] = CATEGORY_WORK
-        rest = text[5:].strip()
-    else:
-        return ConversationHandler.END
-
-    if not rest:
-        await update.message.reply_text("מה המשימה?")
-        return DESCRIPTION
-    
-    context.user_data['description'] = rest
-    await update.message.reply_text(
-        f"משימה: {rest}\nבחר עדיפות:",
-        reply_markup=get_priority_keyboard()
-    )
-    return PRIORITY
-
-async def description_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    context.user_data['description'] = update.message.text
-    await update.message.reply_text(
-        "בחר עדיפות:",
-        reply_markup=get_priority_keyboard()
-    )
-    return PRIORITY
-
-async def priority_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    query = update.callback_query
-    await query.answer()
-
-    priority = query.data
-    context.user_data['priority'] = priority
-
-    parent = context.user_data.get('parent')
-
-    # Home tasks: ask shared/personal choice first
-    if parent == CATEGORY_HOME:
-        await query.edit_message_text(
-            text="עדיפות נבחרה. משימה אישית או משותפת?",
-            reply_markup=get_shared_choice_keyboard()
-        )
-        return SHARED_CHOICE
-
-    # Work tasks: skip shared choice, always personal
-    context.user_data['is_shared'] = False
-    try:
-        keyboard = get_subcategory_keyboard(parent, chat_id=update.effective_chat.id)
-    except Exception as e:
-        logger.error(f"Error building subcategory keyboard: {e}", exc_info=True)
-        context.user_data.clear()
-        await query.edit_message_text("❌ בעיית חיבור למסד הנתונים. נסה שוב בעוד כמה שניות.")
-        return ConversationHandler.END
-
-    await query.edit_message_text(
-        text="עדיפות נבחרה. קטגוריה:",
-        reply_markup=keyboard
-    )
-    return SUB_CATEGORY
-
-async def shared_choice_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    query = update.callback_query
-    await query.answer()
-
-    is_shared = query.data == SHARED_TASK_YES
-    context.user_data['is_shared'] = is_shared
-
-    parent = context.user_data.get('parent')
-    try:
-        keyboard = get_subcategory_keyboard(parent, chat_id=update.effective_chat.id, is_shared=is_shared)
-    except Exception as e:
-        logger.error(f"Error building subcategory keyboard: {e}", exc_info=True)
-        context.user_data.clear()
-        await query.edit_message_text("❌ בעיית חיבור למסד הנתונים. נסה שוב בעוד כמה שניות.")
-        return ConversationHandler.END
-
-    label = "👥 משותף" if is_shared else "👤 אישי"
-    await query.edit_message_text(
-        text=f"{label} — בחר קטגוריה:",
-        reply_markup=keyboard
-    )
-    return SUB_CATEGORY
-
-async def subcategory_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    query = update.callback_query
-    await query.answer()
-    
-    sub_data = query.data
-    if sub_data.startswith('sub_'):
-        try:
-            sub_id = int(sub_data.replace('sub_', ''))
-            # Fetch name
-            session = SessionLocal()
-            cat = session.query(SubCategory).filter(SubCategory.id == sub_id).first()
-            name = cat.name if cat else "כללי"
-            session.close()
-        except ValueError:
-             name = "כללי"
-    else:
-        name = "כללי"
-
-    context.user_data['subcategory'] = name
-    
-    await query.edit_message_text(
-        text="מתי להזכיר?",
-        reply_markup=get_reminder_keyboard()
-    )
-    return REMINDER
-
-
-
-async def reminder_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    query = update.callback_query
-    await query.answer()
-    
-    choice = query.data
-    now = get_now()
-    reminder_time = None
-    
-    if choice == REMINDER_CUSTOM:
-        await query.edit_message_text(
-            "⏰ הקלד זמן תזכורת:\n"
-            "<b>HH:MM</b> — להיום (או מחר אם עבר)\n"
-            "<b>DD/MM HH:MM</b> — לתאריך מסוים\n\n"
-            "(שלח /cancel לביטול)",
-            parse_mode='HTML'
-        )
-        return WAITING_CUSTOM_REMINDER
-
-    if choice == REMINDER_1H:
-        reminder_time = now + timedelta(hours=1)
-    elif choice == REMINDER_TONIGHT:
-        reminder_time = now.replace(hour=20, minute=0, second=0, microsecond=0)
-        if reminder_time < now:
-             reminder_time += timedelta(days=1)
-    elif choice == REMINDER_TOMORROW:
-        reminder_time = now.replace(hour=9, minute=0, second=0, microsecond=0) + timedelta(days=1)
-    elif choice == REMINDER_3D:
-        reminder_time = now.replace(hour=9, minute=0, second=0, microsecond=0) + timedelta(days=3)
-    elif choice == REMINDER_1W:
-        reminder_time = now.replace(hour=9, minute=0, second=0, microsecond=0) + timedelta(weeks=1)
-    elif choice == REMINDER_NONE:
-        reminder_time = None
-
-    session = SessionLocal()
-    try:
-        if reminder_time:
-            reminder_time_naive = to_naive_israel(reminder_time)
-        else:
-            reminder_time_naive = None
-
-        is_shared = 1 if context.user_data.get('is_shared') else 0
-        new_task = Task(
-            chat_id=update.effective_chat.id,
-            text=context.user_data['description'],
-            priority=context.user_data['priority'],
-            parent_category=context.user_data['parent'],
-            sub_category=context.user_data['subcategory'],
-            reminder_time=reminder_time_naive,
-            status='pending',
-            is_shared=is_shared
-        )
-        session.add(new_task)
-        session.commit()
-        session.refresh(new_task)
-
-        if reminder_time:
-            add_reminder_job(new_task.id, reminder_time, update.effective_chat.id)
-
-        time_str = reminder_time.strftime('%H:%M %d/%m') if reminder_time else "ללא"
-        shared_label = " 👥" if is_shared else ""
-        await query.edit_message_text(
-            f"✅ **המשימה נשמרה**{shared_label}\n"
-            f"📝 {new_task.text}\n"
-            f"⏰ תזכורת: {time_str}",
-            parse_mode='HTML'
-        )
-    except Exception as e:
-        logger.error(f"Error saving task: {e}")
-        await query.edit_message_text("❌ ארעה שגיאה בשמירת המשימה.")
-    finally:
-        session.close()
-
-    return ConversationHandler.END
-
-async def custom_reminder_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handles free-text time input for custom reminders during task creation."""
-    text = update.message.text
-    reminder_time, error = parse_custom_time(text)
-
-    if error:
-        await update.message.reply_text(
-            f"❌ {error}\n\n"
-            "שלח <b>HH:MM</b> או <b>DD/MM HH:MM</b>\n"
-            "(או /cancel לביטול)",
-            parse_mode='HTML'
-        )
-        return WAITING_CUSTOM_REMINDER
-
-    session = SessionLocal()
-    try:
-        reminder_time_naive = to_naive_israel(reminder_time)
-        is_shared = 1 if context.user_data.get('is_shared') else 0
-        new_task = Task(
-            chat_id=update.effective_chat.id,
-            text=context.user_data['description'],
-            priority=context.user_data['priority'],
-            parent_category=context.user_data['parent'],
-            sub_category=context.user_data['subcategory'],
-            reminder_time=reminder_time_naive,
-            status='pending',
-            is_shared=is_shared
-        )
-        session.add(new_task)
-        session.commit()
-        session.refresh(new_task)
-
-        add_reminder_job(new_task.id, reminder_time, update.effective_chat.id)
-
-        time_str = reminder_time.strftime('%H:%M %d/%m')
-        shared_label = " 👥" if is_shared else ""
-        await update.message.reply_text(
-            f"✅ <b>המשימה נשמרה</b>{shared_label}\n"
-            f"📝 {new_task.text}\n"
-            f"⏰ תזכורת: {time_str}",
-            parse_mode='HTML'
-        )
-    except Exception as e:
-        logger.error(f"Error saving task with custom reminder: {e}")
-        await update.message.reply_text("❌ ארעה שגיאה בשמירת המשימה.")
-    finally:
-        session.close()
-
-    return ConversationHandler.END
-
-async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    keys = ['parent', 'description', 'priority', 'is_shared',
-            'subcategory', 'editing_task_id', 'new_cat_parent',
-            'custom_reminder_task_id']
-    for k in keys:
-        context.user_data.pop(k, None)
-    await update.message.reply_text('פעולה בוטלה.')
-    return ConversationHandler.END
-
-async def list_tasks_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    session = SessionLocal()
-    try:
-        chat_id = update.effective_chat.id
-        tasks = session.query(Task).filter(
-            get_accessible_filter(chat_id),
-            Task.status == 'pending'
-        ).all()
-
-        if not tasks:
-            msg = "אין משימות פתוחות! 🎉"
-            if update.message:
-                await update.message.reply_text(msg)
-            elif update.callback_query:
-                await update.callback_query.edit_message_text(msg)
-            return
-
-        priority_order = {'urgent': 0, 'normal': 1, 'low': 2}
-        tasks.sort(key=lambda t: priority_order.get(t.priority, 99))
-
-        # Group: Parent -> Sub -> tasks
-        grouped = {CATEGORY_HOME: {}, CATEGORY_WORK: {}}
-        for t in tasks:
-            parent = t.parent_category if t.parent_category in grouped else None
-            if not parent:
-                continue
-            sub = t.sub_category or "כללי"
-            if sub not in grouped[parent]:
-                grouped[parent][sub] = []
-            grouped[parent][sub].append(t)
-
-        text_lines = [f"📋 <b>כל המשימות</b> — {len(tasks)} פתוחות\n"]
-        buttons = []  # list of (label, callback_data) — will be paired into rows of 2
-        num = 0
-
-        def add_section(parent_key, label, icon):
-            nonlocal num
-            sub_cats = grouped.get(parent_key, {})
-            if not any(sub_cats.values()):
-                return
-            total = sum(len(l) for l in sub_cats.values())
-            text_lines.append(f"{icon} <b>{label}</b> ({total})")
-            for sub_name, section_tasks in sub_cats.items():
-                if not section_tasks:
-                    continue
-                text_lines.append(f"  <b>{sub_name}</b>")
-                for t in section_tasks:
-                    num += 1
-                    p_icon = "🔴" if t.priority == 'urgent' else "🟡" if t.priority == 'normal' else "🟢"
-                    shared_mark = " 👥" if t.is_shared else ""
-                    text_lines.append(f"    {num}. {t.text} {p_icon}{shared_mark}")
-                    buttons.append((f"{num}. {p_icon}{shared_mark} {t.text}", f"{VIEW_TASK}{t.id}"))
-            text_lines.append("")
-
-        add_section(CATEGORY_HOME, "בית", "🏠")
-        add_section(CATEGORY_WORK, "עבודה", "💼")
-
-        # Build keyboard: task buttons in rows of 2
-        keyboard = []
-        for i in range(0, len(buttons), 2):
-            row = [InlineKeyboardButton(buttons[i][0], callback_data=buttons[i][1])]
-            if i + 1 < len(buttons):
-                row.append(InlineKeyboardButton(buttons[i + 1][0], callback_data=buttons[i + 1][1]))
-            keyboard.append(row)
-        keyboard.append([InlineKeyboardButton("🔙 חזרה לראשי", callback_data="back_to_dashboard")])
-
-        msg = "\n".join(text_lines)
-        markup = InlineKeyboardMarkup(keyboard)
-
-        if update.message:
-            await update.message.reply_text(msg, reply_markup=markup, parse_mode='HTML')
-        elif update.callback_query:
-            await update.callback_query.edit_message_text(msg, reply_markup=markup, parse_mode='HTML')
-
-    except Exception as e:
-        logger.error(f"Error listing tasks: {e}")
-        if update.message:
-            await update.message.reply_text("❌ שגיאה בשליפת המשימות.")
-    finally:
-        session.close()
-
-async def view_task_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    query = update.callback_query
-    await query.answer()
-    
-    task_id = int(query.data.replace(VIEW_TASK, ""))
-    session = SessionLocal()
-    try:
-        task = get_accessible_task(session, task_id, update.effective_chat.id)
-        if not task:
-            await query.edit_message_text("❌ המשימה לא נמצאה (אולי נמחקה?)")
-            return
-
-        priority_map = {'urgent': "durgent 🔴", 'normal': "רגיל 🟡", 'low': "נמוך 🟢"}
-        p_text = priority_map.get(task.priority, task.priority)
-        time_str = task.reminder_time.strftime('%d/%m %H:%M') if task.reminder_time else "ללא"
-        shared_line = "👥 משותף" if task.is_shared else "👤 אישי"
-
-        text = (
-            f"📝 <b>{task.text}</b>\n"
-            f"📂 קטגוריה: {task.parent_category} > {task.sub_category}\n"
-            f"⚡ עדיפות: {p_text}\n"
-            f"🔒 סוג: {shared_line}\n"
-            f"⏰ תזכורת: {time_str}"
-        )
-        
-        keyboard = [
-            [
-                InlineKeyboardButton("✅ סיים", callback_data=f"{DONE_TASK}{task.id}"),
-                InlineKeyboardButton("✏️ ערוך פרטים", callback_data=f"{EDIT_TASK}{task.id}")
-            ],
-            [InlineKeyboardButton("⏰ ערוך תזכורת", callback_data=f"{EDIT_REMINDER_PREFIX}{task.id}")],
-            [InlineKeyboardButton("🔙 חזרה לרשימה", callback_data="back_to_list")]
-        ]
-        await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='HTML')
-        
-    finally:
-        session.close()
-
-async def mark_done_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    query = update.callback_query
-    await query.answer()
-
-    task_id = int(query.data.replace(DONE_TASK, ""))
-    session = SessionLocal()
-    try:
-        task = get_accessible_task(session, task_id, update.effective_chat.id)
-        if task:
-            phrase = _get_done_phrase(task.created_at)
-            task.status = 'done'
-            task.completed_at = to_naive_israel(get_now())
-            session.commit()
-
-            # Show sarcastic feedback — no buttons to prevent accidental clicks
-            await query.edit_message_text(f"✅ {phrase}", parse_mode='HTML')
-
-            # Let the user read, then return to dashboard
-            await asyncio.sleep(4)
-            from src.bot.dashboard_handlers import dashboard_command
-            await dashboard_command(update, context)
-        else:
-            await query.answer("המשימה לא נמצאה")
-    finally:
-        session.close()
-
-async def edit_task_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    query = update.callback_query
-    await query.answer()
-    
-    task_id = int(query.data.replace(EDIT_TASK, ""))
-    context.user_data['editing_task_id'] = task_id
-    
-    await query.edit_message_text(
-        "✏️ <b>הקלד את התיאור החדש של המשימה:</b>\n\n(שלח /cancel לביטול)",
-        parse_mode='HTML'
-    )
-    return EDITING_DESCRIPTION
-
-async def save_edit_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    task_id = context.user_data.get('editing_task_id')
-    new_text = update.message.text
-    
-    session = SessionLocal()
-    try:
-        task = get_accessible_task(session, task_id, update.effective_chat.id)
-        if task:
-            task.text = new_text
-            session.commit()
-            await update.message.reply_text("✅ התיאור עודכן בהצלחה!")
-            
-            # Show the updated task view manually (cant edit message from here easily without sending new menu)
-            # We will just show the main list again
-            await list_tasks_command(update, context)
-        else:
-            await update.message.reply_text("❌ המשימה לא נמצאה.")
-    finally:
-        session.close()
-    
-    return ConversationHandler.END
-
-async def back_to_list_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.callback_query.answer()
-    await list_tasks_command(update, context)
-
-async def global_fallback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Replies to any message not handled by other handlers to confirm connectivity."""
-    logger.info(f"Received message: {update.message.text}")
-    await update.message.reply_text("I heard you (Global Fallback)")
-
-async def filter_tasks_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    query = update.callback_query
-    await query.answer()
-
-    data = query.data
-    target_category = CATEGORY_HOME if data == 'filter_home' else CATEGORY_WORK
-    category_label = "בית" if target_category == CATEGORY_HOME else "עבודה"
-    icon_main = "🏠" if target_category == CATEGORY_HOME else "💼"
-
-    session = SessionLocal()
-    try:
-        tasks = session.query(Task).filter(
-            get_accessible_filter(update.effective_chat.id),
-            Task.status == 'pending',
-            Task.parent_category == target_category
-        ).all()
-
-        priority_order = {'urgent': 0, 'normal': 1, 'low': 2}
-        tasks.sort(key=lambda t: priority_order.get(t.priority, 99))
-
-        # Group by subcategory
-        grouped = {}
-        for t in tasks:
-            sub = t.sub_category or "כללי"
-            if sub not in grouped:
-                grouped[sub] = []
-            grouped[sub].append(t)
-
-        text_lines = [f"{icon_main} <b>{category_label}</b> — {len(tasks)} משימות\n"]
-        buttons = []
-        num = 0
-
-        if not tasks:
-            text_lines = [f"{icon_main} <b>{category_label}</b> — אין משימות"]
-        else:
-            for sub_name, section_tasks in grouped.items():
-                if not section_tasks:
-                    continue
-                text_lines.append(f"<b>{sub_name}</b>")
-                for t in section_tasks:
-                    num += 1
-                    p_icon = "🔴" if t.priority == 'urgent' else "🟡" if t.priority == 'normal' else "🟢"
-                    shared_mark = " 👥" if t.is_shared else ""
-                    text_lines.append(f"  {num}. {t.text} {p_icon}{shared_mark}")
-                    buttons.append((f"{num}. {p_icon}{shared_mark} {t.text}", f"{VIEW_TASK}{t.id}"))
-                text_lines.append("")
-
-        # Build keyboard: task buttons in rows of 2
-        keyboard = []
-        for i in range(0, len(buttons), 2):
-            row = [InlineKeyboardButton(buttons[i][0], callback_data=buttons[i][1])]
-            if i + 1 < len(buttons):
-                row.append(InlineKeyboardButton(buttons[i + 1][0], callback_data=buttons[i + 1][1]))
-            keyboard.append(row)
-        keyboard.append([InlineKeyboardButton("🔙 חזרה לראשי", callback_data="back_to_dashboard")])
-
-        msg = "\n".join(text_lines)
-        await query.edit_message_text(msg, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='HTML')
-
-    finally:
-        session.close()
-
-async def back_to_dashboard_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    from src.bot.dashboard_handlers import dashboard_command
-    await dashboard_command(update, context)
-
-async def snooze_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    query = update.callback_query
-    await query.answer() # Don't want loading state
-    
-    # format: snooze_1h_123
-    try:
-        task_id = int(query.data.replace(SNOOZE_1H_PREFIX, ""))
-    except ValueError:
-        return
-        
-    session = SessionLocal()
-    try:
-        task = get_accessible_task(session, task_id, update.effective_chat.id)
-        if task:
-            # new_time is aware
-            new_time = get_now() + timedelta(hours=1)
-            
-            # Save naive to DB
-            task.reminder_time = to_naive_israel(new_time)
-            session.commit()
-            
-            # Reschedule with aware time
-            add_reminder_job(task.id, new_time, update.effective_chat.id)
-            
-            await query.edit_message_text(f"💤 התזכורת נדחתה לשעה {new_time.strftime('%H:%M')}")
-        else:
-            await query.edit_message_text("❌ המשימה לא נמצאה")
-    finally:
-        session.close()
-
-async def edit_reminder_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    query = update.callback_query
-    await query.answer()
-    
-    try:
-        task_id = int(query.data.replace(EDIT_REMINDER_PREFIX, ""))
-    except ValueError:
-        return
-        
-    await query.edit_message_text(
-        text="⏰ **בחר זמן תזכורת חדש:**",
-        reply_markup=get_reminder_keyboard(task_id=task_id),
-        parse_mode='Markdown'
-    )
-
-async def update_reminder_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    query = update.callback_query
-    await query.answer()
-    
-    data = query.data
-    # data format: upd_rem_<task_id>_<type>
-    prefix_len = len(UPD_REMINDER_PREFIX)
-    rest = data[prefix_len:]
-    
-    # We expect integer id then underscore then type string.
-    # But reminder constants are strings like 'reminder_1h'.
-    # Example: 123_reminder_1h
-    
-    # Split by first underscore ONLY to separate ID from Choice
-    try:
-        task_id_str, choice = rest.split('_', 1)
-        task_id = int(task_id_str)
-        # Adding back the prefix or just using the choice string?
-        # choice should resolve to one of the constants, e.g. "reminder_1h"
-    except ValueError:
-         logger.error(f"Failed to parse update reminder data: {data}")
-         return
-
-    now = get_now()
-    reminder_time = None
-
-    # Logic copied from reminder_callback but reused
-    if choice == REMINDER_1H:
-        reminder_time = now + timedelta(hours=1)
-    elif choice == REMINDER_TONIGHT:
-        reminder_time = now.replace(hour=20, minute=0, second=0, microsecond=0)
-        if reminder_time < now:
-             reminder_time += timedelta(days=1)
-    elif choice == REMINDER_TOMORROW:
-        reminder_time = now.replace(hour=9, minute=0, second=0, microsecond=0) + timedelta(days=1)
-    elif choice == REMINDER_3D:
-        reminder_time = now.replace(hour=9, minute=0, second=0, microsecond=0) + timedelta(days=3)
-    elif choice == REMINDER_1W:
-        reminder_time = now.replace(hour=9, minute=0, second=0, microsecond=0) + timedelta(weeks=1)
-    elif choice == REMINDER_NONE:
-        reminder_time = None
-
-    session = SessionLocal()
-    try:
-        task = get_accessible_task(session, task_id, update.effective_chat.id)
-        if task:
-            task.reminder_time = to_naive_israel(reminder_time) if reminder_time else None
-            session.commit()
-
-            # Reschedule
-            if reminder_time:
-                add_reminder_job(task.id, reminder_time, update.effective_chat.id)
-            else:
-                # Ideally remove job but add_reminder_job with upsert should handle new ones. To remove we need remove_job logic which we dont have exposed yet easily.
-                # However we can just let old job fail or overwrite if ID is same? 
-                # add_reminder_job uses scheduler.add_job(..., replace_existing=True).
-                # If we pass None date it might error.
-                # If reminder is None we should probably TRY to remove the job from scheduler if possible, or do nothing.
-                pass
-            
-            time_str = reminder_time.strftime('%H:%M %d/%m') if reminder_time else "ללא"
-            await query.edit_message_text(f"✅ התזכורת עודכנה ל: {time_str}")
-            
-            # Show task view again after short delay? or leave as is.
-            # Let's show filtered list or task view?
-            # User might want to go back.
-            # But we edited the message text so the buttons are gone.
-            # Add a back button
-            kb = [[InlineKeyboardButton("🔙 חזרה למשימה", callback_data=f"{VIEW_TASK}{task_id}")]]
-            await query.edit_message_reply_markup(reply_markup=InlineKeyboardMarkup(kb))
-            
-        else:
-            await query.edit_message_text("❌ המשימה לא נמצאה")
-    finally:
-        session.close()
-
-async def custom_edit_reminder_entry(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Entry point for custom time input when editing an existing task's reminder."""
-    query = update.callback_query
-    await query.answer()
-
-    data = query.data
-    prefix_len = len(UPD_REMINDER_PREFIX)
-    rest = data[prefix_len:]
-    try:
-        task_id_str, _ = rest.split('_', 1)
-        task_id = int(task_id_str)
-    except ValueError:
-        return ConversationHandler.END
-
-    context.user_data['custom_reminder_task_id'] = task_id
-    await query.edit_message_text(
-        "⏰ הקלד זמן תזכורת:\n"
-        "<b>HH:MM</b> — להיום (או מחר אם עבר)\n"
-        "<b>DD/MM HH:MM</b> — לתאריך מסוים\n\n"
-        "(שלח /cancel לביטול)",
-        parse_mode='HTML'
-    )
-    return WAITING_CUSTOM_REMINDER
-
-async def custom_edit_reminder_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handles free-text time input when editing an existing task's reminder."""
-    text = update.message.text
-    reminder_time, error = parse_custom_time(text)
-
-    if error:
-        await update.message.reply_text(
-            f"❌ {error}\n\n"
-            "שלח <b>HH:MM</b> או <b>DD/MM HH:MM</b>\n"
-            "(או /cancel לביטול)",
-            parse_mode='HTML'
-        )
-        return WAITING_CUSTOM_REMINDER
-
-    task_id = context.user_data.get('custom_reminder_task_id')
-    session = SessionLocal()
-    try:
-        task = get_accessible_task(session, task_id, update.effective_chat.id)
-        if task:
-            task.reminder_time = to_naive_israel(reminder_time)
-            session.commit()
-            add_reminder_job(task.id, reminder_time, update.effective_chat.id)
-
-            time_str = reminder_time.strftime('%H:%M %d/%m')
-            kb = [[InlineKeyboardButton("🔙 חזרה למשימה", callback_data=f"{VIEW_TASK}{task_id}")]]
-            await update.message.reply_text(
-                f"✅ התזכורת עודכנה ל: {time_str}",
-                reply_markup=InlineKeyboardMarkup(kb)
-            )
-        else:
-            await update.message.reply_text("❌ המשימה לא נמצאה")
-    finally:
-        session.close()
-
-    return ConversationHandler.END
-
-async def quick_add_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    text = update.message.text
-    if not text: return
-
-    session = SessionLocal()
-    try:
-        new_task = Task(
-            chat_id=update.effective_chat.id,
-            text=text,
-            priority='normal', # Default
-            parent_category=CATEGORY_HOME, # Default to Home
-            sub_category='כללי',
-            reminder_time=None,
-            status='pending',
-            is_shared=0
-        )
-        session.add(new_task)
-        session.commit()
-        await update.message.reply_text(f"✅ משימה מהירה נוספה: **{text}**", parse_mode='Markdown')
-        
-        # Optionally show dashboard again?
-        from src.bot.dashboard_handlers import dashboard_command
-        await dashboard_command(update, context)
-        
-    except Exception as e:
-        logger.error(f"Error quick add: {e}")
-        await update.message.reply_text("❌ שגיאה בהוספה מהירה")
-    finally:
-        session.close()
-    
-    return ConversationHandler.END
+import re
+import random
+import logging
+import zoneinfo
+from datetime import datetime, timedelta
+from src.bot.utils import get_now, to_naive_israel, ISRAEL_TZ, get_accessible_filter, get_accessible_task, get_pending_tasks, find_task
+from telegram import Update
+from telegram.ext import ContextTypes, ConversationHandler
+from src.bot.constants import *
+from src.bot.render import edit_view, edit_markup, send_view
+from src.bot.callbacks import encode, decode
+from src.bot.keyboards import get_priority_keyboard, get_subcategory_keyboard, get_reminder_keyboard, get_shared_choice_keyboard
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from src.database.core import get_categories, get_category_names, ensure_user_preferences
+from src.database.unit_of_work import current_session, commit_current, after_commit
+from src.database.households import ensure_household
+from src.database.degraded import (
+    DatabaseUnavailable, db_available, is_outage, best_effort, replays, replay_queued_writes, has_queued_writes,
+    real_task_id, snapshot_task, stale_banner, queue_done, queue_snooze, queue_quick_add
+)
+from src.database.models import Task
+from src.database.stats import completion_bucket, record_task_created, record_task_completed
+from src.scheduler.service import add_reminder_job
+
+logger = logging.getLogger(__name__)
+
+# Sarcastic feedback phrases (plural Hebrew) by completion-time bucket
+_DONE_PHRASES = {
+    'obsessive': [  # < 5 hours
+        "פחות מ-5 שעות? ישבתם וחיכיתם ליד הטלפון שזה יקרה? לכו לנשום אוויר 🧘‍♂️💨",
+        "מהירים כמו ברק! חשבתי שזה באג, אף אחד לא מסיים כל כך מהר 😱⚡",
+        "רגע, סיימתם את זה ככה מהר? בטוח שעשיתם את זה כמו שצריך? 🤔🏃",
+        "אוקיי, הבנו, אתם יעילים. אפשר גם קצת להירגע 😤✨",
+    ],
+    'normal': [  # 5 – 48 hours
+        "קצב של צב עם אישיות, אבל העיקר שזה נעשה 🐌😏",
+        "סבבה, לקח לכם קצת זמן אבל עדיין בטווח הנורמלי. כל הכבוד 👏🎭",
+        "יום-יומיים? קלאסי שלכם. לא מהר מדי, לא לאט מדי 📊😌",
+        "הו, נזכרתם! חשבתי שכבר שכחתם. נחמד שהפתעתם 🎉😏",
+    ],
+    'procrastinator': [  # 2 – 7 days
+        "אני בהלם, באמת נזכרתם בזה? הופתעתי לטובה מהתפקוד המאוחר 🧐👏",
+        "שבוע כמעט עבר ורק עכשיו? טוב, עדיף מאוחר מאשר... רגע, זה כבר מאוחר 😅⏰",
+        "אחרי כמה ימים של התלבטות סוף סוף עשיתם את זה. גיבורים 🦸‍♂️🐢",
+        "חשבתי שהמשימה הזו כבר פרשה לגמלאות, אבל הנה, הפתעה! 🎊😲",
+    ],
+    'archeologist': [  # > 7 days
+        "נס חנוכה! אחרי יותר משבוע נזכרתם בזה? כמעט העברתי את זה לירושה 👵👴",
+        "חפירה ארכיאולוגית! מצאתם משימה עתיקה ואפילו סיימתם אותה 🏛️🪨",
+        "חשבתי שהמשימה הזו כבר קיבלה אזרחות. שבוע+! שיא חדש 🏆🗓️",
+        "המשימה הזו כבר הספיקה ללמוד שפה חדשה. אתם? רק סיימתם אותה 📚🌍",
+    ],
+}
+
+# How long the done phrase stays up before the message turns back into the dashboard
+DONE_FEEDBACK_SECONDS = 4
+
+def _get_done_phrase(created_at) -> str:
+    """Pick a random sarcastic phrase based on how long the task was open."""
+    now_naive = get_now().replace(tzinfo=None)
+    return random.choice(_DONE_PHRASES[completion_bucket(created_at, now_naive)])
+
+def _db_writable():
+    """True when a write can go straight to the DB: the circuit is closed and
+    the writes queued during an outage were replayed first (keeps them in order)."""
+    if not db_available():
+        return False
+    replay_queued_writes()
+    return not has_queued_writes()
+
+def parse_custom_time(text: str):
+    """Parse HH:MM or DD/MM HH:MM into an aware Israel datetime.
+    Returns (datetime, error_message). On success error_message is None."""
+    text = text.strip()
+    now = get_now()
+
+    # Try DD/MM HH:MM
+    m = re.match(r'^(\d{1,2})/(\d{1,2})\s+(\d{1,2}):(\d{2})$', text)
+    if m:
+        day, month, hour, minute = int(m.group(1)), int(m.group(2)), int(m.group(3)), int(m.group(4))
+        try:
+            reminder = now.replace(month=month, day=day, hour=hour, minute=minute, second=0, microsecond=0)
+        except ValueError:
+            return None, "תאריך לא תקין. נסה שוב בפורמט DD/MM HH:MM"
+        if reminder <= now:
+            return None, "הזמן שהוזן כבר עבר. הזן זמן עתידי."
+        return reminder, None
+
+    # Try HH:MM
+    m = re.match(r'^(\d{1,2}):(\d{2})$', text)
+    if m:
+        hour, minute = int(m.group(1)), int(m.group(2))
+        if hour > 23 or minute > 59:
+            return None, "שעה לא תקינה. נסה שוב בפורמט HH:MM"
+        reminder = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if reminder <= now:
+            reminder += timedelta(days=1)
+        return reminder, None
+
+    return None, "פורמט לא תקין. שלח HH:MM או DD/MM HH:MM"
+
+async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.message.reply_text("אנא התחל משימה עם 'בית' או 'עבודה'.")
+    return ConversationHandler.END
+
+async def task_entry_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    text = update.message.text
+    if text.startswith('בית'):
+        context.user_data['parent'] = CATEGORY_HOME
+        rest = text[3:].strip()
+    elif text.startswith('עבודה'):
+        context.user_data['parent'] = CATEGORY_WORK
+        rest = text[5:].strip()
+    else:
+        return ConversationHandler.END
+
+    if not rest:
+        await update.message.reply_text("מה המשימה?")
+        return DESCRIPTION
+    
+    context.user_data['description'] = rest
+    await update.message.reply_text(
+        f"משימה: {rest}\nבחר עדיפות:",
+        reply_markup=get_priority_keyboard()
+    )
+    return PRIORITY
+
+async def description_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    context.user_data['description'] = update.message.text
+    await update.message.reply_text(
+        "בחר עדיפות:",
+        reply_markup=get_priority_keyboard()
+    )
+    return PRIORITY
+
+async def priority_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+
+    priority = context.args[0]
+    context.user_data['priority'] = priority
+
+    parent = context.user_data.get('parent')
+
+    # Home tasks: ask shared/personal choice first
+    if parent == CATEGORY_HOME:
+        await edit_view(query,
+            text="עדיפות נבחרה. משימה אישית או משותפת?",
+            reply_markup=get_shared_choice_keyboard()
+        )
+        return SHARED_CHOICE
+
+    # Work tasks: skip shared choice, always personal
+    context.user_data['is_shared'] = False
+    context.user_data['household_id'] = None
+    try:
+        keyboard = get_subcategory_keyboard(parent, chat_id=update.effective_chat.id)
+        commit_current()  # first use seeds the default categories
+    except Exception as e:
+        logger.error(f"Error building subcategory keyboard: {e}", exc_info=True)
+        context.user_data.clear()
+        await edit_view(query, "❌ בעיית חיבור למסד הנתונים. נסה שוב בעוד כמה שניות.")
+        return ConversationHandler.END
+
+    await edit_view(query,
+        text="עדיפות נבחרה. קטגוריה:",
+        reply_markup=keyboard
+    )
+    return SUB_CATEGORY
+
+async def shared_choice_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+
+    is_shared = context.args[0]
+    context.user_data['is_shared'] = is_shared
+
+    parent = context.user_data.get('parent')
+    try:
+        household_id = None
+        if is_shared:
+            household_id = ensure_household(current_session(), update.effective_chat.id)
+            commit_current()  # created on first use
+        context.user_data['household_id'] = household_id
+        keyboard = get_subcategory_keyboard(parent, chat_id=update.effective_chat.id, household_id=household_id)
+    except Exception as e:
+        logger.error(f"Error building subcategory keyboard: {e}", exc_info=True)
+        context.user_data.clear()
+        await edit_view(query, "❌ בעיית חיבור למסד הנתונים. נסה שוב בעוד כמה שניות.")
+        return ConversationHandler.END
+
+    label = "👥 משותף" if is_shared else "👤 אישי"
+    await edit_view(query,
+        text=f"{label} — בחר קטגוריה:",
+        reply_markup=keyboard
+    )
+    return SUB_CATEGORY
+
+def _category_id_by_name(name, chat_id, household_id, parent):
+    """Id of the picker's category called `name` (legacy buttons carried
+    the name), or None."""
+    from src.database.models import SubCategory
+    from src.database.queries import CHAT_CATEGORIES, HOUSEHOLD_CATEGORIES
+    if household_id is not None:
+        statement, params = HOUSEHOLD_CATEGORIES, {"household_id": household_id, "parent": parent}
+    else:
+        statement, params = CHAT_CATEGORIES, {"chat_id": chat_id, "parent": parent}
+    category = current_session().execute(statement.where(SubCategory.name == name).limit(1), params).scalars().first()
+    return category.id if category else None
+
+async def subcategory_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    
+    sub_id = context.args[0]
+    household_id = context.user_data.get('household_id')
+    if isinstance(sub_id, str):
+        sub_id = _category_id_by_name(sub_id, update.effective_chat.id, household_id, context.user_data.get('parent'))
+    if sub_id is not None:
+        # Only accept the user's own categories or the chosen household's
+        cat = get_categories(current_session(), [sub_id]).get(sub_id)
+        if not cat or not (cat[1] == update.effective_chat.id or (household_id and cat[3] == household_id)):
+            sub_id = None
+
+    context.user_data['subcategory_id'] = sub_id
+    
+    await edit_view(query,
+        text="מתי להזכיר?",
+        reply_markup=get_reminder_keyboard()
+    )
+    return REMINDER
+
+
+
+async def reminder_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    
+    choice = context.args[0]
+    now = get_now()
+    reminder_time = None
+    
+    if choice == REMINDER_CUSTOM:
+        await edit_view(query,
+            "⏰ הקלד זמן תזכורת:\n"
+            "<b>HH:MM</b> — להיום (או מחר אם עבר)\n"
+            "<b>DD/MM HH:MM</b> — לתאריך מסוים\n\n"
+            "(שלח /cancel לביטול)",
+            parse_mode='HTML'
+        )
+        return WAITING_CUSTOM_REMINDER
+
+    if choice == REMINDER_1H:
+        reminder_time = now + timedelta(hours=1)
+    elif choice == REMINDER_TONIGHT:
+        reminder_time = now.replace(hour=20, minute=0, second=0, microsecond=0)
+        if reminder_time < now:
+             reminder_time += timedelta(days=1)
+    elif choice == REMINDER_TOMORROW:
+        reminder_time = now.replace(hour=9, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    elif choice == REMINDER_3D:
+        reminder_time = now.replace(hour=9, minute=0, second=0, microsecond=0) + timedelta(days=3)
+    elif choice == REMINDER_1W:
+        reminder_time = now.replace(hour=9, minute=0, second=0, microsecond=0) + timedelta(weeks=1)
+    elif choice == REMINDER_NONE:
+        reminder_time = None
+
+    session = current_session()
+    try:
+        if reminder_time:
+            reminder_time_naive = to_naive_israel(reminder_time)
+        else:
+            reminder_time_naive = None
+
+        is_shared = 1 if context.user_data.get('is_shared') else 0
+        new_task = Task(
+            chat_id=update.effective_chat.id,
+            text=context.user_data['description'],
+            priority=context.user_data['priority'],
+            parent_category=context.user_data['parent'],
+            sub_category_id=context.user_data.get('subcategory_id'),
+            reminder_time=reminder_time_naive,
+            status='pending',
+            is_shared=is_shared,
+            household_id=context.user_data.get('household_id') if is_shared else None
+        )
+        session.add(new_task)
+        record_task_created(session, new_task, to_naive_israel(get_now()))
+        ensure_user_preferences(session, new_task.chat_id)
+
+        if reminder_time:
+            _schedule_new_task_reminder(session, new_task, reminder_time)
+        commit_current()
+    except Exception as e:
+        session.rollback()
+        logger.error(f"Error saving task: {e}")
+        await edit_view(query, OFFLINE_MESSAGE if is_outage(e) else "❌ ארעה שגיאה בשמירת המשימה.")
+        return ConversationHandler.END
+
+    time_str = reminder_time.strftime('%H:%M %d/%m') if reminder_time else "ללא"
+    shared_label = " 👥" if is_shared else ""
+    await edit_view(query,
+        f"✅ **המשימה נשמרה**{shared_label}\n"
+        f"📝 {context.user_data['description']}\n"
+        f"⏰ תזכורת: {time_str}",
+        parse_mode='HTML'
+    )
+    return ConversationHandler.END
+
+def _schedule_new_task_reminder(session, task, reminder_time):
+    # The id is assigned by the commit's flush
+    after_commit(session, lambda: add_reminder_job(task.id, reminder_time, task.chat_id))
+
+async def custom_reminder_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handles free-text time input for custom reminders during task creation."""
+    text = update.message.text
+    reminder_time, error = parse_custom_time(text)
+
+    if error:
+        await update.message.reply_text(
+            f"❌ {error}\n\n"
+            "שלח <b>HH:MM</b> או <b>DD/MM HH:MM</b>\n"
+            "(או /cancel לביטול)",
+            parse_mode='HTML'
+        )
+        return WAITING_CUSTOM_REMINDER
+
+    session = current_session()
+    try:
+        reminder_time_naive = to_naive_israel(reminder_time)
+        is_shared = 1 if context.user_data.get('is_shared') else 0
+        new_task = Task(
+            chat_id=update.effective_chat.id,
+            text=context.user_data['description'],
+            priority=context.user_data['priority'],
+            parent_category=context.user_data['parent'],
+            sub_category_id=context.user_data.get('subcategory_id'),
+            reminder_time=reminder_time_naive,
+            status='pending',
+            is_shared=is_shared,
+            household_id=context.user_data.get('household_id') if is_shared else None
+        )
+        session.add(new_task)
+        record_task_created(session, new_task, to_naive_israel(get_now()))
+        ensure_user_preferences(session, new_task.chat_id)
+
+        _schedule_new_task_reminder(session, new_task, reminder_time)
+        commit_current()
+    except Exception as e:
+        session.rollback()
+        logger.error(f"Error saving task with custom reminder: {e}")
+        await update.message.reply_text(OFFLINE_MESSAGE if is_outage(e) else "❌ ארעה שגיאה בשמירת המשימה.")
+        return ConversationHandler.END
+
+    time_str = reminder_time.strftime('%H:%M %d/%m')
+    shared_label = " 👥" if is_shared else ""
+    await update.message.reply_text(
+        f"✅ <b>המשימה נשמרה</b>{shared_label}\n"
+        f"📝 {context.user_data['description']}\n"
+        f"⏰ תזכורת: {time_str}",
+        parse_mode='HTML'
+    )
+    return ConversationHandler.END
+
+async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    keys = ['parent', 'description', 'priority', 'is_shared', 'household_id',
+            'subcategory_id', 'editing_task_id', 'new_cat_parent',
+            'custom_reminder_task_id']
+    for k in keys:
+        context.user_data.pop(k, None)
+    await update.message.reply_text('פעולה בוטלה.')
+    return ConversationHandler.END
+
+async def list_tasks_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    session = current_session()
+    try:
+        chat_id = update.effective_chat.id
+        tasks = get_pending_tasks(session, chat_id)
+
+        if not tasks:
+            msg = "אין משימות פתוחות! 🎉"
+            if update.message:
+                await update.message.reply_text(msg)
+            elif update.callback_query:
+                await edit_view(update.callback_query, msg)
+            return
+
+        # Group: Parent -> Sub (category id) -> tasks
+        grouped = {CATEGORY_HOME: {}, CATEGORY_WORK: {}}
+        for t in tasks:
+            parent = t.parent_category if t.parent_category in grouped else None
+            if not parent:
+                continue
+            grouped[parent].setdefault(t.sub_category_id, []).append(t)
+        sub_names = get_category_names(session, {t.sub_category_id for t in tasks})
+
+        text_lines = [f"{stale_banner(tasks)}📋 <b>כל המשימות</b> — {len(tasks)} פתוחות\n"]
+        buttons = []  # list of (label, callback_data) — will be paired into rows of 2
+        num = 0
+
+        def add_section(parent_key, label, icon):
+            nonlocal num
+            sub_cats = grouped.get(parent_key, {})
+            if not any(sub_cats.values()):
+                return
+            total = sum(len(l) for l in sub_cats.values())
+            text_lines.append(f"{icon} <b>{label}</b> ({total})")
+            for sub_id, section_tasks in sub_cats.items():
+                if not section_tasks:
+                    continue
+                text_lines.append(f"  <b>{sub_names[sub_id]}</b>")
+                for t in section_tasks:
+                    num += 1
+                    p_icon = "🔴" if t.priority == 'urgent' else "🟡" if t.priority == 'normal' else "🟢"
+                    shared_mark = " 👥" if t.is_shared else ""
+                    text_lines.append(f"    {num}. {t.text} {p_icon}{shared_mark}")
+                    buttons.append((f"{num}. {p_icon}{shared_mark} {t.text}", encode(VIEW_TASK, t.id)))
+            text_lines.append("")
+
+        add_section(CATEGORY_HOME, "בית", "🏠")
+        add_section(CATEGORY_WORK, "עבודה", "💼")
+
+        # Build keyboard: task buttons in rows of 2
+        keyboard = []
+        for i in range(0, len(buttons), 2):
+            row = [InlineKeyboardButton(buttons[i][0], callback_data=buttons[i][1])]
+            if i + 1 < len(buttons):
+                row.append(InlineKeyboardButton(buttons[i + 1][0], callback_data=buttons[i + 1][1]))
+            keyboard.append(row)
+        keyboard.append([InlineKeyboardButton("🔙 חזרה לראשי", callback_data=encode(BACK_TO_DASHBOARD))])
+
+        msg = "\n".join(text_lines)
+        markup = InlineKeyboardMarkup(keyboard)
+
+        if update.message:
+            await send_view(update.message, msg, reply_markup=markup, parse_mode='HTML')
+        elif update.callback_query:
+            await edit_view(update.callback_query, msg, reply_markup=markup, parse_mode='HTML')
+
+    except DatabaseUnavailable:
+        if update.message:
+            await update.message.reply_text(OFFLINE_MESSAGE)
+        elif update.callback_query:
+            await edit_view(update.callback_query, OFFLINE_MESSAGE)
+    except Exception as e:
+        logger.error(f"Error listing tasks: {e}")
+        if update.message:
+            await update.message.reply_text("❌ שגיאה בשליפת המשימות.")
+
+async def view_task_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    
+    task_id = context.args[0]
+    session = current_session()
+    task = find_task(session, update.effective_chat.id, task_id)
+    if not task:
+        await edit_view(query, "❌ המשימה לא נמצאה (אולי נמחקה?)")
+        return
+
+    priority_map = {'urgent': "durgent 🔴", 'normal': "רגיל 🟡", 'low': "נמוך 🟢"}
+    p_text = priority_map.get(task.priority, task.priority)
+    sub_name = get_category_names(session, [task.sub_category_id])[task.sub_category_id]
+    time_str = task.reminder_time.strftime('%d/%m %H:%M') if task.reminder_time else "ללא"
+    shared_line = "👥 משותף" if task.is_shared else "👤 אישי"
+
+    text = (
+        f"📝 <b>{task.text}</b>\n"
+        f"📂 קטגוריה: {task.parent_category} > {sub_name}\n"
+        f"⚡ עדיפות: {p_text}\n"
+        f"🔒 סוג: {shared_line}\n"
+        f"⏰ תזכורת: {time_str}"
+    )
+    
+    keyboard = [
+        [
+            InlineKeyboardButton("✅ סיים", callback_data=encode(DONE_TASK, task.id)),
+            InlineKeyboardButton("✏️ ערוך פרטים", callback_data=encode(EDIT_TASK, task.id))
+        ],
+        [InlineKeyboardButton("⏰ ערוך תזכורת", callback_data=encode(EDIT_REMINDER, task.id))],
+        [InlineKeyboardButton("🔙 חזרה לרשימה", callback_data=encode(BACK_TO_LIST))]
+    ]
+    await edit_view(query, text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='HTML')
+
+@replays('done')
+def complete_task(session, chat_id, task_id, completed_at):
+    """Marks a pending task done. Returns the task, or None if it isn't
+    accessible or is already done (a replayed tap changes nothing)."""
+    task = get_accessible_task(session, task_id, chat_id)
+    if task is None or task.status != 'pending':
+        return None
+    task.status = 'done'
+    task.completed_at = completed_at
+    record_task_completed(session, task)
+    return task
+
+async def mark_done_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+
+    chat_id = update.effective_chat.id
+    completed_at = to_naive_israel(get_now())
+    queued = not _db_writable()
+    task_id = real_task_id(context.args[0])
+    phrase = None
+    if not queued:
+        session = current_session()
+        try:
+            task = complete_task(session, chat_id, task_id, completed_at)
+            if task:
+                phrase = _get_done_phrase(task.created_at)
+                commit_current()
+        except Exception as e:
+            if not is_outage(e):
+                raise
+            session.rollback()
+            queued = True
+    if queued:
+        # Ticked off while the DB is down: show it done now, write it later
+        task = snapshot_task(chat_id, task_id)
+        if not queue_done(chat_id, task_id, completed_at):
+            await edit_view(query, OFFLINE_MESSAGE)
+            return
+        phrase = _get_done_phrase(task.created_at) if task and task.created_at else "המשימה סומנה כבוצעה"
+        phrase += f"\n\n{OFFLINE_QUEUED_NOTE}"
+
+    if not phrase:
+        await query.answer("המשימה לא נמצאה")
+        return
+
+    # Show sarcastic feedback — no buttons to prevent accidental clicks
+    await edit_view(query, f"✅ {phrase}", parse_mode='HTML')
+
+    # Let the user read, then return to dashboard
+    from src.bot.deferred import schedule_refresh
+    schedule_refresh(context, 'dashboard', query.message.chat_id, query.message.message_id, DONE_FEEDBACK_SECONDS)
+
+async def edit_task_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    
+    task_id = context.args[0]
+    context.user_data['editing_task_id'] = task_id
+    
+    await edit_view(query,
+        "✏️ <b>הקלד את התיאור החדש של המשימה:</b>\n\n(שלח /cancel לביטול)",
+        parse_mode='HTML'
+    )
+    return EDITING_DESCRIPTION
+
+async def save_edit_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    task_id = context.user_data.get('editing_task_id')
+    new_text = update.message.text
+    
+    session = current_session()
+    try:
+        task = get_accessible_task(session, task_id, update.effective_chat.id)
+        if task:
+            task.text = new_text
+            commit_current()
+    except Exception as e:
+        session.rollback()
+        logger.error(f"Error saving task {task_id}: {e}")
+        await update.message.reply_text(OFFLINE_MESSAGE if is_outage(e) else "❌ שגיאה בעדכון המשימה.")
+        return ConversationHandler.END
+
+    if task:
+        await update.message.reply_text("✅ התיאור עודכן בהצלחה!")
+
+        # Show the updated task view manually (cant edit message from here easily without sending new menu)
+        # We will just show the main list again
+        await list_tasks_command(update, context)
+    else:
+        await update.message.reply_text("❌ המשימה לא נמצאה.")
+    
+    return ConversationHandler.END
+
+async def back_to_list_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.callback_query.answer()
+    await list_tasks_command(update, context)
+
+async def global_fallback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Replies to any message not handled by other handlers to confirm connectivity."""
+    logger.info(f"Received message: {update.message.text}")
+    await update.message.reply_text("I heard you (Global Fallback)")
+
+async def stale_button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Answers button presses no handler took (data from an old release, or
+    a conversation that already ended), so the client stops spinning."""
+    logger.info(f"Unhandled button: {update.callback_query.data!r}")
+    await update.callback_query.answer("⚠️ הכפתור כבר לא פעיל — פתחו את התפריט מחדש (/start)")
+
+async def filter_tasks_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+
+    target_category = context.args[0]
+    category_label = "בית" if target_category == CATEGORY_HOME else "עבודה"
+    icon_main = "🏠" if target_category == CATEGORY_HOME else "💼"
+
+    session = current_session()
+    try:
+        tasks = [t for t in get_pending_tasks(session, update.effective_chat.id)
+                 if t.parent_category == target_category]
+
+        # Group by subcategory id
+        grouped = {}
+        for t in tasks:
+            grouped.setdefault(t.sub_category_id, []).append(t)
+        sub_names = get_category_names(session, grouped.keys())
+
+        banner = stale_banner(tasks)
+        text_lines = [f"{banner}{icon_main} <b>{category_label}</b> — {len(tasks)} משימות\n"]
+        buttons = []
+        num = 0
+
+        if not tasks:
+            text_lines = [f"{banner}{icon_main} <b>{category_label}</b> — אין משימות"]
+        else:
+            for sub_id, section_tasks in grouped.items():
+                if not section_tasks:
+                    continue
+                text_lines.append(f"<b>{sub_names[sub_id]}</b>")
+                for t in section_tasks:
+                    num += 1
+                    p_icon = "🔴" if t.priority == 'urgent' else "🟡" if t.priority == 'normal' else "🟢"
+                    shared_mark = " 👥" if t.is_shared else ""
+                    text_lines.append(f"  {num}. {t.text} {p_icon}{shared_mark}")
+                    buttons.append((f"{num}. {p_icon}{shared_mark} {t.text}", encode(VIEW_TASK, t.id)))
+                text_lines.append("")
+
+        # Build keyboard: task buttons in rows of 2
+        keyboard = []
+        for i in range(0, len(buttons), 2):
+            row = [InlineKeyboardButton(buttons[i][0], callback_data=buttons[i][1])]
+            if i + 1 < len(buttons):
+                row.append(InlineKeyboardButton(buttons[i + 1][0], callback_data=buttons[i + 1][1]))
+            keyboard.append(row)
+        keyboard.append([InlineKeyboardButton("🔙 חזרה לראשי", callback_data=encode(BACK_TO_DASHBOARD))])
+
+        msg = "\n".join(text_lines)
+        await edit_view(query, msg, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='HTML')
+
+    except DatabaseUnavailable:
+        await edit_view(query, OFFLINE_MESSAGE)
+
+async def back_to_dashboard_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    from src.bot.dashboard_handlers import dashboard_command
+    await dashboard_command(update, context)
+
+def _digest_task_ids(message):
+    """Task ids with a snooze button on a reminder message, in display order."""
+    ids = []
+    markup = message.reply_markup if message else None
+    for row in (markup.inline_keyboard if markup else ()):
+        for button in row:
+            decoded = decode(button.callback_data)
+            if decoded is not None and decoded[0] == SNOOZE_1H:
+                ids.append(decoded[1][0])
+    return ids
+
+@replays('snooze')
+def snooze_task(session, chat_id, task_id, reminder_time):
+    """Moves a task's reminder to `reminder_time` (naive Israel time); it is
+    rescheduled once the session commits. Returns the task, or None if it
+    isn't accessible."""
+    task = get_accessible_task(session, task_id, chat_id)
+    if task is None:
+        return None
+    task.reminder_time = reminder_time
+    # Reschedule with aware time
+    after_commit(session, add_reminder_job, task_id, reminder_time.replace(tzinfo=ISRAEL_TZ), chat_id)
+    return task
+
+async def snooze_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer() # Don't want loading state
+    
+    task_id = context.args[0]
+    chat_id = update.effective_chat.id
+    # new_time is aware; the DB stores it naive
+    new_time = get_now() + timedelta(hours=1)
+    # In a reminder digest only this task's row goes; the rest stay actionable
+    remaining_ids = [tid for tid in _digest_task_ids(query.message) if tid != task_id]
+    queued = not _db_writable()
+    session = current_session()
+    if not queued:
+        try:
+            found = snooze_task(session, chat_id, task_id, to_naive_israel(new_time)) is not None
+            commit_current()
+            remaining = session.query(Task).filter(
+                get_accessible_filter(chat_id),
+                Task.id.in_(remaining_ids),
+                Task.status == 'pending'
+            ).all() if found and remaining_ids else []
+        except Exception as e:
+            if not is_outage(e):
+                raise
+            session.rollback()
+            queued = True
+    if queued:
+        if not queue_snooze(chat_id, task_id, to_naive_israel(new_time)):
+            await edit_view(query, OFFLINE_MESSAGE)
+            return
+        found = True  # access is checked when the snooze is replayed
+        remaining = [t for t in (snapshot_task(chat_id, tid) for tid in remaining_ids) if t]
+
+    if found:
+        if remaining:
+            from src.scheduler.jobs import build_reminder_message
+            remaining.sort(key=lambda t: remaining_ids.index(t.id))
+            text, markup = build_reminder_message(remaining)
+            await edit_view(query, text, reply_markup=markup, parse_mode='HTML')
+        else:
+            note = f"\n\n{OFFLINE_QUEUED_NOTE}" if queued else ""
+            await edit_view(query, f"💤 התזכורת נדחתה לשעה {new_time.strftime('%H:%M')}{note}")
+    else:
+        await edit_view(query, "❌ המשימה לא נמצאה")
+
+async def edit_reminder_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    
+    task_id = context.args[0]
+    await edit_view(query,
+        text="⏰ **בחר זמן תזכורת חדש:**",
+        reply_markup=get_reminder_keyboard(task_id=task_id),
+        parse_mode='Markdown'
+    )
+
+async def update_reminder_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    
+    task_id, choice = context.args
+
+    now = get_now()
+    reminder_time = None
+
+    # Logic copied from reminder_callback but reused
+    if choice == REMINDER_1H:
+        reminder_time = now + timedelta(hours=1)
+    elif choice == REMINDER_TONIGHT:
+        reminder_time = now.replace(hour=20, minute=0, second=0, microsecond=0)
+        if reminder_time < now:
+             reminder_time += timedelta(days=1)
+    elif choice == REMINDER_TOMORROW:
+        reminder_time = now.replace(hour=9, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    elif choice == REMINDER_3D:
+        reminder_time = now.replace(hour=9, minute=0, second=0, microsecond=0) + timedelta(days=3)
+    elif choice == REMINDER_1W:
+        reminder_time = now.replace(hour=9, minute=0, second=0, microsecond=0) + timedelta(weeks=1)
+    elif choice == REMINDER_NONE:
+        reminder_time = None
+
+    session = current_session()
+    try:
+        task = get_accessible_task(session, task_id, update.effective_chat.id)
+        if task:
+            task.reminder_time = to_naive_israel(reminder_time) if reminder_time else None
+            # Reschedule
+            if reminder_time:
+                after_commit(session, add_reminder_job, task_id, reminder_time, update.effective_chat.id)
+            else:
+                # Ideally remove job but add_reminder_job with upsert should handle new ones. To remove we need remove_job logic which we dont have exposed yet easily.
+                # However we can just let old job fail or overwrite if ID is same? 
+                # add_reminder_job uses scheduler.add_job(..., replace_existing=True).
+                # If we pass None date it might error.
+                # If reminder is None we should probably TRY to remove the job from scheduler if possible, or do nothing.
+                pass
+            commit_current()
+    except Exception as e:
+        session.rollback()
+        logger.error(f"Error updating reminder of task {task_id}: {e}")
+        await edit_view(query, OFFLINE_MESSAGE if is_outage(e) else "❌ שגיאה בעדכון התזכורת.")
+        return
+
+    if task:
+        time_str = reminder_time.strftime('%H:%M %d/%m') if reminder_time else "ללא"
+        await edit_view(query, f"✅ התזכורת עודכנה ל: {time_str}")
+        
+        # Show task view again after short delay? or leave as is.
+        # Let's show filtered list or task view?
+        # User might want to go back.
+        # But we edited the message text so the buttons are gone.
+        # Add a back button
+        kb = [[InlineKeyboardButton("🔙 חזרה למשימה", callback_data=encode(VIEW_TASK, task_id))]]
+        await edit_markup(query, reply_markup=InlineKeyboardMarkup(kb))
+        
+    else:
+        await edit_view(query, "❌ המשימה לא נמצאה")
+
+async def custom_edit_reminder_entry(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Entry point for custom time input when editing an existing task's reminder."""
+    query = update.callback_query
+    await query.answer()
+
+    context.user_data['custom_reminder_task_id'] = context.args[0]
+    await edit_view(query,
+        "⏰ הקלד זמן תזכורת:\n"
+        "<b>HH:MM</b> — להיום (או מחר אם עבר)\n"
+        "<b>DD/MM HH:MM</b> — לתאריך מסוים\n\n"
+        "(שלח /cancel לביטול)",
+        parse_mode='HTML'
+    )
+    return WAITING_CUSTOM_REMINDER
+
+async def custom_edit_reminder_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handles free-text time input when editing an existing task's reminder."""
+    text = update.message.text
+    reminder_time, error = parse_custom_time(text)
+
+    if error:
+        await update.message.reply_text(
+            f"❌ {error}\n\n"
+            "שלח <b>HH:MM</b> או <b>DD/MM HH:MM</b>\n"
+            "(או /cancel לביטול)",
+            parse_mode='HTML'
+        )
+        return WAITING_CUSTOM_REMINDER
+
+    task_id = context.user_data.get('custom_reminder_task_id')
+    session = current_session()
+    try:
+        task = get_accessible_task(session, task_id, update.effective_chat.id)
+        if task:
+            task.reminder_time = to_naive_israel(reminder_time)
+            after_commit(session, add_reminder_job, task_id, reminder_time, update.effective_chat.id)
+            commit_current()
+    except Exception as e:
+        session.rollback()
+        logger.error(f"Error updating reminder of task {task_id}: {e}")
+        await update.message.reply_text(OFFLINE_MESSAGE if is_outage(e) else "❌ שגיאה בעדכון התזכורת.")
+        return ConversationHandler.END
+
+    if task:
+        time_str = reminder_time.strftime('%H:%M %d/%m')
+        kb = [[InlineKeyboardButton("🔙 חזרה למשימה", callback_data=encode(VIEW_TASK, task_id))]]
+        await update.message.reply_text(
+            f"✅ התזכורת עודכנה ל: {time_str}",
+            reply_markup=InlineKeyboardMarkup(kb)
+        )
+    else:
+        await update.message.reply_text("❌ המשימה לא נמצאה")
+
+    return ConversationHandler.END
+
+@replays('quick_add')
+def add_quick_task(session, chat_id, text, created_at):
+    """Adds a Home task with default settings. Returns it (not flushed)."""
+    new_task = Task(
+        chat_id=chat_id,
+        text=text,
+        priority='normal', # Default
+        parent_category=CATEGORY_HOME, # Default to Home
+        sub_category_id=None, # 'כללי'
+        reminder_time=None,
+        status='pending',
+        is_shared=0
+    )
+    session.add(new_task)
+    record_task_created(session, new_task, created_at)
+    return new_task
+
+async def quick_add_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    text = update.message.text
+    if not text: return
+
+    chat_id = update.effective_chat.id
+    created_at = to_naive_israel(get_now())
+    queued = not _db_writable()
+    if not queued:
+        session = current_session()
+        try:
+            add_quick_task(session, chat_id, text, created_at)
+            ensure_user_preferences(session, chat_id)
+            # In before the reply; a commit lost to an outage is queued instead
+            commit_current()
+        except Exception as e:
+            session.rollback()
+            if not is_outage(e):
+                logger.error(f"Error quick add: {e}")
+                await update.message.reply_text("❌ שגיאה בהוספה מהירה")
+                return ConversationHandler.END
+            queued = True
+    if queued and not queue_quick_add(chat_id, text, created_at):
+        await update.message.reply_text(OFFLINE_MESSAGE)
+        return ConversationHandler.END
+
+    note = f"\n\n{OFFLINE_QUEUED_NOTE}" if queued else ""
+    await update.message.reply_text(f"✅ משימה מהירה נוספה: **{text}**{note}", parse_mode='Markdown')
+
+    # Optionally show dashboard again?
+    from src.bot.dashboard_handlers import dashboard_command
+    await dashboard_command(update, context)
+
+    return ConversationHandler.END
+
+# Median time-to-done labels, by completion bucket
+_BUCKET_LABELS = {
+    'obsessive': "פחות מ-5 שעות ⚡",
+    'normal': "5–48 שעות 🐌",
+    'procrastinator': "2–7 ימים 🐢",
+    'archeologist': "יותר משבוע 🏛️",
+}
+
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Completion statistics, read from the daily_stats rollups."""
+    from src.database.stats import get_streak, get_weekly_totals, get_median_bucket
+
+    session = current_session()
+    try:
+        chat_id = update.effective_chat.id
+        today = get_now().date()
+        streak = get_streak(session, chat_id, today)
+        weeks = get_weekly_totals(session, chat_id, today, weeks=4)
+        median = get_median_bucket(session, chat_id, today - timedelta(days=30))
+
+        msg = "📊 <b>סטטיסטיקה</b>\n\n"
+        msg += f"🔥 רצף ימים עם השלמות: <b>{streak}</b>\n\n"
+        msg += "📅 <b>השלמות לפי שבוע:</b>\n"
+        for week_start, completed in weeks:
+            msg += f"  {week_start.strftime('%d/%m')}: <b>{completed}</b>\n"
+        if median:
+            msg += f"\n⏱️ זמן חציוני עד סיום (30 יום): {_BUCKET_LABELS[median]}"
+        await update.message.reply_text(msg, parse_mode='HTML')
+    except Exception as e:
+        logger.error(f"Error building stats: {e}", exc_info=True)
+        await update.message.reply_text("❌ שגיאה בשליפת הסטטיסטיקה.")
+
+async def briefing_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/briefing — show the daily briefing settings.
+    /briefing HH:MM [Area/City] sets the time (and timezone); /briefing off disables it."""
+    from src.database.models import UserPreference
+    from src.scheduler.jobs import invalidate_briefing_timezones
+
+    # Validate first: nothing is written for a rejected command
+    args = context.args or []
+    if args:
+        if args[0].lower() == 'off':
+            minute = None
+        else:
+            m = re.match(r'^(\d{1,2}):(\d{2})$', args[0])
+            if not m or int(m.group(1)) > 23 or int(m.group(2)) > 59:
+                await update.message.reply_text("❌ פורמט לא תקין. שלח /briefing HH:MM [Area/City] או /briefing off")
+                return
+            minute = int(m.group(1)) * 60 + int(m.group(2))
+        if len(args) > 1:
+            try:
+                zoneinfo.ZoneInfo(args[1])
+            except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+                await update.message.reply_text(f"❌ אזור זמן לא מוכר: {args[1]}")
+                return
+
+    session = current_session()
+    try:
+        chat_id = update.effective_chat.id
+        ensure_user_preferences(session, chat_id)
+        pref = session.get(UserPreference, chat_id)
+        if args:
+            pref.briefing_minute = minute
+            if len(args) > 1:
+                pref.timezone = args[1]
+            after_commit(session, invalidate_briefing_timezones)
+        minute, timezone = pref.briefing_minute, pref.timezone
+        commit_current()
+
+        if minute is None:
+            when = "כבוי 🔕"
+        else:
+            when = f"{minute // 60:02d}:{minute % 60:02d}"
+        await update.message.reply_text(
+            f"☀️ <b>תדריך בוקר</b>: {when}\n"
+            f"🌍 אזור זמן: {timezone}\n\n"
+            "לשינוי: /briefing HH:MM [Area/City]\n"
+            "לכיבוי: /briefing off",
+            parse_mode='HTML'
+        )
+    except Exception as e:
+        session.rollback()
+        logger.error(f"Error updating briefing preferences: {e}", exc_info=True)
+        await update.message.reply_text("❌ שגיאה בעדכון ההגדרות.")
@@ -0,0 +1,98 @@
+import os
+import time
+import logging
+from telegram import Update
+from telegram.ext import ContextTypes, ApplicationHandlerStop
+
+logger = logging.getLogger(__name__)
+
+# Per-user token bucket: RATE_LIMIT_BURST updates at once, refilled at
+# RATE_LIMIT_PER_SECOND. Throttled updates never reach a handler (or the DB).
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", "8"))
+RATE_LIMIT_PER_SECOND = float(os.getenv("RATE_LIMIT_PER_SECOND", "1.5"))
+
+# Identical callback queries (same user, message and data) are dropped while
+# the first one is still queued or being handled. The update processor checks
+# this before an update waits for its chat (see concurrency.py), so a double
+# tap never runs twice. The TTL is a safety net in case a release is missed.
+INFLIGHT_TTL = 15.0
+
+# Buckets idle long enough to be full again carry no state and are pruned
+_MAX_BUCKETS = 10000
+
+class TokenBucket:
+    __slots__ = ('tokens', 'updated', 'notified')
+
+    def __init__(self, now):
+        self.tokens = float(RATE_LIMIT_BURST)
+        self.updated = now
+        self.notified = False  # already told the user they're throttled
+
+    def take(self, now) -> bool:
+        self.tokens = min(RATE_LIMIT_BURST, self.tokens + (now - self.updated) * RATE_LIMIT_PER_SECOND)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            self.notified = False
+            return True
+        return False
+
+_buckets = {}  # user_id -> TokenBucket
+_inflight = {}  # (user_id, message_id, data) -> expires_at
+
+def _prune(now):
+    refill_time = RATE_LIMIT_BURST / RATE_LIMIT_PER_SECOND
+    for user_id in [u for u, b in _buckets.items() if now - b.updated > refill_time]:
+        del _buckets[user_id]
+    for key in [k for k, exp in _inflight.items() if exp <= now]:
+        del _inflight[key]
+
+def _inflight_key(update: Update):
+    query = update.callback_query
+    message_id = query.message.message_id if query.message else None
+    return (update.effective_user.id, message_id, query.data)
+
+def claim_callback(update) -> bool:
+    """Marks a callback query in flight. False if an identical one already is
+    (the caller drops it); True for anything that isn't a callback query."""
+    if not isinstance(update, Update) or update.callback_query is None or update.effective_user is None:
+        return True
+    now = time.monotonic()
+    key = _inflight_key(update)
+    expires = _inflight.get(key)
+    if expires is not None and expires > now:
+        return False
+    if len(_inflight) >= _MAX_BUCKETS:
+        _prune(now)
+    _inflight[key] = now + INFLIGHT_TTL
+    return True
+
+def release_callback(update):
+    """The claimed callback query is done."""
+    if isinstance(update, Update) and update.callback_query is not None and update.effective_user is not None:
+        _inflight.pop(_inflight_key(update), None)
+
+async def rate_limit_gate(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Runs right after auth_gate. Stops over-quota updates, answering
+    callbacks without touching the database."""
+    user = update.effective_user
+    if user is None:
+        return
+    now = time.monotonic()
+    query = update.callback_query
+
+    bucket = _buckets.get(user.id)
+    if bucket is None:
+        if len(_buckets) >= _MAX_BUCKETS:
+            _prune(now)
+        bucket = _buckets[user.id] = TokenBucket(now)
+
+    if not bucket.take(now):
+        if not bucket.notified:
+            logger.warning(f"Rate limiting user {user.id}")
+        if query is not None:
+            await query.answer("⏳ לאט לאט... נסה שוב בעוד רגע")
+        elif update.message and not bucket.notified:
+            await update.message.reply_text("⏳ יותר מדי בקשות. נסה שוב בעוד רגע.")
+        bucket.notified = True
+        raise ApplicationHandlerStop()
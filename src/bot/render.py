@@ -0,0 +1,97 @@
+import logging
+from collections import OrderedDict
+from functools import partial
+from telegram.error import BadRequest
+from src.database.cache_bus import on_event
+
+logger = logging.getLogger(__name__)
+
+# (chat_id, message_id) -> (text hash, markup hash) of what the message shows
+# now, most recently used last. Bounded: a forgotten message just gets one
+# full edit the next time.
+RENDER_CACHE_SIZE = 2048
+_rendered = OrderedDict()
+
+def _fingerprint(text, reply_markup, parse_mode):
+    return hash((text, parse_mode)), hash(reply_markup)
+
+def _remember(key, fingerprint):
+    _rendered[key] = fingerprint
+    _rendered.move_to_end(key)
+    while len(_rendered) > RENDER_CACHE_SIZE:
+        _rendered.popitem(last=False)
+
+@on_event('chat')
+def _forget_chat(chat_id):
+    # Another instance may have edited this chat's messages
+    if chat_id is None:
+        _rendered.clear()
+        return
+    for key in [k for k in _rendered if k[0] == chat_id]:
+        _rendered.pop(key, None)
+
+def _is_not_modified(error):
+    return "message is not modified" in error.message.lower()
+
+async def _edit(key, text, reply_markup, parse_mode, edit_text, edit_markup):
+    """Edits a message only as far as its content actually changed.
+
+    Identical content is skipped; when only the keyboard differs just the
+    markup is sent. Returns True if an edit request went out.
+    """
+    new = _fingerprint(text, reply_markup, parse_mode)
+    old = _rendered.get(key)
+    if old == new:
+        _rendered.move_to_end(key)
+        return False
+    try:
+        if old is not None and old[0] == new[0]:
+            await edit_markup(reply_markup=reply_markup)
+        else:
+            await edit_text(text, reply_markup=reply_markup, parse_mode=parse_mode)
+    except BadRequest as e:
+        if not _is_not_modified(e):
+            _rendered.pop(key, None)
+            raise
+    _remember(key, new)
+    return True
+
+async def edit_view(query, text, reply_markup=None, parse_mode=None):
+    """Drop-in for query.edit_message_text() that skips no-op edits."""
+    message = query.message
+    if message is None:  # inline-mode message — nothing to key on
+        return await query.edit_message_text(text, reply_markup=reply_markup, parse_mode=parse_mode)
+    return await _edit((message.chat_id, message.message_id), text, reply_markup, parse_mode,
+                       query.edit_message_text, query.edit_message_reply_markup)
+
+async def edit_view_by_id(bot, chat_id, message_id, text, reply_markup=None, parse_mode=None):
+    """Same as edit_view, for a message addressed by id (e.g. from a job)."""
+    return await _edit((chat_id, message_id), text, reply_markup, parse_mode,
+                       partial(bot.edit_message_text, chat_id=chat_id, message_id=message_id),
+                       partial(bot.edit_message_reply_markup, chat_id=chat_id, message_id=message_id))
+
+async def edit_markup(query, reply_markup=None):
+    """Drop-in for query.edit_message_reply_markup(); keeps the text hash."""
+    message = query.message
+    if message is None:
+        return await query.edit_message_reply_markup(reply_markup=reply_markup)
+    key = (message.chat_id, message.message_id)
+    old = _rendered.get(key)
+    if old is not None and old[1] == hash(reply_markup):
+        return False
+    try:
+        await query.edit_message_reply_markup(reply_markup=reply_markup)
+    except BadRequest as e:
+        if not _is_not_modified(e):
+            _rendered.pop(key, None)
+            raise
+    if old is not None:
+        _remember(key, (old[0], hash(reply_markup)))
+    return True
+
+async def send_view(message, text, reply_markup=None, parse_mode=None):
+    """message.reply_text() that records the sent content, so later edits of
+    the new message can be diffed against it."""
+    sent = await message.reply_text(text, reply_markup=reply_markup, parse_mode=parse_mode)
+    _remember((sent.chat_id, sent.message_id), _fingerprint(text, reply_markup, parse_mode))
+    return sent
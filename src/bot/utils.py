@@ -1,52 +1,100 @@
-import os
-from datetime import datetime, timezone
-import zoneinfo
-
-ISRAEL_TZ = zoneinfo.ZoneInfo("Asia/Jerusalem")
-
-def get_now() -> datetime:
-    """Returns the current time in Israel timezone."""
-    return datetime.now(ISRAEL_TZ)
-
-def to_naive_israel(dt: datetime) -> datetime:
-    """Converts a timezone-aware datetime to a naive datetime in Israel time (for DB storage)."""
-    if dt.tzinfo is None:
-        return dt # Assume already naive
-    return dt.astimezone(ISRAEL_TZ).replace(tzinfo=None)
-
-def _load_allowed_users():
-    raw = os.getenv("ALLOWED_USERS", "")
-    if not raw.strip():
-        return None  # None means no restriction (backwards compatible)
-    return set(int(uid.strip()) for uid in raw.split(",") if uid.strip())
-
-ALLOWED_USERS = _load_allowed_users()
-
-def is_user_allowed(user_id: int) -> bool:
-    """Returns True if the user is in the whitelist, or if no whitelist is configured."""
-    if ALLOWED_USERS is None:
-        return True
-    return user_id in ALLOWED_USERS
-
-def get_accessible_filter(chat_id):
-    """Returns a SQLAlchemy filter for tasks accessible to a user:
-    own tasks OR shared Home tasks."""
-    from sqlalchemy import or_, and_
-    from src.database.models import Task
-    return or_(
-        Task.chat_id == chat_id,
-        and_(Task.is_shared == 1, Task.parent_category == 'home')
-    )
-
-def get_accessible_task(session, task_id, chat_id):
-    """Fetches a task by ID if the user owns it or it's a shared Home task.
-    Returns the task or None."""
-    from sqlalchemy import or_, and_
-    from src.database.models import Task
-    return session.query(Task).filter(
-        Task.id == task_id,
-        or_(
-            Task.chat_id == chat_id,
-            and_(Task.is_shared == 1, Task.parent_category == 'home')
-        )
-    ).first()
+import os
+from datetime import datetime, timezone
+import zoneinfo
+
+ISRAEL_TZ = zoneinfo.ZoneInfo("Asia/Jerusalem")
+
+def get_now() -> datetime:
+    """Returns the current time in Israel timezone."""
+    return datetime.now(ISRAEL_TZ)
+
+def to_naive_israel(dt: datetime) -> datetime:
+    """Converts a timezone-aware datetime to a naive datetime in Israel time (for DB storage)."""
+    if dt.tzinfo is None:
+        return dt # Assume already naive
+    return dt.astimezone(ISRAEL_TZ).replace(tzinfo=None)
+
+def _load_user_ids(var):
+    raw = os.getenv(var, "")
+    if not raw.strip():
+        return None  # None means not configured
+    return set(int(uid.strip()) for uid in raw.split(",") if uid.strip())
+
+# Seeds for the allowed_users table (see src/bot/auth.py). ALLOWED_USERS only
+# seeds an empty allowlist; ADMIN_USERS are re-ensured on every start.
+ALLOWED_USERS = _load_user_ids("ALLOWED_USERS")
+ADMIN_USERS = _load_user_ids("ADMIN_USERS")
+
+def get_accessible_filter(chat_id):
+    """Returns a SQLAlchemy filter for tasks accessible to a user:
+    own tasks OR Home tasks shared in one of the user's households."""
+    from sqlalchemy import or_, and_
+    from src.database.models import Task
+    from src.database.households import household_ids_select
+    return or_(
+        Task.chat_id == chat_id,
+        and_(Task.household_id.in_(household_ids_select(chat_id)), Task.parent_category == 'home')
+    )
+
+def get_accessible_task(session, task_id, chat_id):
+    """Fetches a task by ID if the user owns it or it's a Home task shared in
+    one of the user's households. Returns the task or None."""
+    from src.database.queries import ACCESSIBLE_TASK
+    return session.execute(ACCESSIBLE_TASK, {"task_id": task_id, "chat_id": chat_id}).scalars().first()
+
+def get_pending_tasks(session, chat_id):
+    """Pending tasks accessible to a user (read_models.PendingTask rows),
+    ordered by priority then id. Served from the in-memory task index when
+    it's enabled, else from `session`.
+
+    While the database is unreachable this returns the chat's last snapshot
+    (a degraded.Snapshot — see degraded.stale_banner), or raises
+    DatabaseUnavailable if there is none.
+    """
+    from src.database import degraded
+    from src.database.task_index import pending_for_chat
+    if degraded.db_available():
+        try:
+            # Offline writes go first, so the view doesn't undo them
+            degraded.replay_queued_writes()
+            # Handlers commit their writes before rendering (unit_of_work), which
+            # updates the index; changes flushed but not committed yet aren't in
+            # it, so those are read through the session
+            uncommitted = "task_index" in session.info
+            tasks = pending_for_chat(chat_id) if not uncommitted else None
+            if tasks is None:
+                from src.database.read_models import PendingTask
+                from src.database.queries import PENDING_TASKS
+                tasks = [PendingTask._make(row) for row in session.execute(PENDING_TASKS, {"chat_id": chat_id})]
+            degraded.remember(chat_id, tasks)
+            return tasks
+        except Exception as e:
+            if not degraded.is_outage(e):
+                raise
+            session.rollback()
+    tasks = degraded.snapshot(chat_id)
+    if tasks is None:
+        raise degraded.DatabaseUnavailable(f"no snapshot for chat {chat_id}")
+    return tasks
+
+def find_task(session, chat_id, task_id):
+    """A task to display: from the task index, else `session`. While the
+    database is unreachable it comes from the chat's snapshot (so only
+    pending tasks are found). Returns None if it isn't accessible."""
+    from src.database import degraded
+    from src.database.task_index import find_pending_task
+    task_id = degraded.real_task_id(task_id)
+    if task_id > 0 and degraded.db_available():
+        try:
+            task = find_pending_task(chat_id, task_id)
+            if task is None:
+                from src.database.read_models import PendingTask
+                from src.database.queries import ACCESSIBLE_TASK_ROW
+                row = session.execute(ACCESSIBLE_TASK_ROW, {"task_id": task_id, "chat_id": chat_id}).first()
+                task = PendingTask._make(row) if row else None
+            return task
+        except Exception as e:
+            if not degraded.is_outage(e):
+                raise
+            session.rollback()
+    return degraded.snapshot_task(chat_id, task_id)
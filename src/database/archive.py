@@ -0,0 +1,54 @@
+import logging
+import time
+from datetime import timedelta
+from sqlalchemy import select, insert, delete, literal
+from src.database.core import SessionLocal
+from src.database.models import Task, TaskArchive
+from src.database.cache_bus import invalidate_chat
+
+logger = logging.getLogger(__name__)
+
+# Columns copied verbatim from tasks into tasks_archive (DB column names)
+_ARCHIVED_COLUMNS = [c.name for c in Task.__table__.columns]
+
+def archive_done_tasks(older_than: timedelta, now_naive, batch_size=200, max_batches=50, pause=0.1):
+    """Moves tasks done before `now_naive - older_than` into tasks_archive.
+
+    Each batch is one short transaction (copy + delete), so the hot table is
+    never locked for long. Stops after `max_batches` to bound a single run;
+    the next run picks up where this one left off. Returns rows moved.
+    """
+    cutoff = now_naive - older_than
+    moved = 0
+    for _ in range(max_batches):
+        session = SessionLocal()
+        try:
+            rows = session.query(Task.id, Task.chat_id, Task.household_id).filter(
+                Task.status == 'done',
+                Task.completed_at < cutoff
+            ).order_by(Task.id).limit(batch_size).all()
+            if not rows:
+                break
+            ids = [row[0] for row in rows]
+
+            source = Task.__table__
+            session.execute(
+                insert(TaskArchive.__table__).from_select(
+                    _ARCHIVED_COLUMNS + ['archived_at'],
+                    select(*[source.c[name] for name in _ARCHIVED_COLUMNS], literal(now_naive))
+                    .where(source.c.id.in_(ids))
+                )
+            )
+            session.execute(delete(source).where(source.c.id.in_(ids)))
+            for chat_id, household_id in {row[1:] for row in rows}:
+                invalidate_chat(session, chat_id, household_id)
+            session.commit()
+            moved += len(ids)
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Archive batch failed after {moved} tasks: {e}", exc_info=True)
+            break
+        finally:
+            session.close()
+        time.sleep(pause)
+    return moved
@@ -0,0 +1,252 @@
+import os
+import time
+import uuid
+import logging
+from sqlalchemy import event, inspect, text, insert, delete, select, func
+from sqlalchemy.orm import Session
+from src.database.core import engine, DATABASE_URL, SessionLocal
+from src.database.models import (
+    Task, SubCategory, HouseholdMember, UserPreference, AllowedUser, CacheEvent
+)
+
+logger = logging.getLogger(__name__)
+
+# Cross-process cache invalidation. Every commit that touches cached data
+# publishes one compact event in the same transaction — NOTIFY on PostgreSQL,
+# a cache_events row on SQLite — and every instance polls the bus and evicts
+# what other instances changed. Needed once more than one process writes to
+# the same database; opt-in so a single instance pays nothing.
+#
+# On Neon, LISTEN needs a direct (non-pooled) connection string.
+CACHE_BUS_ENABLED = os.getenv("CACHE_BUS_ENABLED", "0") == "1"
+CACHE_BUS_POLL_SECONDS = float(os.getenv("CACHE_BUS_POLL_SECONDS", "2"))
+CACHE_EVENTS_RETENTION_HOURS = int(os.getenv("CACHE_EVENTS_RETENTION_HOURS", "24"))
+
+CHANNEL = "tli_cache"
+_IS_POSTGRES = not DATABASE_URL.startswith("sqlite")
+_MAX_PAYLOAD = 7000  # NOTIFY payloads must stay under 8000 bytes
+
+# Payload: "<origin> c:<chat_id> h:<household_id> k:<category_id> a:<user_id>";
+# "*" alone means "evict everything". Scopes by code:
+_SCOPES = {'c': 'chat', 'h': 'household', 'k': 'category', 'a': 'auth'}
+_CODES = {v: k for k, v in _SCOPES.items()}
+
+ORIGIN = uuid.uuid4().hex[:12]  # this process; its own events are skipped
+_EVICT_ALL = ('*', None)
+
+_handlers = {scope: [] for scope in _SCOPES.values()}
+
+def on_event(scope):
+    """Registers `fn(key)` to run when another instance changes `scope` data.
+    key None means "everything in this scope" (e.g. events were missed)."""
+    def register(fn):
+        _handlers[scope].append(fn)
+        return fn
+    return register
+
+def _dispatch(scope, key):
+    for fn in _handlers[scope]:
+        try:
+            fn(key)
+        except Exception as e:
+            logger.warning(f"Cache bus: {scope} handler {fn.__name__} failed for {key}: {e}")
+
+def evict_all():
+    for scope in _handlers:
+        _dispatch(scope, None)
+
+def _events_for(obj):
+    # Read loaded state only: a deleted row can't be refreshed
+    values = inspect(obj).dict
+    if isinstance(obj, Task):
+        yield 'household', values.get('household_id')
+        yield 'chat', values.get('chat_id')
+    elif isinstance(obj, SubCategory):
+        yield 'category', values.get('id')
+        yield 'household', values.get('household_id')
+        yield 'chat', values.get('chat_id')
+    elif isinstance(obj, HouseholdMember):
+        yield 'household', values.get('household_id')
+        yield 'chat', values.get('chat_id')
+    elif isinstance(obj, UserPreference):
+        yield 'chat', values.get('chat_id')
+    elif isinstance(obj, AllowedUser):
+        yield 'auth', values.get('user_id')
+
+def encode(events):
+    """Payload for a set of (scope, key) events."""
+    if _EVICT_ALL in events:
+        return f"{ORIGIN} *"
+    payload = " ".join([ORIGIN] + sorted(f"{_CODES[scope]}:{key}" for scope, key in events))
+    return payload if len(payload) <= _MAX_PAYLOAD else f"{ORIGIN} *"
+
+def _receive(payload):
+    """Applies one payload. Returns False for this process's own events."""
+    origin, _, body = payload.partition(" ")
+    if origin == ORIGIN:
+        return False
+    if body == "*":
+        evict_all()
+        return True
+    for item in body.split():
+        code, _, key = item.partition(":")
+        if code in _SCOPES:
+            _dispatch(_SCOPES[code], int(key))
+    return True
+
+# --- Publishing ----------------------------------------------------------------
+
+@event.listens_for(Session, "after_flush")
+def _collect(session, flush_context):
+    if not CACHE_BUS_ENABLED:
+        return
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        for item in _events_for(obj):
+            if item[1] is not None:
+                session.info.setdefault("cache_events", set()).add(item)
+
+@event.listens_for(Session, "before_commit")
+def _publish(session):
+    if not CACHE_BUS_ENABLED:
+        return
+    session.flush()  # the commit's own flush comes after this hook
+    events = session.info.pop("cache_events", None)
+    if not events:
+        return
+    payload = encode(events)
+    # Same transaction as the change: delivered on commit, gone on rollback
+    if _IS_POSTGRES:
+        session.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": CHANNEL, "payload": payload})
+    else:
+        from src.database.outbox import utc_now_naive
+        session.execute(insert(CacheEvent).values(payload=payload, created_at=utc_now_naive()))
+
+@event.listens_for(Session, "after_rollback")
+def _discard(session):
+    session.info.pop("cache_events", None)
+
+# Bulk Core statements (insert/update/delete on the table) bypass the flush
+# hooks above: their callers publish explicitly.
+
+def invalidate_chat(session, chat_id, household_id=None):
+    """Publishes, with `session`'s commit, a change to `chat_id`'s data (and
+    the household's, if given) that the ORM didn't see."""
+    if not CACHE_BUS_ENABLED:
+        return
+    events = session.info.setdefault("cache_events", set())
+    events.add(('chat', chat_id))
+    if household_id is not None:
+        events.add(('household', household_id))
+
+def invalidate_all(session):
+    """Publishes, with `session`'s commit, "evict everything"."""
+    if CACHE_BUS_ENABLED:
+        session.info.setdefault("cache_events", set()).add(_EVICT_ALL)
+
+def publish_evict_all(session_factory=SessionLocal):
+    """Tells the other instances to drop every cache, after bulk statements
+    whose rows can't be listed."""
+    if not CACHE_BUS_ENABLED:
+        return
+    session = session_factory()
+    try:
+        invalidate_all(session)
+        session.commit()
+    finally:
+        session.close()
+
+# --- Subscribing ---------------------------------------------------------------
+
+_listener = {'conn': None, 'last_id': None, 'last_poll': None, 'listened': False}
+
+def _listen():
+    raw = engine.raw_connection()
+    raw.detach()  # held for the process lifetime, outside the pool
+    conn = raw.driver_connection
+    conn.autocommit = True
+    with conn.cursor() as cursor:
+        cursor.execute(f"LISTEN {CHANNEL}")
+    return conn
+
+def _poll_postgres():
+    conn = _listener['conn']
+    if conn is None:
+        _listener['conn'] = _listen()
+        logger.info(f"Cache bus: listening on '{CHANNEL}' (origin {ORIGIN})")
+        if _listener['listened']:
+            evict_all()  # reconnected: whatever was sent meanwhile is lost
+        _listener['listened'] = True
+        return []
+    conn.poll()
+    payloads = [n.payload for n in conn.notifies]
+    conn.notifies.clear()
+    return payloads
+
+def _poll_table():
+    session = SessionLocal()
+    try:
+        if _listener['last_id'] is None:
+            _listener['last_id'] = session.execute(select(func.max(CacheEvent.id))).scalar() or 0
+            return []
+        rows = session.execute(
+            select(CacheEvent.id, CacheEvent.payload).where(CacheEvent.id > _listener['last_id']).order_by(CacheEvent.id)
+        ).all()
+    finally:
+        session.close()
+    if rows:
+        _listener['last_id'] = rows[-1][0]
+    return [payload for _, payload in rows]
+
+def poll():
+    """Applies events published by other instances since the last call.
+    Returns how many were applied. Any gap (lost LISTEN connection, a
+    stall longer than the table retention) evicts every cache instead."""
+    now = time.monotonic()
+    last_poll, _listener['last_poll'] = _listener['last_poll'], now
+    if last_poll is not None and now - last_poll > CACHE_EVENTS_RETENTION_HOURS * 3600:
+        logger.warning("Cache bus: poll gap exceeds event retention — evicting all caches")
+        evict_all()
+    try:
+        payloads = _poll_postgres() if _IS_POSTGRES else _poll_table()
+    except Exception as e:
+        logger.warning(f"Cache bus: poll failed, evicting all caches and reconnecting: {e}")
+        if _listener['conn'] is not None:
+            try:
+                _listener['conn'].close()
+            except Exception:
+                pass
+        _listener['conn'] = None
+        evict_all()
+        return 0
+    return sum(_receive(payload) for payload in payloads)
+
+def prune_events(session_factory, cutoff):
+    """Deletes cache_events rows created before `cutoff` (naive UTC)."""
+    session = session_factory()
+    try:
+        result = session.execute(delete(CacheEvent).where(CacheEvent.created_at < cutoff))
+        session.commit()
+        return result.rowcount or 0
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+# --- Handlers for caches in modules below this one ---------------------------
+
+@on_event('category')
+def _evict_category(key):
+    from src.database.core import _category_cache
+    if key is None:
+        _category_cache.clear()
+    else:
+        _category_cache.pop(key, None)
+
+@on_event('chat')
+def _evict_preferences(key):
+    from src.database.core import _known_preference_chats
+    if key is None:
+        _known_preference_chats.clear()
+    else:
+        _known_preference_chats.discard(key)
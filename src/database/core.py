@@ -1,85 +1,181 @@
-import os
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
-from src.database.models import Base, SubCategory
-
-# Get DB URL from env or use sqlite local fallback
-DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./tasks.db")
-
-# Fix for some cloud providers (like Heroku/Render) that use 'postgres://' instead of 'postgresql://'
-if DATABASE_URL.startswith("postgres://"):
-    DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
-
-connect_args = {}
-engine_kwargs = {}
-
-if DATABASE_URL.startswith("sqlite"):
-    connect_args = {"check_same_thread": False}
-else:
-    # PostgreSQL (Neon serverless) resilience
-    connect_args = {"connect_timeout": 10}
-    engine_kwargs = {
-        "pool_pre_ping": True,    # test connection before use — auto-reconnects stale ones
-        "pool_recycle": 300,      # recycle every 5 min (before Neon idle timeout)
-        "pool_size": 5,
-        "pool_timeout": 30,
-    }
-
-engine = create_engine(DATABASE_URL, connect_args=connect_args, **engine_kwargs)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-# Configure JobStore for APScheduler
-jobstores = {
-    'default': SQLAlchemyJobStore(engine=engine)
-}
-
-DEFAULT_CATEGORIES = [
-    # Home
-    ("קניות 🛒", "home"),
-    ("תחזוקה 🔧", "home"),
-    ("ניקיון 🧹", "home"),
-    ("אחר 📂", "home"),
-    # Work
-    ("מיילים 📧", "work"),
-    ("פגישות 📅", "work"),
-    ("פרויקטים 📊", "work"),
-    ("אחר 📂", "work"),
-]
-
-SHARED_HOME_CATEGORIES = [
-    ("קניות 🛒", "home"),
-    ("תחזוקה 🔧", "home"),
-    ("ניקיון 🧹", "home"),
-    ("אחר 📂", "home"),
-]
-
-def init_db():
-    Base.metadata.create_all(bind=engine)
-    session = SessionLocal()
-    try:
-        ensure_shared_categories(session)
-    finally:
-        session.close()
-
-def ensure_user_categories(session, chat_id: int):
-    """Seeds default categories for a user if they have none yet."""
-    count = session.query(SubCategory).filter(SubCategory.chat_id == chat_id).count()
-    if count == 0:
-        defaults = [
-            SubCategory(name=name, parent=parent, chat_id=chat_id, is_active=1)
-            for name, parent in DEFAULT_CATEGORIES
-        ]
-        session.add_all(defaults)
-        session.commit()
-
-def ensure_shared_categories(session):
-    """Seeds shared Home sub-categories (chat_id=0 sentinel) if they don't exist yet."""
-    count = session.query(SubCategory).filter(SubCategory.chat_id == 0).count()
-    if count == 0:
-        defaults = [
-            SubCategory(name=name, parent=parent, chat_id=0, is_active=1)
-            for name, parent in SHARED_HOME_CATEGORIES
-        ]
-        session.add_all(defaults)
-        session.commit()
+import os
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+from src.database.models import Base, SubCategory, UserPreference
+
+# Get DB URL from env or use sqlite local fallback
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./tasks.db")
+
+# Fix for some cloud providers (like Heroku/Render) that use 'postgres://' instead of 'postgresql://'
+if DATABASE_URL.startswith("postgres://"):
+    DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
+
+# Concurrency the pool has to serve: bot handlers running at once (see
+# bot.concurrency) plus scheduler worker threads, each holding at most one
+# connection, plus one for the scheduler's job store and startup work.
+MAX_CONCURRENT_UPDATES = max(1, int(os.getenv("MAX_CONCURRENT_UPDATES", "4")))
+SCHEDULER_THREADS = max(1, int(os.getenv("SCHEDULER_THREADS", "4")))
+POOL_SIZE = MAX_CONCURRENT_UPDATES + SCHEDULER_THREADS + 1
+
+connect_args = {}
+engine_kwargs = {}
+
+if DATABASE_URL.startswith("sqlite"):
+    from src.database.sqlite_mode import SQLITE_BUSY_TIMEOUT
+    connect_args = {"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT}
+else:
+    # PostgreSQL (Neon serverless) resilience
+    connect_args = {"connect_timeout": 10}
+    engine_kwargs = {
+        # Pinging on checkout auto-reconnects stale connections; can be turned
+        # off when DB_KEEPALIVE keeps the compute (and the pool) warm
+        "pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "1") == "1",
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "300")),  # before Neon's idle timeout
+        "pool_size": POOL_SIZE,
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "2")),
+        "pool_timeout": 30,
+        # Reuse the most recently returned connection: under light load the
+        # same few connections stay warm and the rest age out via recycle
+        "pool_use_lifo": True,
+    }
+
+engine = create_engine(DATABASE_URL, connect_args=connect_args, **engine_kwargs)
+if DATABASE_URL.startswith("sqlite"):
+    from src.database.sqlite_mode import configure_sqlite
+    configure_sqlite(engine)  # WAL, pragmas, single-writer lock
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Optional read replica for view queries (see database/routing.py). Same pool
+# settings as the primary; None when not configured.
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL")
+if DATABASE_READ_URL and DATABASE_READ_URL.startswith("postgres://"):
+    DATABASE_READ_URL = DATABASE_READ_URL.replace("postgres://", "postgresql://", 1)
+read_engine = create_engine(DATABASE_READ_URL, connect_args=connect_args, **engine_kwargs) if DATABASE_READ_URL else None
+
+# Configure JobStore for APScheduler
+jobstores = {
+    'default': SQLAlchemyJobStore(engine=engine)
+}
+
+def pool_stats():
+    """Current pool usage: configured size, open/idle/in-use connections and overflow."""
+    pool = engine.pool
+    stats = {"pool": type(pool).__name__}
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        if hasattr(pool, name):
+            stats[name] = getattr(pool, name)()
+    return stats
+
+def warm_pool(connections=None):
+    """Opens `connections` (at most, and by default, the pool size) connections
+    at once and returns them to the pool, so a coming burst finds them ready
+    instead of connecting (and waking Neon) on demand. Returns the number opened."""
+    size = getattr(engine.pool, "size", lambda: 1)()
+    wanted = min(connections or size, size)
+    opened = []
+    try:
+        for _ in range(wanted):
+            conn = engine.connect()
+            opened.append(conn)
+            conn.execute(text("SELECT 1"))
+    finally:
+        for conn in opened:
+            conn.close()
+    return len(opened)
+
+def ping_db():
+    """Single round-trip on one pooled connection (keeps serverless compute awake)."""
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+
+DEFAULT_CATEGORIES = [
+    # Home
+    ("קניות 🛒", "home"),
+    ("תחזוקה 🔧", "home"),
+    ("ניקיון 🧹", "home"),
+    ("אחר 📂", "home"),
+    # Work
+    ("מיילים 📧", "work"),
+    ("פגישות 📅", "work"),
+    ("פרויקטים 📊", "work"),
+    ("אחר 📂", "work"),
+]
+
+SHARED_HOME_CATEGORIES = [
+    ("קניות 🛒", "home"),
+    ("תחזוקה 🔧", "home"),
+    ("ניקיון 🧹", "home"),
+    ("אחר 📂", "home"),
+]
+
+def init_db():
+    Base.metadata.create_all(bind=engine)
+
+def ensure_user_categories(session, chat_id: int):
+    """Seeds default categories for a user if they have none yet. Flushes the
+    new rows (their ids go on buttons) but does not commit."""
+    count = session.query(SubCategory).filter(SubCategory.chat_id == chat_id).count()
+    if count == 0:
+        defaults = [
+            SubCategory(name=name, parent=parent, chat_id=chat_id, is_active=1)
+            for name, parent in DEFAULT_CATEGORIES
+        ]
+        session.add_all(defaults)
+        session.flush()
+
+# Name shown for tasks without a sub-category (sub_category_id IS NULL)
+GENERAL_CATEGORY_NAME = "כללי"
+
+# SubCategory id -> (name, chat_id, parent, household_id). Categories are never
+# renamed and only soft-deleted (is_active=0), so cached rows don't go stale.
+_category_cache = {}
+
+def get_categories(session, category_ids):
+    """Returns {id: (name, chat_id, parent, household_id)} for the given ids, hitting the DB
+    only for ids not cached yet. Unknown ids are left out."""
+    missing = {cid for cid in category_ids if cid is not None and cid not in _category_cache}
+    if missing:
+        from src.database.degraded import best_effort
+        # During an outage, uncached ids are simply left out (shown as GENERAL_CATEGORY_NAME)
+        rows = best_effort(lambda: session.query(
+            SubCategory.id, SubCategory.name, SubCategory.chat_id, SubCategory.parent, SubCategory.household_id
+        ).filter(SubCategory.id.in_(missing)).all()) or []
+        for cid, name, chat_id, parent, household_id in rows:
+            _category_cache[cid] = (name, chat_id, parent, household_id)
+    return {cid: _category_cache[cid] for cid in category_ids if cid in _category_cache}
+
+def get_category_names(session, category_ids):
+    """Returns {id: display name}; None (and unknown ids) map to GENERAL_CATEGORY_NAME."""
+    found = get_categories(session, category_ids)
+    return {cid: found[cid][0] if cid in found else GENERAL_CATEGORY_NAME for cid in category_ids}
+
+# Chats known to have a user_preferences row (saves a lookup per task write)
+_known_preference_chats = set()
+
+def ensure_user_preferences(session, chat_id: int):
+    """Creates default preferences (09:35 Asia/Jerusalem briefing) for a chat
+    that has none yet. Flushes a new row (so a second call in the same unit
+    of work finds it) but does not commit."""
+    if chat_id in _known_preference_chats:
+        return
+    if session.get(UserPreference, chat_id) is None:
+        from src.database.unit_of_work import after_commit
+        session.add(UserPreference(chat_id=chat_id))
+        session.flush()
+        after_commit(session, _known_preference_chats.add, chat_id)
+        return
+    _known_preference_chats.add(chat_id)
+
+def seed_user_preferences(session, chat_ids):
+    """Adds default preferences for every given chat and every task owner
+    that doesn't have a row yet (startup backfill)."""
+    from src.database.models import Task
+    wanted = set(chat_ids or ()) | {row[0] for row in session.query(Task.chat_id).distinct()}
+    existing = {row[0] for row in session.query(UserPreference.chat_id)}
+    missing = wanted - existing
+    if missing:
+        session.add_all(UserPreference(chat_id=chat_id) for chat_id in missing)
+        session.commit()
+    _known_preference_chats.update(wanted)
+    return len(missing)
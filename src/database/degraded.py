@@ -0,0 +1,255 @@
+import os
+import re
+import time
+import logging
+import threading
+from collections import OrderedDict
+from sqlalchemy import event
+from sqlalchemy.exc import DBAPIError, OperationalError, TimeoutError as PoolTimeoutError
+from src.database.core import engine, read_engine, SessionLocal
+from src.database.read_models import PendingTask
+
+logger = logging.getLogger(__name__)
+
+# Degraded read-only mode. A circuit breaker watches the primary engine:
+# DB_CIRCUIT_FAILURES consecutive connection failures open it, and while it
+# is open handlers don't wait on the database at all. Views are served from
+# the last pending-task snapshot of the chat (marked stale), and a few writes
+# (done, quick add, snooze) are queued in memory and replayed in order once
+# the database answers again. The queue is per process: a restart during an
+# outage loses it. The read replica (DATABASE_READ_URL) has a circuit of its
+# own: while it is open, RoutingSession sends reads to the primary.
+DB_CIRCUIT_FAILURES = int(os.getenv("DB_CIRCUIT_FAILURES", "3"))
+DB_CIRCUIT_COOLDOWN = float(os.getenv("DB_CIRCUIT_COOLDOWN", "15"))  # seconds between probes
+SNAPSHOT_MAX_CHATS = int(os.getenv("SNAPSHOT_MAX_CHATS", "1000"))
+OFFLINE_QUEUE_MAX = int(os.getenv("OFFLINE_QUEUE_MAX", "500"))
+
+class DatabaseUnavailable(Exception):
+    """The database is down and there is nothing cached to fall back on."""
+
+# --- Circuit breaker -----------------------------------------------------------
+
+_circuit = {'name': 'DB', 'failures': 0, 'opened_at': None}
+_replica_circuit = {'name': 'Replica', 'failures': 0, 'opened_at': None}
+
+# Driver messages of an OperationalError that mean the server can't be
+# reached (refused, unresolvable, connect timeout, dropped session, Neon
+# compute suspended). Anything else — "database is locked", a statement
+# timeout, a serialization failure — is a slow or failed statement.
+_OUTAGE_MESSAGES = re.compile(
+    r"could not connect|couldn't connect|connection refused|connection timed out|timeout expired"
+    r"|could not translate host name|name or service not known|no route to host"
+    r"|server closed the connection|terminating connection|connection already closed"
+    r"|ssl syscall error|the database system is (starting up|shutting down)"
+    r"|compute .*suspended|endpoint .*(disabled|suspended)|unable to open database file",
+    re.IGNORECASE,
+)
+
+def is_outage(error):
+    """True for errors that mean "can't reach the database" (as opposed to
+    a bad statement, a lock wait or a constraint violation)."""
+    if isinstance(error, (DatabaseUnavailable, PoolTimeoutError)):
+        return True
+    if isinstance(error, DBAPIError):
+        if error.connection_invalidated:
+            return True
+        return isinstance(error, OperationalError) and bool(_OUTAGE_MESSAGES.search(str(error.orig)))
+    return False
+
+def db_available(circuit=_circuit):
+    """False while the circuit is open. DB_CIRCUIT_COOLDOWN after it opened,
+    callers are let through again (half-open): the first success closes
+    the circuit, the first failure re-opens it for another cooldown."""
+    opened_at = circuit['opened_at']
+    return opened_at is None or time.monotonic() - opened_at >= DB_CIRCUIT_COOLDOWN
+
+def replica_available():
+    return db_available(_replica_circuit)
+
+def record_failure(circuit=_circuit):
+    circuit['failures'] += 1
+    if circuit['failures'] >= DB_CIRCUIT_FAILURES:
+        if circuit['opened_at'] is None:
+            logger.warning(f"{circuit['name']} circuit open after {circuit['failures']} connection failures")
+        circuit['opened_at'] = time.monotonic()
+
+def record_success(circuit=_circuit):
+    if circuit['opened_at'] is not None:
+        logger.info(f"{circuit['name']} circuit closed — reachable again")
+    circuit['failures'] = 0
+    circuit['opened_at'] = None
+
+def _watch(watched_engine, circuit):
+    @event.listens_for(watched_engine, "handle_error")
+    def _on_error(context):
+        # Connect failures have no connection; dropped connections are disconnects
+        if context.connection is None or context.is_disconnect:
+            record_failure(circuit)
+
+    @event.listens_for(watched_engine, "after_cursor_execute")
+    def _on_success(conn, cursor, statement, parameters, context, executemany):
+        if circuit['failures']:
+            record_success(circuit)
+
+_watch(engine, _circuit)
+if read_engine is not None:
+    _watch(read_engine, _replica_circuit)
+
+# --- Snapshots -----------------------------------------------------------------
+
+class Snapshot(list):
+    """Pending tasks of a chat as last read from the DB; taken_at is the
+    local (Israel) time of that read."""
+    def __init__(self, tasks, taken_at):
+        super().__init__(tasks)
+        self.taken_at = taken_at
+
+_snapshots = OrderedDict()  # chat_id -> Snapshot, LRU order
+_lock = threading.Lock()
+
+def best_effort(fn, *args, **kwargs):
+    """Runs a DB call the caller can do without: skipped while the circuit
+    is open, outage errors swallowed. Returns fn's result (None if skipped)."""
+    if not db_available():
+        return None
+    try:
+        return fn(*args, **kwargs)
+    except Exception as e:
+        if not is_outage(e):
+            raise
+        logger.info(f"Degraded mode: skipped {fn.__name__}: {e}")
+        return None
+
+def remember(chat_id, tasks):
+    """Stores a freshly read pending-task list (PendingTask rows) for `chat_id`."""
+    from src.bot.utils import get_now
+    snapshot = Snapshot(tasks, get_now())
+    with _lock:
+        _snapshots[chat_id] = snapshot
+        _snapshots.move_to_end(chat_id)
+        while len(_snapshots) > SNAPSHOT_MAX_CHATS:
+            _snapshots.popitem(last=False)
+
+def snapshot(chat_id):
+    """The chat's last snapshot, or None."""
+    with _lock:
+        return _snapshots.get(chat_id)
+
+def snapshot_task(chat_id, task_id):
+    """A task from the chat's snapshot, or None."""
+    current = snapshot(chat_id)
+    return next((t for t in current if t.id == task_id), None) if current is not None else None
+
+def _edit_snapshot(chat_id, edit):
+    with _lock:
+        current = _snapshots.get(chat_id)
+        if current is not None:
+            _snapshots[chat_id] = Snapshot(edit(list(current)), current.taken_at)
+
+def stale_banner(tasks):
+    """Header for views rendered from a snapshot ('' for live data)."""
+    if not isinstance(tasks, Snapshot):
+        return ""
+    return (f"⚠️ <b>מצב לא מקוון</b> — מוצג מצב מ-{tasks.taken_at.strftime('%H:%M')}. "
+            "שינויים יישמרו כשהחיבור יחזור.\n\n")
+
+# --- Queued writes -------------------------------------------------------------
+
+_queue = []  # [(op, chat_id, kwargs)], replayed in order
+_replayers = {}  # op -> fn(session, chat_id, **kwargs)
+_provisional = {'next': -1, 'ids': {}}  # ids of tasks added offline -> real ids
+_replay_lock = threading.Lock()
+
+def replays(op):
+    """Registers the function that performs a queued `op` against the DB.
+    It gets (session, chat_id, **kwargs) and leaves the commit to its caller,
+    like the live handler that uses it; quick_add returns the new task."""
+    def register(fn):
+        _replayers[op] = fn
+        return fn
+    return register
+
+def queue_write(op, chat_id, **kwargs):
+    """Queues a write for replay. Returns False when the queue is full."""
+    with _lock:
+        if len(_queue) >= OFFLINE_QUEUE_MAX:
+            return False
+        _queue.append((op, chat_id, kwargs))
+    logger.info(f"Degraded mode: queued '{op}' for chat {chat_id} ({len(_queue)} pending)")
+    return True
+
+def has_queued_writes():
+    return bool(_queue)
+
+def queue_done(chat_id, task_id, completed_at):
+    if not queue_write('done', chat_id, task_id=task_id, completed_at=completed_at):
+        return False
+    _edit_snapshot(chat_id, lambda tasks: [t for t in tasks if t.id != task_id])
+    return True
+
+def queue_snooze(chat_id, task_id, reminder_time):
+    if not queue_write('snooze', chat_id, task_id=task_id, reminder_time=reminder_time):
+        return False
+    _edit_snapshot(chat_id, lambda tasks: [t._replace(reminder_time=reminder_time) if t.id == task_id else t
+                                           for t in tasks])
+    return True
+
+def queue_quick_add(chat_id, text, created_at):
+    """Queues a new task; it shows in the snapshot under a negative id."""
+    with _lock:
+        task_id = _provisional['next']
+        _provisional['next'] -= 1
+    if not queue_write('quick_add', chat_id, task_id=task_id, text=text, created_at=created_at):
+        return False
+    task = PendingTask.new(id=task_id, text=text, priority='normal', parent_category='home', is_shared=0,
+                           created_at=created_at)
+    _edit_snapshot(chat_id, lambda tasks: sorted(tasks + [task], key=_snapshot_order))
+    return True
+
+def _snapshot_order(task):
+    from src.database.models import PRIORITY_CODES
+    return PRIORITY_CODES.index(task.priority), task.id < 0, abs(task.id)
+
+def real_task_id(task_id):
+    """Maps an id handed out offline to the task's id once it was replayed."""
+    return _provisional['ids'].get(task_id, task_id)
+
+def replay_queued_writes(session_factory=SessionLocal):
+    """Replays queued writes in order, one transaction each. Stops at the
+    first outage (the rest wait for the next run); an op that fails for any
+    other reason is logged and dropped. Returns the number replayed."""
+    if not _queue:
+        return 0
+    if not _replay_lock.acquire(blocking=False):
+        return 0
+    replayed = 0
+    try:
+        while _queue:
+            op, chat_id, kwargs = _queue[0]
+            kwargs = dict(kwargs)
+            provisional = kwargs.pop('task_id') if op == 'quick_add' else None
+            if 'task_id' in kwargs:
+                kwargs['task_id'] = real_task_id(kwargs['task_id'])
+            session = session_factory()
+            try:
+                result = _replayers[op](session, chat_id, **kwargs)
+                session.flush()
+                if provisional is not None and result is not None:
+                    _provisional['ids'][provisional] = result.id
+                session.commit()
+                replayed += 1
+            except Exception as e:
+                session.rollback()
+                if is_outage(e):
+                    logger.warning(f"Degraded mode: replay paused, database still unreachable: {e}")
+                    break
+                logger.error(f"Degraded mode: dropping queued '{op}' for chat {chat_id}: {e}", exc_info=True)
+            finally:
+                session.close()
+            with _lock:
+                _queue.pop(0)
+    finally:
+        _replay_lock.release()
+    if replayed:
+        logger.info(f"Degraded mode: replayed {replayed} queued write(s), {len(_queue)} left")
+    return replayed
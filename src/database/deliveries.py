@@ -0,0 +1,49 @@
+import logging
+from datetime import timezone
+from sqlalchemy.exc import IntegrityError
+from src.database.models import ReminderDelivery
+from src.database.outbox import utc_now_naive
+
+logger = logging.getLogger(__name__)
+
+def claim_reminder(session, task, tz):
+    """Claims the delivery of `task`'s current reminder. Flushes the ledger
+    row so a duplicate fails right here; on a duplicate the session is rolled
+    back and None is returned. Otherwise returns the (uncommitted) row; the
+    digest flush later enqueues the message and links outbox_id."""
+    reminder_time = task.reminder_time
+    delivery = ReminderDelivery(
+        task_id=task.id,
+        chat_id=task.chat_id,
+        reminder_time=reminder_time,
+        due_at=reminder_time.replace(tzinfo=tz).astimezone(timezone.utc).replace(tzinfo=None),
+        claimed_at=utc_now_naive(),
+    )
+    session.add(delivery)
+    try:
+        session.flush()
+    except IntegrityError:
+        session.rollback()
+        logger.info(f"Reminder for task {task.id} at {reminder_time} already claimed — skipping")
+        return None
+    return delivery
+
+def record_delivered(session, outbox_ids, now):
+    """Stamps delivered_at on ledger rows whose outbox message was just sent."""
+    if outbox_ids:
+        session.query(ReminderDelivery).filter(
+            ReminderDelivery.outbox_id.in_(outbox_ids),
+            ReminderDelivery.delivered_at.is_(None)
+        ).update({ReminderDelivery.delivered_at: now}, synchronize_session=False)
+
+def delivery_lag(session, since):
+    """Lag between due and delivered time for reminders due since `since`
+    (naive UTC). Returns (delivered count, average seconds, max seconds,
+    undelivered count)."""
+    rows = session.query(ReminderDelivery.due_at, ReminderDelivery.delivered_at).filter(
+        ReminderDelivery.due_at >= since
+    ).all()
+    lags = [(delivered - due).total_seconds() for due, delivered in rows if delivered]
+    if not lags:
+        return 0, 0.0, 0.0, len(rows)
+    return len(lags), sum(lags) / len(lags), max(lags), len(rows) - len(lags)
@@ -0,0 +1,85 @@
+import logging
+from sqlalchemy import select
+from src.database.models import Household, HouseholdMember, SubCategory
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOUSEHOLD_NAME = "הבית"
+
+def household_ids_select(chat_id):
+    """SELECT of the households `chat_id` belongs to, for use in IN filters
+    (served by ix_household_members_chat)."""
+    return select(HouseholdMember.household_id).where(HouseholdMember.chat_id == chat_id)
+
+def get_household_ids(session, chat_id):
+    """Households of a chat, the one it joined first leading."""
+    return [row[0] for row in session.query(HouseholdMember.household_id).filter(
+        HouseholdMember.chat_id == chat_id
+    ).order_by(HouseholdMember.joined_at, HouseholdMember.household_id)]
+
+def primary_household_id(session, chat_id):
+    """Household that a chat's new shared tasks belong to (None if it has none)."""
+    ids = get_household_ids(session, chat_id)
+    return ids[0] if ids else None
+
+def get_memberships(session, chat_ids):
+    """Returns {chat_id: [household_id, ...]} for the given chats."""
+    memberships = {}
+    rows = session.query(HouseholdMember.chat_id, HouseholdMember.household_id).filter(
+        HouseholdMember.chat_id.in_(chat_ids)
+    ).order_by(HouseholdMember.joined_at, HouseholdMember.household_id)
+    for chat_id, household_id in rows:
+        memberships.setdefault(chat_id, []).append(household_id)
+    return memberships
+
+def ensure_shared_categories(session, household_id):
+    """Seeds a household's shared Home sub-categories if it has none yet. Does not commit."""
+    from src.database.core import SHARED_HOME_CATEGORIES
+    exists = session.query(SubCategory.id).filter(SubCategory.household_id == household_id).first()
+    if exists is None:
+        session.add_all(
+            SubCategory(name=name, parent=parent, household_id=household_id, is_active=1)
+            for name, parent in SHARED_HOME_CATEGORIES
+        )
+
+def create_household(session, name, chat_ids=()):
+    """Creates a household with the given members and its shared categories.
+    Flushes (the id is set on return) but does not commit."""
+    household = Household(name=name)
+    session.add(household)
+    session.flush()
+    session.add_all(HouseholdMember(household_id=household.id, chat_id=chat_id) for chat_id in set(chat_ids))
+    ensure_shared_categories(session, household.id)
+    session.flush()
+    return household
+
+def ensure_household(session, chat_id):
+    """Returns the chat's primary household id, creating a household of its
+    own on first use. Flushes a new household but does not commit."""
+    household_id = primary_household_id(session, chat_id)
+    if household_id is None:
+        household_id = create_household(session, DEFAULT_HOUSEHOLD_NAME, [chat_id]).id
+        logger.info(f"Created household {household_id} for chat {chat_id}")
+    return household_id
+
+def add_member(session, household_id, chat_id):
+    """Adds a chat to a household. Returns False if it was already a member. Does not commit."""
+    if session.get(HouseholdMember, (household_id, chat_id)) is not None:
+        return False
+    session.add(HouseholdMember(household_id=household_id, chat_id=chat_id))
+    return True
+
+def remove_member(session, household_id, chat_id):
+    """Removes a chat from a household. Returns False if it wasn't a member. Does not commit."""
+    row = session.get(HouseholdMember, (household_id, chat_id))
+    if row is None:
+        return False
+    session.delete(row)
+    return True
+
+def list_households(session):
+    """Returns [(Household, [member chat_id, ...]), ...] ordered by id."""
+    members = {}
+    for household_id, chat_id in session.query(HouseholdMember.household_id, HouseholdMember.chat_id):
+        members.setdefault(household_id, []).append(chat_id)
+    return [(h, sorted(members.get(h.id, []))) for h in session.query(Household).order_by(Household.id)]
@@ -1,29 +1,234 @@
-from sqlalchemy import Column, Integer, String, DateTime, BigInteger, func
-from sqlalchemy.orm import declarative_base
-
-Base = declarative_base()
-
-class Task(Base):
-    __tablename__ = "tasks"
-
-    id = Column(Integer, primary_key=True, autoincrement=True)
-    chat_id = Column(BigInteger, nullable=False, index=True)
-    text = Column(String, nullable=False)
-    priority = Column(String, nullable=False)  # 'urgent', 'normal', 'low'
-    parent_category = Column(String, nullable=False)  # 'home', 'work'
-    sub_category = Column(String, nullable=True)
-    reminder_time = Column(DateTime, nullable=True)
-    status = Column(String, default='pending')  # 'pending', 'done'
-    recurrence = Column(String, nullable=True) # 'daily', 'weekly', 'monthly'
-    is_shared = Column(Integer, default=0)  # 1=shared (visible to all users), 0=personal
-    created_at = Column(DateTime, default=func.now())
-    completed_at = Column(DateTime, nullable=True)
-
-class SubCategory(Base):
-    __tablename__ = "sub_categories"
-
-    id = Column(Integer, primary_key=True, autoincrement=True)
-    chat_id = Column(BigInteger, nullable=True, index=True)
-    name = Column(String, nullable=False)
-    parent = Column(String, nullable=False)  # 'home' or 'work'
-    is_active = Column(Integer, default=1)  # 1=True, 0=False
+from sqlalchemy import Column, Integer, String, Text, Date, DateTime, BigInteger, SmallInteger, Index, ForeignKey, UniqueConstraint, func
+from sqlalchemy.orm import declarative_base
+from sqlalchemy.types import TypeDecorator
+
+Base = declarative_base()
+
+# Small-integer encodings for Task enums. Tuple position is the stored code,
+# so PRIORITY_CODES order doubles as the sort order (ORDER BY priority puts
+# urgent first). Append new values at the end — never reorder existing ones.
+PRIORITY_CODES = ('urgent', 'normal', 'low')
+STATUS_CODES = ('pending', 'done')
+CATEGORY_CODES = ('home', 'work')
+STATS_SCOPES = ('personal', 'shared')
+OUTBOX_STATUSES = ('pending', 'sending', 'sent', 'dead')
+
+class EnumCode(TypeDecorator):
+    """Stores one of a fixed set of strings as a SMALLINT code.
+
+    The model layer keeps its string semantics: Task.priority still reads and
+    compares as 'urgent'/'normal'/'low', only the column holds 0/1/2.
+    """
+    impl = SmallInteger
+    cache_ok = True
+
+    def __init__(self, values):
+        super().__init__()
+        self.values = tuple(values)
+        self._codes = {v: i for i, v in enumerate(self.values)}
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        try:
+            return self._codes[value]
+        except KeyError:
+            raise ValueError(f"{value!r} is not one of {self.values}")
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return self.values[value]
+
+class Task(Base):
+    __tablename__ = "tasks"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    chat_id = Column(BigInteger, nullable=False, index=True)
+    text = Column(String, nullable=False)
+    priority = Column('priority_code', EnumCode(PRIORITY_CODES), nullable=False)  # 'urgent', 'normal', 'low'
+    parent_category = Column('category_code', EnumCode(CATEGORY_CODES), nullable=False)  # 'home', 'work'
+    sub_category_id = Column(Integer, ForeignKey('sub_categories.id'), nullable=True, index=True)  # NULL = 'כללי'
+    reminder_time = Column(DateTime, nullable=True)
+    status = Column('status_code', EnumCode(STATUS_CODES), default='pending')  # 'pending', 'done'
+    recurrence = Column(String, nullable=True) # 'daily', 'weekly', 'monthly'
+    is_shared = Column('shared_flag', SmallInteger, default=0)  # 1=shared with the household, 0=personal
+    household_id = Column(Integer, ForeignKey('households.id'), nullable=True)  # set on shared tasks only
+    created_at = Column(DateTime, default=func.now())
+    completed_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index('ix_tasks_status_chat_priority', 'status_code', 'chat_id', 'priority_code'),
+        Index('ix_tasks_household_status', 'household_id', 'status_code'),
+    )
+
+class SubCategory(Base):
+    __tablename__ = "sub_categories"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    chat_id = Column(BigInteger, nullable=True, index=True)  # NULL for household categories
+    household_id = Column(Integer, ForeignKey('households.id'), nullable=True, index=True)
+    name = Column(String, nullable=False)
+    parent = Column(String, nullable=False)  # 'home' or 'work'
+    is_active = Column(Integer, default=1)  # 1=True, 0=False
+
+class Household(Base):
+    """A group of users sharing Home tasks and categories (e.g. a family)."""
+    __tablename__ = "households"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    name = Column(String, nullable=False)
+    created_at = Column(DateTime, default=func.now())
+
+class HouseholdMember(Base):
+    """Membership of a chat in a household. A chat may belong to several;
+    the one it joined first is where its new shared tasks go."""
+    __tablename__ = "household_members"
+
+    household_id = Column(Integer, ForeignKey('households.id'), primary_key=True)
+    chat_id = Column(BigInteger, primary_key=True)
+    joined_at = Column(DateTime, default=func.now())
+
+    __table_args__ = (
+        # Access filters look up a chat's households on every task query
+        Index('ix_household_members_chat', 'chat_id', 'household_id'),
+    )
+
+class TaskArchive(Base):
+    """Cold storage for tasks that were completed long ago.
+
+    Rows are moved here from `tasks` by the nightly archive job, keeping the
+    original task id. Columns mirror Task. Nothing reads them back except the
+    daily_stats rebuild (stats.backfill_daily_stats): the archive is write-only history.
+    """
+    __tablename__ = "tasks_archive"
+
+    # Own key: SQLite may reuse a tasks.id once the highest rows are moved out
+    archive_id = Column(Integer, primary_key=True, autoincrement=True)
+    id = Column(Integer, nullable=False, index=True)  # original tasks.id
+    chat_id = Column(BigInteger, nullable=False)
+    text = Column(String, nullable=False)
+    priority = Column('priority_code', EnumCode(PRIORITY_CODES), nullable=False)
+    parent_category = Column('category_code', EnumCode(CATEGORY_CODES), nullable=False)
+    sub_category_id = Column(Integer, nullable=True)
+    reminder_time = Column(DateTime, nullable=True)
+    status = Column('status_code', EnumCode(STATUS_CODES), default='done')
+    recurrence = Column(String, nullable=True)
+    is_shared = Column('shared_flag', SmallInteger, default=0)
+    household_id = Column(Integer, nullable=True)
+    created_at = Column(DateTime, nullable=True)
+    completed_at = Column(DateTime, nullable=True)
+    archived_at = Column(DateTime, default=func.now())
+
+    __table_args__ = (
+        Index('ix_tasks_archive_chat_completed', 'chat_id', 'completed_at'),
+        Index('ix_tasks_archive_household_completed', 'household_id', 'completed_at'),
+    )
+
+class DailyStat(Base):
+    """Per-day task rollup, maintained in the same transaction as the write.
+
+    Personal rows are keyed by the owner's chat_id; shared tasks roll up into
+    scope 'shared' rows whose chat_id column holds the household id.
+    done_* columns histogram time-to-done by the buckets in stats.DONE_BUCKETS.
+    """
+    __tablename__ = "daily_stats"
+
+    chat_id = Column(BigInteger, primary_key=True)
+    date = Column(Date, primary_key=True)
+    scope = Column(EnumCode(STATS_SCOPES), primary_key=True)
+    created_count = Column(Integer, nullable=False, default=0)
+    completed_count = Column(Integer, nullable=False, default=0)
+    done_obsessive = Column(Integer, nullable=False, default=0)  # < 5 hours
+    done_normal = Column(Integer, nullable=False, default=0)  # 5 – 48 hours
+    done_procrastinator = Column(Integer, nullable=False, default=0)  # 2 – 7 days
+    done_archeologist = Column(Integer, nullable=False, default=0)  # > 7 days
+
+class UserPreference(Base):
+    """Per-user settings. briefing_minute is the local minute-of-day
+    (e.g. 9*60+35 for 09:35) in `timezone`; NULL disables the briefing."""
+    __tablename__ = "user_preferences"
+
+    chat_id = Column(BigInteger, primary_key=True)
+    timezone = Column(String, nullable=False, default='Asia/Jerusalem')
+    briefing_minute = Column(SmallInteger, nullable=True, default=9 * 60 + 35)
+
+    __table_args__ = (
+        # The briefing tick range-scans one timezone's due slot
+        Index('ix_user_preferences_tz_minute', 'timezone', 'briefing_minute'),
+    )
+
+class AllowedUser(Base):
+    """Bot allowlist. While the table is empty the bot is open to everyone."""
+    __tablename__ = "allowed_users"
+
+    user_id = Column(BigInteger, primary_key=True)
+    is_admin = Column(SmallInteger, nullable=False, default=0)  # 1 = may manage the allowlist
+    added_by = Column(BigInteger, nullable=True)
+    added_at = Column(DateTime, default=func.now())
+
+class OutboxMessage(Base):
+    """Outbound Telegram message, enqueued in the same transaction as the
+    change that causes it and delivered by the outbox dispatcher job.
+
+    idempotency_key names the notification (e.g. "reminder:<task>:<time>"):
+    enqueueing the same key twice is a no-op, so a retried job never sends
+    twice. next_attempt_at (naive UTC) is the earliest send time while
+    pending, and the claim lease expiry while 'sending'.
+    """
+    __tablename__ = "outbox"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    idempotency_key = Column(String, nullable=False, unique=True)
+    chat_id = Column(BigInteger, nullable=False)
+    text = Column(Text, nullable=False)
+    reply_markup = Column(Text, nullable=True)  # InlineKeyboardMarkup JSON
+    parse_mode = Column(String, nullable=True, default='HTML')
+    status = Column('status_code', EnumCode(OUTBOX_STATUSES), nullable=False, default='pending')
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False)
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=func.now())
+    sent_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index('ix_outbox_status_next_attempt', 'status_code', 'next_attempt_at'),
+    )
+
+class ReminderDelivery(Base):
+    """Delivery ledger: one row per (task, reminder time) that was sent.
+
+    A reminder send must insert its row first — the unique key makes a second
+    attempt (recovery job, restarted instance, duplicate job) fail cleanly and
+    skip. outbox_id stays NULL until the chat's digest flush enqueues the
+    message. due_at/claimed_at/delivered_at are naive UTC; delivered_at is set
+    when the linked outbox message goes out, so delivered_at - due_at is the
+    real delivery lag.
+    """
+    __tablename__ = "reminder_deliveries"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    task_id = Column(Integer, nullable=False)  # no FK: done tasks move to tasks_archive
+    chat_id = Column(BigInteger, nullable=False)
+    reminder_time = Column(DateTime, nullable=False)  # as in tasks (naive Israel time)
+    due_at = Column(DateTime, nullable=False)
+    claimed_at = Column(DateTime, nullable=False)
+    outbox_id = Column(Integer, nullable=True, index=True)
+    delivered_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        UniqueConstraint('task_id', 'reminder_time', name='uq_reminder_deliveries_task_time'),
+    )
+
+class CacheEvent(Base):
+    """Cache invalidation events, for databases without LISTEN/NOTIFY (SQLite).
+
+    One row per committed transaction that touched cached data; every
+    instance polls for ids past the last one it saw (see cache_bus.py).
+    created_at is naive UTC.
+    """
+    __tablename__ = "cache_events"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    payload = Column(Text, nullable=False)
+    created_at = Column(DateTime, nullable=False)
@@ -0,0 +1,140 @@
+import json
+import logging
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import func, and_, delete
+from src.database.models import OutboxMessage, OUTBOX_STATUSES
+
+logger = logging.getLogger(__name__)
+
+def utc_now_naive():
+    """Outbox timestamps are naive UTC (independent of the users' timezones)."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def enqueue(session, idempotency_key, chat_id, text, reply_markup=None, parse_mode='HTML', not_before=None):
+    """Adds a message to the outbox as part of the caller's transaction (the
+    caller commits). A key that was already enqueued is left untouched, so
+    re-running the producing job never duplicates a message.
+
+    `not_before` (naive UTC) delays delivery. Returns the new row, or None
+    if the key was already enqueued.
+    """
+    exists = session.query(OutboxMessage.id).filter(
+        OutboxMessage.idempotency_key == idempotency_key
+    ).first()
+    if exists:
+        logger.info(f"Outbox: '{idempotency_key}' already enqueued — skipping")
+        return None
+    message = OutboxMessage(
+        idempotency_key=idempotency_key,
+        chat_id=chat_id,
+        text=text,
+        reply_markup=reply_markup.to_json() if reply_markup is not None else None,
+        parse_mode=parse_mode,
+        status='pending',
+        attempts=0,
+        next_attempt_at=not_before or utc_now_naive(),
+    )
+    session.add(message)
+    return message
+
+def decode_markup(raw):
+    from telegram import InlineKeyboardMarkup
+    return InlineKeyboardMarkup.de_json(json.loads(raw), None) if raw else None
+
+def claim_due(session, now, limit, lease: timedelta):
+    """Claims up to `limit` due messages for sending and commits the claim.
+
+    A claim moves the row to 'sending' with next_attempt_at = now + lease;
+    if the sender dies before recording the outcome, the lease runs out and
+    the row is picked up again (at-least-once delivery). Each row is claimed
+    with a conditional UPDATE, so concurrent dispatchers never share a row.
+    Returns plain rows (id, chat_id, text, reply_markup, parse_mode, attempts).
+    """
+    due = and_(
+        OutboxMessage.status.in_(('pending', 'sending')),
+        OutboxMessage.next_attempt_at <= now
+    )
+    ids = [row[0] for row in session.query(OutboxMessage.id).filter(due).order_by(
+        OutboxMessage.next_attempt_at, OutboxMessage.id
+    ).limit(limit)]
+
+    claimed = []
+    for message_id in ids:
+        updated = session.query(OutboxMessage).filter(OutboxMessage.id == message_id, due).update(
+            {OutboxMessage.status: 'sending', OutboxMessage.next_attempt_at: now + lease},
+            synchronize_session=False
+        )
+        if updated:
+            claimed.append(message_id)
+    session.commit()
+    if not claimed:
+        return []
+    return session.query(
+        OutboxMessage.id, OutboxMessage.chat_id, OutboxMessage.text,
+        OutboxMessage.reply_markup, OutboxMessage.parse_mode, OutboxMessage.attempts
+    ).filter(OutboxMessage.id.in_(claimed)).order_by(OutboxMessage.id).all()
+
+def mark_sent(session, message_id, now):
+    session.query(OutboxMessage).filter(OutboxMessage.id == message_id).update(
+        {OutboxMessage.status: 'sent', OutboxMessage.sent_at: now, OutboxMessage.last_error: None},
+        synchronize_session=False
+    )
+
+def mark_retry(session, message_id, when, error, count_attempt=True):
+    """Back to 'pending' until `when`. Rate-limit waits pass count_attempt=False."""
+    values = {OutboxMessage.status: 'pending', OutboxMessage.next_attempt_at: when,
+              OutboxMessage.last_error: str(error)[:500]}
+    if count_attempt:
+        values[OutboxMessage.attempts] = OutboxMessage.attempts + 1
+    session.query(OutboxMessage).filter(OutboxMessage.id == message_id).update(values, synchronize_session=False)
+
+def mark_dead(session, message_id, error):
+    """Dead letter: never retried, kept for inspection (see /queue)."""
+    session.query(OutboxMessage).filter(OutboxMessage.id == message_id).update(
+        {OutboxMessage.status: 'dead', OutboxMessage.attempts: OutboxMessage.attempts + 1,
+         OutboxMessage.last_error: str(error)[:500]},
+        synchronize_session=False
+    )
+
+def queue_depth(session, now=None):
+    """Outbox health: {status: count} for every status, plus 'due' (messages
+    that should already have gone out) and 'oldest_due_seconds'."""
+    now = now or utc_now_naive()
+    depth = dict.fromkeys(OUTBOX_STATUSES, 0)
+    for status, count in session.query(OutboxMessage.status, func.count()).group_by(OutboxMessage.status):
+        depth[status] = count
+    due_count, oldest = session.query(func.count(), func.min(OutboxMessage.next_attempt_at)).filter(
+        OutboxMessage.status.in_(('pending', 'sending')),
+        OutboxMessage.next_attempt_at <= now
+    ).one()
+    depth['due'] = due_count
+    depth['oldest_due_seconds'] = int((now - oldest).total_seconds()) if oldest else 0
+    return depth
+
+def recent_dead_letters(session, limit=5):
+    return session.query(OutboxMessage).filter(
+        OutboxMessage.status == 'dead'
+    ).order_by(OutboxMessage.id.desc()).limit(limit).all()
+
+def prune_sent(session_factory, older_than_naive_utc, batch_size=500, max_batches=50):
+    """Deletes delivered messages sent before the cutoff, one batch per
+    transaction. Dead letters are kept. Returns rows deleted."""
+    deleted = 0
+    for _ in range(max_batches):
+        session = session_factory()
+        try:
+            ids = [row[0] for row in session.query(OutboxMessage.id).filter(
+                OutboxMessage.status == 'sent',
+                OutboxMessage.sent_at < older_than_naive_utc
+            ).order_by(OutboxMessage.id).limit(batch_size)]
+            if not ids:
+                break
+            session.execute(delete(OutboxMessage).where(OutboxMessage.id.in_(ids)))
+            session.commit()
+            deleted += len(ids)
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+    return deleted
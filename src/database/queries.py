@@ -0,0 +1,33 @@
+from sqlalchemy import select, bindparam
+from src.database.models import Task, SubCategory
+from src.database.read_models import PendingTask, columns
+from src.bot.utils import get_accessible_filter
+
+# Statements for the queries that run on nearly every interaction, built once
+# at import. Every value is a bound parameter, so each statement keeps one
+# cache key: SQLAlchemy compiles it on first use and afterwards takes the SQL
+# from the engine's compiled cache, and no expression tree is rebuilt per
+# call. Run them with session.execute(statement, {param: value}).
+#
+# psycopg2 has no server-side prepared statements; the cached compilation is
+# the client half of that, and the SQL string sent is identical every time.
+
+_chat_id = bindparam('chat_id')
+_task_id = bindparam('task_id')
+_parent = bindparam('parent')
+
+# Pending tasks a chat can see (get_pending_tasks), as PendingTask rows
+PENDING_TASKS = select(*columns(PendingTask)).where(
+    get_accessible_filter(_chat_id), Task.status == 'pending'
+).order_by(Task.priority, Task.id)
+
+# One task if the chat can see it: as a Task (for writes) and as a row (for views)
+ACCESSIBLE_TASK = select(Task).where(Task.id == _task_id, get_accessible_filter(_chat_id)).limit(1)
+ACCESSIBLE_TASK_ROW = select(*columns(PendingTask)).where(Task.id == _task_id, get_accessible_filter(_chat_id)).limit(1)
+
+# Active categories under a parent: a chat's own, or a household's shared ones
+CHAT_CATEGORIES = select(SubCategory).where(
+    SubCategory.parent == _parent, SubCategory.is_active == 1, SubCategory.chat_id == _chat_id)
+HOUSEHOLD_CATEGORIES = select(SubCategory).where(
+    SubCategory.household_id == bindparam('household_id'), SubCategory.parent == _parent,
+    SubCategory.is_active == 1)
@@ -0,0 +1,47 @@
+from datetime import datetime
+from typing import NamedTuple, Optional
+from src.database.models import Task
+
+# Read models: immutable rows holding only the Task columns a view reads,
+# built from column-projected queries. Unlike ORM instances they never enter
+# a session's identity map, carry no change-tracking state and can't lazy
+# load, so they are cheap to build and safe to share between sessions and
+# threads (the task index and the offline snapshots hand out the same rows).
+
+class PendingTask(NamedTuple):
+    """A pending task as the task list, the filters, the dashboard and the
+    task view see it (also what the task index and snapshots hold)."""
+    id: int
+    text: str
+    priority: str
+    parent_category: str
+    sub_category_id: Optional[int]
+    reminder_time: Optional[datetime]
+    is_shared: int
+    household_id: Optional[int]
+    created_at: Optional[datetime]
+
+    @classmethod
+    def new(cls, **values):
+        """A row built from keyword values; missing fields are None."""
+        return cls._make(values.get(f) for f in cls._fields)
+
+class BriefingTask(NamedTuple):
+    """A pending task as the morning briefing sees it."""
+    id: int
+    chat_id: int
+    household_id: Optional[int]
+    text: str
+    priority: str
+    created_at: Optional[datetime]
+
+def columns(model):
+    """The Task columns to select for `model`, in field order."""
+    return [getattr(Task, f) for f in model._fields]
+
+def select_rows(session, model, *criteria, order_by=()):
+    """Task rows matching `criteria` as `model` instances."""
+    query = session.query(*columns(model)).filter(*criteria)
+    if order_by:
+        query = query.order_by(*order_by)
+    return [model._make(row) for row in query]
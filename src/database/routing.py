@@ -0,0 +1,95 @@
+import os
+import time
+import logging
+from sqlalchemy import event
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.sql.dml import UpdateBase
+from src.database.core import engine, read_engine, SessionLocal
+from src.database.cache_bus import on_event
+from src.database.degraded import replica_available
+
+logger = logging.getLogger(__name__)
+
+# After a chat writes, its reads stay on the primary this long (replica lag
+# is normally well under a second). Writes to shared rows pin every chat.
+READ_PIN_SECONDS = float(os.getenv("READ_PIN_SECONDS", "10"))
+
+# Tables the views read — writes to anything else (outbox, ledger) don't pin
+_VIEW_TABLES = {"tasks", "sub_categories", "user_preferences", "daily_stats", "household_members"}
+
+_chat_pins = {}  # chat_id -> monotonic time the pin expires
+_shared_pin_until = 0.0
+
+def _pinned(chat_id):
+    now = time.monotonic()
+    if now < _shared_pin_until:
+        return True
+    expires = _chat_pins.get(chat_id)
+    if expires is None:
+        return False
+    if now >= expires:
+        _chat_pins.pop(chat_id, None)
+        return False
+    return True
+
+def pin_chat(chat_id):
+    """Routes `chat_id`'s reads to the primary for READ_PIN_SECONDS."""
+    _chat_pins[chat_id] = time.monotonic() + READ_PIN_SECONDS
+
+def pin_shared():
+    """Routes every chat's reads to the primary (shared rows changed)."""
+    global _shared_pin_until
+    _shared_pin_until = time.monotonic() + READ_PIN_SECONDS
+
+@on_event('chat')
+def _pin_remote_chat(chat_id):
+    # Another instance wrote: its change may not have reached the replica yet
+    if chat_id is None:
+        pin_shared()
+    else:
+        pin_chat(chat_id)
+
+@on_event('household')
+def _pin_remote_household(household_id):
+    pin_shared()
+
+@event.listens_for(Session, "after_flush")
+def _pin_writers(session, flush_context):
+    if read_engine is None:
+        return
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        table = getattr(obj, "__tablename__", None)
+        if table not in _VIEW_TABLES:
+            continue
+        chat_id = getattr(obj, "chat_id", None)
+        if getattr(obj, "household_id", None) is not None or getattr(obj, "scope", None) == 'shared':
+            pin_shared()
+        elif chat_id is not None:
+            pin_chat(chat_id)
+    session.info["wrote"] = True
+
+def _is_write(clause):
+    # Anything that isn't a plain SELECT (DML, textual SQL) is treated as a write
+    return isinstance(clause, UpdateBase) or not getattr(clause, "is_select", False)
+
+class RoutingSession(Session):
+    """Reads go to the replica unless the chat is pinned or the replica's
+    circuit is open; flushes, DML and everything after the session's first
+    write go to the primary."""
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if self.info.get("wrote") or self._flushing or (clause is not None and _is_write(clause)):
+            self.info["wrote"] = True
+            return engine
+        if _pinned(self.info.get("chat_id")) or not replica_available():
+            return engine
+        return read_engine
+
+_ReadSessionFactory = sessionmaker(class_=RoutingSession, autocommit=False, autoflush=False) if read_engine is not None else None
+
+def ReadSession(chat_id=None):
+    """Session for view handlers: replica reads with read-your-writes for
+    `chat_id`. Without DATABASE_READ_URL it is a plain SessionLocal()."""
+    if _ReadSessionFactory is None:
+        return SessionLocal()
+    return _ReadSessionFactory(info={"chat_id": chat_id})
@@ -0,0 +1,115 @@
+import os
+import re
+import asyncio
+import logging
+import threading
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# Connection pragmas for the SQLite fallback. WAL lets readers run alongside
+# the (single) writer; synchronous=NORMAL is durable across app crashes in WAL
+# mode and only risks the last commits on power loss.
+SQLITE_BUSY_TIMEOUT = float(os.getenv("SQLITE_BUSY_TIMEOUT", "15"))  # seconds
+SQLITE_PRAGMAS = (
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),
+    ("cache_size", str(-int(os.getenv("SQLITE_CACHE_KB", "20000")))),  # negative = KiB
+    ("mmap_size", os.getenv("SQLITE_MMAP_SIZE", str(128 * 1024 * 1024))),
+    ("temp_store", "MEMORY"),
+    ("busy_timeout", str(int(SQLITE_BUSY_TIMEOUT * 1000))),
+)
+
+_WRITE_STATEMENT = re.compile(r"^\s*(INSERT|UPDATE|DELETE|REPLACE|CREATE|DROP|ALTER)\b", re.IGNORECASE)
+
+# Single-writer lock. SQLite allows one write transaction at a time anyway;
+# queueing writers here (instead of letting them race for the file lock and
+# fail with "database is locked") keeps writes FIFO-ish and bounded by
+# SQLITE_BUSY_TIMEOUT. Owned by a pooled connection from its first write
+# until that connection's transaction ends; reads never take it.
+_writer_lock = threading.Lock()
+_writer_thread = None
+_OWNER_KEY = "sqlite_writer"
+
+def _on_event_loop():
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+def _acquire_writer(info):
+    global _writer_thread
+    if info.get(_OWNER_KEY):
+        return
+    if _writer_thread == threading.get_ident():
+        # Another connection on this same thread (e.g. a second coroutine on
+        # the event loop) holds the lock — waiting here would block its
+        # release. Fall back to SQLite's own busy timeout.
+        return
+    if _on_event_loop():
+        # Waiting on the event loop would freeze every handler while a job
+        # thread holds the lock: only take it if it's free, and otherwise
+        # leave the wait to SQLite's busy timeout
+        if not _writer_lock.acquire(blocking=False):
+            return
+    elif not _writer_lock.acquire(timeout=SQLITE_BUSY_TIMEOUT):
+        logger.warning("SQLite writer lock not acquired in time — writing without it")
+        return
+    _writer_thread = threading.get_ident()
+    info[_OWNER_KEY] = True
+
+def _release_writer(info):
+    global _writer_thread
+    if info.pop(_OWNER_KEY, False):
+        _writer_thread = None
+        _writer_lock.release()
+
+def configure_sqlite(engine):
+    """Applies the pragmas to every new connection and routes writes through
+    the single-writer lock."""
+
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in SQLITE_PRAGMAS:
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_execute(conn, cursor, statement, parameters, context, executemany):
+        if _WRITE_STATEMENT.match(statement):
+            _acquire_writer(conn.info)
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_execute(conn, cursor, statement, parameters, context, executemany):
+        # Statements run outside a transaction (autocommit DDL) end right here
+        if conn.info.get(_OWNER_KEY) and not cursor.connection.in_transaction:
+            _release_writer(conn.info)
+
+    @event.listens_for(engine, "handle_error")
+    def _on_error(exception_context):
+        conn = exception_context.connection
+        if conn is not None and conn.info.get(_OWNER_KEY):
+            dbapi_connection = conn.connection.dbapi_connection
+            if dbapi_connection is None or not dbapi_connection.in_transaction:
+                _release_writer(conn.info)
+
+    # Fires just before the DBAPI commit; a writer that slips in during the
+    # commit itself only waits a moment on the busy timeout
+    @event.listens_for(engine, "commit")
+    @event.listens_for(engine, "rollback")
+    def _end_transaction(conn):
+        _release_writer(conn.info)
+
+    # A session closed without commit is rolled back by the pool on return
+    @event.listens_for(engine.pool, "reset")
+    def _on_reset(dbapi_connection, connection_record, reset_state):
+        _release_writer(connection_record.info)
+
+    @event.listens_for(engine.pool, "checkin")
+    def _on_checkin(dbapi_connection, connection_record):
+        if connection_record is not None:
+            _release_writer(connection_record.info)
@@ -0,0 +1,212 @@
+import logging
+from datetime import timedelta
+from sqlalchemy import or_, and_, event
+from sqlalchemy.orm import Session
+from src.database.models import Task, TaskArchive, DailyStat
+from src.database.households import household_ids_select
+
+logger = logging.getLogger(__name__)
+
+# Time-to-done buckets, fastest first. Shared with the "done" phrases in
+# handlers._get_done_phrase — keep the thresholds in one place.
+DONE_BUCKETS = ('obsessive', 'normal', 'procrastinator', 'archeologist')
+_BUCKET_LIMITS_HOURS = (5, 48, 168)  # upper bounds of the first three buckets
+
+def completion_bucket(created_at, completed_at) -> str:
+    """Classifies how long a task stayed open. Unknown creation time counts as 'normal'."""
+    if not created_at or not completed_at:
+        return 'normal'
+    hours = (completed_at - created_at).total_seconds() / 3600
+    for bucket, limit in zip(DONE_BUCKETS, _BUCKET_LIMITS_HOURS):
+        if hours < limit:
+            return bucket
+    return DONE_BUCKETS[-1]
+
+def _stats_key(task):
+    """(chat_id, scope) a task rolls up into; shared rows are keyed by household."""
+    if task.is_shared:
+        return task.household_id, 'shared'
+    return task.chat_id, 'personal'
+
+def _upsert_insert(session):
+    dialect = session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return None
+    return insert
+
+def _write_stats(session, chat_id, day, scope, values, replace=False):
+    """Adds `values` to the (chat_id, day, scope) row, creating it if needed,
+    when the session commits. With replace=True the values overwrite instead
+    (used by the backfill)."""
+    insert = _upsert_insert(session)
+    if insert is not None:
+        stmt = insert(DailyStat).values(chat_id=chat_id, date=day, scope=scope, **values)
+        if replace:
+            updates = {k: stmt.excluded[k] for k in values}
+        else:
+            updates = {k: getattr(DailyStat, k) + stmt.excluded[k] for k in values}
+        # Sent with the commit (see _flush_stats): the upsert locks the rollup
+        # row every write of the chat's day goes through, so only for the commit
+        session.info.setdefault("stats_writes", []).append(stmt.on_conflict_do_update(
+            index_elements=[DailyStat.chat_id, DailyStat.date, DailyStat.scope],
+            set_=updates
+        ))
+        return
+
+    # Portable fallback: read-modify-write inside the caller's transaction
+    row = session.get(DailyStat, (chat_id, day, scope))
+    if row is None:
+        row = DailyStat(chat_id=chat_id, date=day, scope=scope)
+        for column in ('created_count', 'completed_count') + tuple(f"done_{b}" for b in DONE_BUCKETS):
+            setattr(row, column, 0)
+        session.add(row)
+    for k, v in values.items():
+        setattr(row, k, v if replace else getattr(row, k) + v)
+
+@event.listens_for(Session, "before_commit")
+def _flush_stats(session):
+    for stmt in session.info.pop("stats_writes", ()):
+        session.execute(stmt)
+
+@event.listens_for(Session, "after_rollback")
+def _drop_stats(session):
+    session.info.pop("stats_writes", None)
+
+def record_task_created(session, task, now_naive):
+    """Counts a new task in today's rollup. Call before the task's commit."""
+    chat_id, scope = _stats_key(task)
+    _write_stats(session, chat_id, now_naive.date(), scope, {'created_count': 1})
+
+def record_task_completed(session, task):
+    """Counts a completion (task.completed_at must be set). Call before commit."""
+    chat_id, scope = _stats_key(task)
+    bucket = completion_bucket(task.created_at, task.completed_at)
+    _write_stats(session, chat_id, task.completed_at.date(), scope,
+                 {'completed_count': 1, f"done_{bucket}": 1})
+
+def _visible_rows(session, chat_id, since, until=None):
+    """Rollup rows a user sees: their personal rows plus their households' shared rows."""
+    query = session.query(DailyStat).filter(
+        or_(
+            and_(DailyStat.chat_id == chat_id, DailyStat.scope == 'personal'),
+            and_(DailyStat.chat_id.in_(household_ids_select(chat_id)), DailyStat.scope == 'shared')
+        ),
+        DailyStat.date >= since
+    )
+    if until is not None:
+        query = query.filter(DailyStat.date <= until)
+    return query.all()
+
+def get_completed_counts(session, day, chat_ids, household_ids):
+    """Returns ({chat_id: personal completions}, {household_id: shared
+    completions}) for one day, limited to the given chats and households."""
+    rows = session.query(DailyStat.chat_id, DailyStat.scope, DailyStat.completed_count).filter(
+        DailyStat.date == day,
+        or_(
+            and_(DailyStat.chat_id.in_(chat_ids), DailyStat.scope == 'personal'),
+            and_(DailyStat.chat_id.in_(household_ids), DailyStat.scope == 'shared')
+        )
+    ).all()
+    personal = {}
+    shared = {}
+    for key, scope, completed in rows:
+        counts = shared if scope == 'shared' else personal
+        counts[key] = counts.get(key, 0) + completed
+    return personal, shared
+
+def get_streak(session, chat_id, today, max_days=366):
+    """Consecutive days with at least one completion, ending today (or
+    yesterday, if nothing was completed today yet)."""
+    days = {r.date for r in _visible_rows(session, chat_id, today - timedelta(days=max_days), today)
+            if r.completed_count}
+    day = today if today in days else today - timedelta(days=1)
+    streak = 0
+    while day in days:
+        streak += 1
+        day -= timedelta(days=1)
+    return streak
+
+def get_weekly_totals(session, chat_id, today, weeks=4):
+    """Completions per week (weeks start on Sunday), most recent week first.
+    Returns [(week_start_date, completed), ...] of length `weeks`."""
+    this_week = today - timedelta(days=(today.weekday() + 1) % 7)
+    since = this_week - timedelta(weeks=weeks - 1)
+    totals = {since + timedelta(weeks=i): 0 for i in range(weeks)}
+    for r in _visible_rows(session, chat_id, since, today):
+        week = r.date - timedelta(days=(r.date.weekday() + 1) % 7)
+        totals[week] += r.completed_count
+    return sorted(totals.items(), reverse=True)
+
+def get_median_bucket(session, chat_id, since):
+    """Median time-to-done since `since`, as one of DONE_BUCKETS (None if no data)."""
+    counts = dict.fromkeys(DONE_BUCKETS, 0)
+    for r in _visible_rows(session, chat_id, since):
+        for bucket in DONE_BUCKETS:
+            counts[bucket] += getattr(r, f"done_{bucket}")
+    total = sum(counts.values())
+    if not total:
+        return None
+    seen = 0
+    for bucket in DONE_BUCKETS:
+        seen += counts[bucket]
+        if seen * 2 >= total:
+            return bucket
+
+def backfill_daily_stats(session_factory, batch_size=1000):
+    """Rebuilds daily_stats from tasks and tasks_archive in one pass.
+
+    Rows are read in id-ordered batches; totals are accumulated in memory
+    (one entry per chat/day) and then written with overwrite semantics, so
+    the job can be re-run safely. Returns the number of rollup rows written.
+    """
+    totals = {}
+
+    def add(key, column):
+        row = totals.setdefault(key, {})
+        row[column] = row.get(column, 0) + 1
+
+    for model, key_column in ((Task, Task.id), (TaskArchive, TaskArchive.archive_id)):
+        last = None
+        while True:
+            session = session_factory()
+            try:
+                query = session.query(
+                    key_column, model.chat_id, model.is_shared, model.household_id, model.status,
+                    model.created_at, model.completed_at
+                )
+                if last is not None:
+                    query = query.filter(key_column > last)
+                rows = query.order_by(key_column).limit(batch_size).all()
+            finally:
+                session.close()
+            if not rows:
+                break
+            last = rows[-1][0]
+            for _, chat_id, is_shared, household_id, status, created_at, completed_at in rows:
+                owner, scope = (household_id, 'shared') if is_shared else (chat_id, 'personal')
+                if created_at:
+                    add((owner, created_at.date(), scope), 'created_count')
+                if status == 'done' and completed_at:
+                    add((owner, completed_at.date(), scope), 'completed_count')
+                    add((owner, completed_at.date(), scope), f"done_{completion_bucket(created_at, completed_at)}")
+
+    columns = ('created_count', 'completed_count') + tuple(f"done_{b}" for b in DONE_BUCKETS)
+    items = list(totals.items())
+    for i in range(0, len(items), batch_size):
+        session = session_factory()
+        try:
+            for (chat_id, day, scope), values in items[i:i + batch_size]:
+                _write_stats(session, chat_id, day, scope,
+                             {c: values.get(c, 0) for c in columns}, replace=True)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+    logger.info(f"Daily stats backfill: wrote {len(items)} rollup rows")
+    return len(items)
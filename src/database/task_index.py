@@ -0,0 +1,254 @@
+import os
+import logging
+import threading
+from collections import OrderedDict
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from src.database.core import SessionLocal
+from src.database.models import Task, HouseholdMember, PRIORITY_CODES
+from src.database.cache_bus import on_event
+from src.database.read_models import PendingTask, select_rows
+
+logger = logging.getLogger(__name__)
+
+# In-process index of pending tasks: one entry per chat (its own pending
+# tasks) plus one pool per household (its shared Home tasks). Entries load on
+# first use and are kept current by write-through from every ORM commit in
+# this process. Writes made by other processes only reach it through the
+# cache bus (CACHE_BUS_ENABLED) — without it, keep the index off for
+# multi-instance deployments.
+TASK_INDEX_ENABLED = os.getenv("TASK_INDEX_ENABLED", "0") == "1"
+TASK_INDEX_MAX_CHATS = int(os.getenv("TASK_INDEX_MAX_CHATS", "500"))
+
+def _order(task):
+    # Same as ORDER BY priority_code, id
+    return PRIORITY_CODES.index(task.priority), task.id
+
+_lock = threading.Lock()
+_chats = OrderedDict()  # chat_id -> (household ids, {task_id: PendingTask}), LRU order
+_households = {}  # household_id -> {task_id: PendingTask} (shared Home tasks)
+_household_refs = {}  # household_id -> cached chats that are members
+_generation = 0  # bumped by every change; a load that raced one isn't cached
+
+def _release_households(household_ids):
+    for hid in household_ids:
+        _household_refs[hid] -= 1
+        if not _household_refs[hid]:
+            del _household_refs[hid]
+            _households.pop(hid, None)
+
+def _drop_chat(chat_id):
+    entry = _chats.pop(chat_id, None)
+    if entry is not None:
+        _release_households(entry[0])
+
+def _visible(chat_id):
+    household_ids, own = _chats[chat_id]
+    tasks = dict(own)
+    for hid in household_ids:
+        tasks.update(_households.get(hid, {}))
+    return sorted(tasks.values(), key=_order)
+
+def _load(chat_id):
+    from src.database.households import get_household_ids
+
+    with _lock:
+        generation = _generation
+        loaded = set(_households)
+    session = SessionLocal()
+    try:
+        household_ids = tuple(get_household_ids(session, chat_id))
+        own = {t.id: t for t in select_rows(session, PendingTask, Task.chat_id == chat_id, Task.status == 'pending')}
+        missing = [hid for hid in household_ids if hid not in loaded]
+        pools = {hid: {} for hid in missing}
+        if missing:
+            for task in select_rows(session, PendingTask, Task.household_id.in_(missing),
+                                    Task.status == 'pending', Task.parent_category == 'home'):
+                pools[task.household_id][task.id] = task
+    finally:
+        session.close()
+
+    with _lock:
+        if _generation != generation or chat_id in _chats:
+            # A write landed mid-load: serve this result once, don't cache it
+            tasks = dict(own)
+            for hid in household_ids:
+                tasks.update(pools.get(hid) or _households.get(hid, {}))
+            return sorted(tasks.values(), key=_order)
+        for hid in household_ids:
+            _households.setdefault(hid, pools.get(hid, {}))
+            _household_refs[hid] = _household_refs.get(hid, 0) + 1
+        _chats[chat_id] = (household_ids, own)
+        while len(_chats) > TASK_INDEX_MAX_CHATS:
+            _drop_chat(next(iter(_chats)))
+        return _visible(chat_id)
+
+def pending_for_chat(chat_id):
+    """Pending tasks `chat_id` can see (own + its households' shared Home),
+    ordered by priority then id. None when the index is disabled."""
+    if not TASK_INDEX_ENABLED:
+        return None
+    with _lock:
+        if chat_id in _chats:
+            _chats.move_to_end(chat_id)
+            return _visible(chat_id)
+    return _load(chat_id)
+
+def find_pending_task(chat_id, task_id):
+    """A pending task visible to `chat_id`, from the index. None if it isn't
+    there (or the index is disabled) — callers fall back to the DB."""
+    if not TASK_INDEX_ENABLED:
+        return None
+    with _lock:
+        entry = _chats.get(chat_id)
+        if entry is not None:
+            _chats.move_to_end(chat_id)
+            task = entry[1].get(task_id)
+            for hid in entry[0]:
+                task = task or _households.get(hid, {}).get(task_id)
+            return task
+    return next((t for t in _load(chat_id) if t.id == task_id), None)
+
+def invalidate_chat(chat_id=None):
+    """Drops one chat's entry (or the whole index); it reloads on next use."""
+    global _generation
+    with _lock:
+        _generation += 1
+        if chat_id is None:
+            _chats.clear()
+            _households.clear()
+            _household_refs.clear()
+        else:
+            _drop_chat(chat_id)
+
+def invalidate_household(household_id):
+    """Drops a household's pool and every cached chat that is a member."""
+    global _generation
+    with _lock:
+        _generation += 1
+        for chat_id in [c for c, (hids, _) in _chats.items() if household_id in hids]:
+            _drop_chat(chat_id)
+        _households.pop(household_id, None)
+
+@on_event('chat')
+def _evict_remote_chat(chat_id):
+    invalidate_chat(chat_id)
+
+@on_event('household')
+def _evict_remote_household(household_id):
+    if household_id is None:
+        invalidate_chat()
+    else:
+        invalidate_household(household_id)
+
+def index_stats():
+    with _lock:
+        return {
+            'chats': len(_chats),
+            'households': len(_households),
+            'tasks': sum(len(e[1]) for e in _chats.values()) + sum(len(p) for p in _households.values()),
+        }
+
+def _apply(task_id, task, chat_id):
+    """Replaces every cached copy of a task with `task` (None: it's gone or
+    no longer pending). Caller holds _lock."""
+    global _generation
+    _generation += 1
+    entry = _chats.get(chat_id)
+    if entry is not None:
+        entry[1].pop(task_id, None)
+    for pool in _households.values():
+        pool.pop(task_id, None)
+    if task is None:
+        return
+    if entry is not None:
+        entry[1][task_id] = task
+    if task.household_id in _households and task.parent_category == 'home':
+        _households[task.household_id][task_id] = task
+
+# --- Write-through -----------------------------------------------------------
+# after_flush records what each flush changed in session.info; after_commit
+# applies it, after_rollback forgets it. Rows whose state isn't fully loaded
+# (server defaults such as created_at) are re-read once after the commit.
+# Bulk UPDATE/DELETE statements bypass the ORM and are not seen here.
+
+@event.listens_for(Session, "after_flush")
+def _record_changes(session, flush_context):
+    if not TASK_INDEX_ENABLED:
+        return
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, HouseholdMember):
+            changes = session.info.setdefault("task_index", {})
+            changes[('member', obj.chat_id)] = None
+            continue
+        if not isinstance(obj, Task):
+            continue
+        changes = session.info.setdefault("task_index", {})
+        state = inspect(obj)
+        if obj in session.deleted:
+            changes[('task', obj.id)] = (state.dict.get('chat_id'), None)
+        elif state.dict.get('status', 'pending') != 'pending':
+            changes[('task', obj.id)] = (obj.chat_id, None)
+        elif all(f in state.dict for f in PendingTask._fields):
+            changes[('task', obj.id)] = (obj.chat_id, PendingTask._make(state.dict[f] for f in PendingTask._fields))
+        else:
+            changes[('task', obj.id)] = (obj.chat_id, 'reload')
+
+@event.listens_for(Session, "after_commit")
+def _apply_changes(session):
+    global _generation
+    changes = session.info.pop("task_index", None)
+    if not changes:
+        return
+    reload = [key[1] for key, value in changes.items() if key[0] == 'task' and value[1] == 'reload']
+    fresh = {}
+    if reload:
+        reader = SessionLocal()
+        try:
+            fresh = {t.id: t for t in select_rows(reader, PendingTask, Task.id.in_(reload), Task.status == 'pending')}
+        except Exception as e:
+            logger.warning(f"Task index: could not re-read {len(reload)} task(s), dropping the index: {e}")
+            invalidate_chat()
+            return
+        finally:
+            reader.close()
+    with _lock:
+        for (kind, key), value in changes.items():
+            if kind == 'member':
+                _generation += 1
+                _drop_chat(key)
+                continue
+            chat_id, task = value
+            _apply(key, fresh.get(key) if task == 'reload' else task, chat_id)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_changes(session):
+    session.info.pop("task_index", None)
+
+def verify(session_factory=SessionLocal):
+    """Compares every cached chat with the database. Mismatched chats are
+    dropped (they reload on next use). Returns their chat ids."""
+    from src.bot.utils import get_accessible_filter
+
+    with _lock:
+        chat_ids = list(_chats)
+    mismatched = []
+    for chat_id in chat_ids:
+        with _lock:
+            if chat_id not in _chats:
+                continue
+            generation = _generation
+            cached = _visible(chat_id)
+        session = session_factory()
+        try:
+            actual = select_rows(session, PendingTask, get_accessible_filter(chat_id), Task.status == 'pending',
+                                 order_by=(Task.priority, Task.id))
+        finally:
+            session.close()
+        with _lock:
+            if cached != actual and _generation == generation:
+                mismatched.append(chat_id)
+                _drop_chat(chat_id)
+    if mismatched:
+        logger.warning(f"Task index: {len(mismatched)} chat(s) out of sync with the DB, dropped: {mismatched}")
+    return mismatched
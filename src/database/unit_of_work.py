@@ -0,0 +1,117 @@
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from src.database.routing import ReadSession
+
+logger = logging.getLogger(__name__)
+
+# One unit of work per update (opened by bot.concurrency): every handler and
+# helper that runs for the update shares one session, which is committed when
+# the update is done and rolled back if a handler failed. Handlers get it from
+# current_session() and never close it themselves.
+#
+# A write transaction must not stay open while a handler awaits Telegram: on
+# SQLite it holds the single writer lock (see sqlite_mode), and a second update
+# writing meanwhile would block the event loop that the first one needs to
+# finish. So a handler that writes calls commit_current() before its first
+# await after the write — which also means a confirmation is only sent for
+# data that is in, and a failed commit can still be queued (degraded) or
+# reported. Reads may span awaits; the final commit then has nothing to write.
+# Side effects that must only happen once the data is in (scheduling a
+# reminder, dropping a cache) go through after_commit().
+
+_current = ContextVar("unit_of_work", default=None)
+
+class UnitOfWork:
+    """Database work of one update. The session opens on first use, so updates
+    that never touch the DB don't check out a connection."""
+    __slots__ = ("chat_id", "failed", "_session")
+
+    def __init__(self, chat_id=None):
+        self.chat_id = chat_id
+        self.failed = False
+        self._session = None
+
+    @property
+    def session(self):
+        if self._session is None:
+            # Replica reads with read-your-writes; the first write moves it to the primary
+            self._session = ReadSession(self.chat_id)
+        return self._session
+
+    def finish(self):
+        """Commits (rolls back if the update failed) and closes the session."""
+        if self._session is None:
+            return
+        try:
+            if self.failed:
+                self._session.rollback()
+            else:
+                self._session.commit()
+        except Exception:
+            self._session.rollback()
+            raise
+        finally:
+            self._session.close()
+            self._session = None
+
+@contextmanager
+def unit_of_work(chat_id=None):
+    """Runs the block as one unit of work: committed when it exits normally,
+    rolled back when it raises or fail_current() was called."""
+    unit = UnitOfWork(chat_id)
+    token = _current.set(unit)
+    try:
+        yield unit
+    except BaseException:
+        unit.failed = True
+        raise
+    finally:
+        _current.reset(token)
+        unit.finish()
+
+def current_session():
+    """The session of the update being handled."""
+    unit = _current.get()
+    if unit is None:
+        raise RuntimeError("current_session() called outside a unit of work")
+    return unit.session
+
+def commit_current():
+    """Commits the current update's writes now (see above). If the commit
+    fails the session is rolled back and the error raised; either way the
+    session stays usable for the rest of the update."""
+    unit = _current.get()
+    if unit is None or unit._session is None:
+        return
+    try:
+        unit._session.commit()
+    except Exception:
+        unit._session.rollback()
+        raise
+
+def fail_current():
+    """Makes the current unit of work roll back instead of committing (the
+    bot's error handler calls this; handler exceptions don't reach the unit)."""
+    unit = _current.get()
+    if unit is not None:
+        unit.failed = True
+
+def after_commit(session, fn, *args):
+    """Runs fn(*args) once `session` commits; dropped if it rolls back.
+    Attributes of the committed objects can still be read at that point."""
+    session.info.setdefault("after_commit", []).append((fn, args))
+
+@event.listens_for(Session, "after_commit")
+def _run_after_commit(session):
+    for fn, args in session.info.pop("after_commit", ()):
+        try:
+            fn(*args)
+        except Exception as e:
+            logger.error(f"after_commit {getattr(fn, '__name__', fn)} failed: {e}", exc_info=True)
+
+@event.listens_for(Session, "after_rollback")
+def _drop_after_commit(session):
+    session.info.pop("after_commit", None)
@@ -1 +1 @@
-# Scheduler package
+# Scheduler package
@@ -1,212 +1,566 @@
-import asyncio
-import logging
-import os
-import random
-from datetime import datetime, timedelta
-from telegram import Bot
-from src.database.core import SessionLocal
-from src.database.models import Task
-
-logger = logging.getLogger(__name__)
-
-async def send_message_async(chat_id, text, reply_markup=None):
-    token = os.getenv("BOT_TOKEN")
-    if not token:
-        logger.error("BOT_TOKEN not found inside job")
-        return
-    async with Bot(token=token) as bot:
-        await bot.send_message(chat_id=chat_id, text=text, parse_mode='HTML', reply_markup=reply_markup)
-
-def send_reminder_job(task_id, chat_id):
-    session = SessionLocal()
-    try:
-        task = session.query(Task).filter(Task.id == task_id).first()
-        if task and task.status != 'done':
-            logger.info(f"Sending reminder for task {task_id} to chat {chat_id}")
-            text = f"⏰ <b>תזכורת למשימה:</b>\n{task.text}"
-
-            from telegram import InlineKeyboardMarkup, InlineKeyboardButton
-            from src.bot.constants import SNOOZE_1H_PREFIX, EDIT_TASK, VIEW_TASK
-
-            keyboard = [
-                [InlineKeyboardButton("💤 נודניק (1 שעה)", callback_data=f"{SNOOZE_1H_PREFIX}{task.id}")],
-                [InlineKeyboardButton("✏️ ערוך/צפה", callback_data=f"{VIEW_TASK}{task.id}")]
-            ]
-            markup = InlineKeyboardMarkup(keyboard)
-
-            asyncio.run(send_message_async(chat_id, text, reply_markup=markup))
-            logger.info(f"Reminder sent successfully for task {task_id}")
-        else:
-            logger.info(f"Skipping reminder for task {task_id}: task not found or already done")
-    except Exception as e:
-        logger.error(f"Error in send_reminder_job for task {task_id}: {e}", exc_info=True)
-    finally:
-        session.close()
-
-# Sarcastic opening hooks keyed by performance bracket
-_BRIEFING_HOOKS = {
-    'amazing': [  # completed > remaining
-        "וואו, אתמול הייתם מכונת ביצוע! היום בוא נראה אם זה לא היה מקרי 🏆🎰",
-        "אתמול סיימתם יותר ממה שנשאר — חשודים ביעילות. המשיכו ככה 🕵️✨",
-        "מישהו שם קפה כפול אתמול? ביצועים מרשימים. היום אל תאכזבו 💪☕",
-    ],
-    'good': [  # completed >= 2 and completed >= remaining/2
-        "אתמול הייתם בסדר גמור. לא גיבורי על, אבל גם לא אסון. ממוצע יציב 📊👍",
-        "סיימתם כמה דברים אתמול — נחמד. היום יש הזדמנות להתקדם עוד 🚶‍♂️🌤️",
-        "אתמול עבדתם, היום עובדים. החיים ממשיכים. בואו נראה מה יש 📋🫡",
-    ],
-    'meh': [  # completed == 1
-        "אתמול סיימתם משימה אחת. אחת. נו, עדיף מאפס, נכון? 🤷‍♂️1️⃣",
-        "משימה אחת אתמול? לפחות היה סימן חיים. היום אפשר לשפר 📈🐌",
-        "אוקיי, אתמול לא היה היום הכי פרודוקטיבי. קורה. היום זה היום 🌅💫",
-    ],
-    'zero': [  # completed == 0, remaining > 0
-        "אתמול? אפס. נאדה. כלום. בוא ננסה משהו חדש — לעשות דברים 🫠📭",
-        "אתמול הייתם בחופשה מנטלית. היום חוזרים לעבודה, כן? 🏖️➡️💼",
-        "אפס משימות אתמול. המשימות לא הולכות לשום מקום, הן מחכות בסבלנות 🧘‍♀️⏳",
-        "יום אחד בלי אף סימון V. חלום של כל משימה — לחיות לנצח 🧟‍♂️📋",
-    ],
-    'clean': [  # no pending tasks at all
-        "אין לכם אף משימה פתוחה. מה אתם, רובוטים? תהנו מהיום 🤖🎉",
-        "רשימה ריקה. יום חופשי. אלא אם כן שכחתם להוסיף משהו 🤔🏝️",
-    ],
-}
-
-def _get_briefing_hook(completed_yesterday, remaining_today):
-    """Pick a sarcastic opening based on yesterday's performance."""
-    if remaining_today == 0 and completed_yesterday == 0:
-        return random.choice(_BRIEFING_HOOKS['clean'])
-    if remaining_today == 0:
-        return random.choice(_BRIEFING_HOOKS['clean'])
-    if completed_yesterday == 0:
-        return random.choice(_BRIEFING_HOOKS['zero'])
-    if completed_yesterday == 1:
-        return random.choice(_BRIEFING_HOOKS['meh'])
-    if completed_yesterday > remaining_today:
-        return random.choice(_BRIEFING_HOOKS['amazing'])
-    return random.choice(_BRIEFING_HOOKS['good'])
-
-def _age_indicator(created_at, now_naive):
-    """Return age emoji: 🏛️ >7d, 🐢 >3d, empty otherwise."""
-    if not created_at:
-        return ""
-    age = now_naive - created_at
-    if age.days > 7:
-        return " 🏛️"
-    if age.days > 3:
-        return " 🐢"
-    return ""
-
-def _format_task_line(task, now_naive):
-    """Format a single task line for the briefing."""
-    icon = "🔴" if task.priority == 'urgent' else "🟡" if task.priority == 'normal' else "🟢"
-    age = _age_indicator(task.created_at, now_naive)
-    return f"  {icon} {task.text}{age}"
-
-def daily_briefing_job():
-    from src.bot.utils import ALLOWED_USERS, get_now
-
-    session = SessionLocal()
-    try:
-        now = get_now()
-        now_naive = now.replace(tzinfo=None)
-
-        # Yesterday boundaries (naive, Israel time)
-        yesterday_start = (now_naive - timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
-        yesterday_end = yesterday_start.replace(hour=23, minute=59, second=59)
-
-        # All pending tasks
-        pending = session.query(Task).filter(Task.status == 'pending').all()
-
-        # Tasks completed yesterday
-        completed_yesterday_all = session.query(Task).filter(
-            Task.status == 'done',
-            Task.completed_at >= yesterday_start,
-            Task.completed_at <= yesterday_end
-        ).all()
-
-        # Separate shared vs personal pending
-        shared_pending = [t for t in pending if t.is_shared and t.parent_category == 'home']
-        personal_pending = [t for t in pending if not t.is_shared]
-
-        # Build per-user personal task lists
-        user_personal = {}
-        for t in personal_pending:
-            user_personal.setdefault(t.chat_id, []).append(t)
-
-        # Completed yesterday per user + shared
-        shared_completed = [t for t in completed_yesterday_all if t.is_shared]
-        user_completed_count = {}
-        for t in completed_yesterday_all:
-            if not t.is_shared:
-                user_completed_count[t.chat_id] = user_completed_count.get(t.chat_id, 0) + 1
-
-        # All users who should get a briefing
-        all_user_ids = set(user_personal.keys())
-        if ALLOWED_USERS:
-            all_user_ids.update(ALLOWED_USERS)
-
-        # Add shared completed count to all users
-        for uid in all_user_ids:
-            user_completed_count.setdefault(uid, 0)
-            user_completed_count[uid] += len(shared_completed)
-
-        priority_order = {'urgent': 0, 'normal': 1, 'low': 2}
-
-        for chat_id in all_user_ids:
-            my_tasks = user_personal.get(chat_id, [])
-            total_remaining = len(my_tasks) + len(shared_pending)
-
-            # Quiet mode: skip if zero pending tasks
-            if total_remaining == 0 and user_completed_count.get(chat_id, 0) == 0:
-                continue
-
-            completed_count = user_completed_count.get(chat_id, 0)
-            hook = _get_briefing_hook(completed_count, total_remaining)
-
-            # Sort by priority then age (oldest first within same priority)
-            my_tasks.sort(key=lambda t: (priority_order.get(t.priority, 99), t.created_at or now_naive))
-            shared_sorted = sorted(shared_pending, key=lambda t: (priority_order.get(t.priority, 99), t.created_at or now_naive))
-
-            msg = f"☀️ <b>תדריך בוקר</b> — {now_naive.strftime('%d/%m')}\n\n"
-            msg += f"{hook}\n\n"
-
-            if completed_count > 0:
-                msg += f"✅ אתמול סיימתם: <b>{completed_count}</b> משימות\n"
-            msg += f"📌 נשאר היום: <b>{total_remaining}</b>\n\n"
-
-            # Personal section (Rule of 3)
-            if my_tasks:
-                top_personal = my_tasks[:3]
-                msg += f"👤 <b>המשימות שלי</b> ({len(my_tasks)})\n"
-                for t in top_personal:
-                    msg += _format_task_line(t, now_naive) + "\n"
-                if len(my_tasks) > 3:
-                    msg += f"  <i>...ועוד {len(my_tasks) - 3}</i>\n"
-                msg += "\n"
-
-            # Shared section (Rule of 3)
-            if shared_sorted:
-                top_shared = shared_sorted[:3]
-                msg += f"👥 <b>המשימות המשותפות</b> ({len(shared_sorted)})\n"
-                for t in top_shared:
-                    msg += _format_task_line(t, now_naive) + "\n"
-                if len(shared_sorted) > 3:
-                    msg += f"  <i>...ועוד {len(shared_sorted) - 3}</i>\n"
-                msg += "\n"
-
-            if total_remaining == 0:
-                msg += "🎉 <b>אין משימות פתוחות — יום חופשי!</b>\n"
-
-            msg += "📲 /list לרשימה המלאה"
-
-            try:
-                asyncio.run(send_message_async(chat_id, msg))
-                logger.info(f"Daily briefing sent to chat {chat_id}")
-            except Exception as e:
-                logger.error(f"Failed to send daily briefing to chat {chat_id}: {e}", exc_info=True)
-
-    except Exception as e:
-        logger.error(f"Error in daily_briefing_job: {e}", exc_info=True)
-    finally:
-        session.close()
+import logging
+import os
+import random
+import time
+import zoneinfo
+from datetime import datetime, timedelta, timezone
+from src.database.core import SessionLocal
+from src.database.models import Task, UserPreference, PRIORITY_CODES
+
+logger = logging.getLogger(__name__)
+
+# Done tasks older than this move to tasks_archive (never less than 2 days,
+# so recent completions always stay in the hot table)
+ARCHIVE_AFTER_DAYS = max(2, int(os.getenv("ARCHIVE_AFTER_DAYS", "30")))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "200"))
+
+# Outbox dispatcher: retries back off exponentially from OUTBOX_BACKOFF_BASE
+# seconds up to OUTBOX_BACKOFF_MAX; after OUTBOX_MAX_ATTEMPTS a message is
+# dead-lettered. Delivered rows are pruned after OUTBOX_RETENTION_DAYS.
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "50"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_BACKOFF_BASE = int(os.getenv("OUTBOX_BACKOFF_BASE", "5"))
+OUTBOX_BACKOFF_MAX = int(os.getenv("OUTBOX_BACKOFF_MAX", "1800"))
+OUTBOX_SEND_LEASE = timedelta(seconds=120)
+OUTBOX_RETENTION_DAYS = int(os.getenv("OUTBOX_RETENTION_DAYS", "14"))
+
+# Local hours (start-end) during which DB_KEEPALIVE pings the database
+DB_ACTIVE_HOURS = os.getenv("DB_ACTIVE_HOURS", "07:00-23:30")
+
+def build_reminder_message(tasks):
+    """Text and keyboard for the reminders of one chat. A single task keeps
+    the classic reminder; several become one digest with a snooze/view row
+    per task. Returns (html_text, reply_markup)."""
+    from telegram import InlineKeyboardMarkup, InlineKeyboardButton
+    from src.bot.constants import SNOOZE_1H, VIEW_TASK
+    from src.bot.callbacks import encode
+
+    if len(tasks) == 1:
+        task = tasks[0]
+        text = f"⏰ <b>תזכורת למשימה:</b>\n{task.text}"
+        keyboard = [
+            [InlineKeyboardButton("💤 נודניק (1 שעה)", callback_data=encode(SNOOZE_1H, task.id))],
+            [InlineKeyboardButton("✏️ ערוך/צפה", callback_data=encode(VIEW_TASK, task.id))]
+        ]
+        return text, InlineKeyboardMarkup(keyboard)
+
+    lines = [f"⏰ <b>תזכורות ({len(tasks)}):</b>"]
+    keyboard = []
+    for num, task in enumerate(tasks, 1):
+        lines.append(f"{num}. {task.text}")
+        keyboard.append([
+            InlineKeyboardButton(f"💤 {num}. {task.text[:24]}", callback_data=encode(SNOOZE_1H, task.id)),
+            InlineKeyboardButton(f"✏️ {num}", callback_data=encode(VIEW_TASK, task.id))
+        ])
+    return "\n".join(lines), InlineKeyboardMarkup(keyboard)
+
+def send_reminder_job(task_id, chat_id):
+    """Claims the reminder in the delivery ledger and schedules the chat's
+    digest flush, which sends every reminder claimed within the window as
+    one message. A reminder that was already claimed (duplicate or recovery
+    job, another instance) is skipped. Runs in the thread pool, like every
+    job that only does DB work, so a burst never blocks the event loop."""
+    from src.bot.utils import ISRAEL_TZ
+    from src.database.deliveries import claim_reminder
+    from src.scheduler.service import schedule_reminder_digest
+
+    session = SessionLocal()
+    try:
+        task = session.query(Task).filter(Task.id == task_id).first()
+        if task and task.status != 'done' and task.reminder_time is None:
+            logger.info(f"Skipping reminder for task {task_id}: reminder was cleared")
+        elif task and task.status != 'done':
+            if claim_reminder(session, task, ISRAEL_TZ) is None:
+                return
+            session.commit()
+            logger.info(f"Reminder for task {task_id} claimed; digest pending for chat {chat_id}")
+            schedule_reminder_digest(chat_id)
+        else:
+            logger.info(f"Skipping reminder for task {task_id}: task not found or already done")
+    except Exception as e:
+        session.rollback()
+        logger.error(f"Error in send_reminder_job for task {task_id}: {e}", exc_info=True)
+    finally:
+        session.close()
+
+def flush_reminder_digest_job(chat_id):
+    """Sends the chat's claimed-but-unsent reminders as one outbox message.
+
+    Tasks completed or rescheduled since their claim are dropped from the
+    ledger (nothing to send). Two flushes racing on the same rows derive the
+    same idempotency key, so only one message is enqueued.
+    """
+    from src.database.models import ReminderDelivery
+    from src.database.outbox import enqueue
+    from src.scheduler.service import wake_outbox_dispatcher
+
+    session = SessionLocal()
+    try:
+        claimed = session.query(ReminderDelivery).filter(
+            ReminderDelivery.chat_id == chat_id,
+            ReminderDelivery.outbox_id.is_(None)
+        ).order_by(ReminderDelivery.id).all()
+        if not claimed:
+            return
+        tasks = {t.id: t for t in session.query(Task).filter(Task.id.in_([d.task_id for d in claimed]))}
+
+        due = []
+        for delivery in claimed:
+            task = tasks.get(delivery.task_id)
+            if task is None or task.status == 'done' or task.reminder_time != delivery.reminder_time:
+                session.delete(delivery)
+            else:
+                due.append((delivery, task))
+
+        if due:
+            text, markup = build_reminder_message([task for _, task in due])
+            if len(due) == 1:
+                task = due[0][1]
+                key = f"reminder:{task.id}:{task.reminder_time:%Y%m%d%H%M}"
+            else:
+                key = f"digest:{chat_id}:{due[0][0].id}"
+            message = enqueue(session, key, chat_id, text, reply_markup=markup)
+            if message is not None:
+                session.flush()
+                for delivery, _ in due:
+                    delivery.outbox_id = message.id
+        session.commit()
+        if due:
+            logger.info(f"Queued {len(due)} reminder(s) for chat {chat_id} in one message")
+            wake_outbox_dispatcher()
+    except Exception as e:
+        session.rollback()
+        logger.error(f"Error flushing reminder digest for chat {chat_id}: {e}", exc_info=True)
+    finally:
+        session.close()
+
+# Sarcastic opening hooks keyed by performance bracket
+_BRIEFING_HOOKS = {
+    'amazing': [  # completed > remaining
+        "וואו, אתמול הייתם מכונת ביצוע! היום בוא נראה אם זה לא היה מקרי 🏆🎰",
+        "אתמול סיימתם יותר ממה שנשאר — חשודים ביעילות. המשיכו ככה 🕵️✨",
+        "מישהו שם קפה כפול אתמול? ביצועים מרשימים. היום אל תאכזבו 💪☕",
+    ],
+    'good': [  # completed >= 2 and completed >= remaining/2
+        "אתמול הייתם בסדר גמור. לא גיבורי על, אבל גם לא אסון. ממוצע יציב 📊👍",
+        "סיימתם כמה דברים אתמול — נחמד. היום יש הזדמנות להתקדם עוד 🚶‍♂️🌤️",
+        "אתמול עבדתם, היום עובדים. החיים ממשיכים. בואו נראה מה יש 📋🫡",
+    ],
+    'meh': [  # completed == 1
+        "אתמול סיימתם משימה אחת. אחת. נו, עדיף מאפס, נכון? 🤷‍♂️1️⃣",
+        "משימה אחת אתמול? לפחות היה סימן חיים. היום אפשר לשפר 📈🐌",
+        "אוקיי, אתמול לא היה היום הכי פרודוקטיבי. קורה. היום זה היום 🌅💫",
+    ],
+    'zero': [  # completed == 0, remaining > 0
+        "אתמול? אפס. נאדה. כלום. בוא ננסה משהו חדש — לעשות דברים 🫠📭",
+        "אתמול הייתם בחופשה מנטלית. היום חוזרים לעבודה, כן? 🏖️➡️💼",
+        "אפס משימות אתמול. המשימות לא הולכות לשום מקום, הן מחכות בסבלנות 🧘‍♀️⏳",
+        "יום אחד בלי אף סימון V. חלום של כל משימה — לחיות לנצח 🧟‍♂️📋",
+    ],
+    'clean': [  # no pending tasks at all
+        "אין לכם אף משימה פתוחה. מה אתם, רובוטים? תהנו מהיום 🤖🎉",
+        "רשימה ריקה. יום חופשי. אלא אם כן שכחתם להוסיף משהו 🤔🏝️",
+    ],
+}
+
+def _get_briefing_hook(completed_yesterday, remaining_today):
+    """Pick a sarcastic opening based on yesterday's performance."""
+    if remaining_today == 0 and completed_yesterday == 0:
+        return random.choice(_BRIEFING_HOOKS['clean'])
+    if remaining_today == 0:
+        return random.choice(_BRIEFING_HOOKS['clean'])
+    if completed_yesterday == 0:
+        return random.choice(_BRIEFING_HOOKS['zero'])
+    if completed_yesterday == 1:
+        return random.choice(_BRIEFING_HOOKS['meh'])
+    if completed_yesterday > remaining_today:
+        return random.choice(_BRIEFING_HOOKS['amazing'])
+    return random.choice(_BRIEFING_HOOKS['good'])
+
+def _age_indicator(created_at, now_naive):
+    """Return age emoji: 🏛️ >7d, 🐢 >3d, empty otherwise."""
+    if not created_at:
+        return ""
+    age = now_naive - created_at
+    if age.days > 7:
+        return " 🏛️"
+    if age.days > 3:
+        return " 🐢"
+    return ""
+
+def _format_task_line(task, now_naive):
+    """Format a single task line for the briefing."""
+    icon = "🔴" if task.priority == 'urgent' else "🟡" if task.priority == 'normal' else "🟢"
+    age = _age_indicator(task.created_at, now_naive)
+    return f"  {icon} {task.text}{age}"
+
+def _build_briefing(local_now, now_naive, my_tasks, shared_tasks, completed_count):
+    """Render one user's morning briefing, or None in quiet mode (nothing
+    pending and nothing completed yesterday). Task lists come pre-sorted."""
+    total_remaining = len(my_tasks) + len(shared_tasks)
+    if total_remaining == 0 and completed_count == 0:
+        return None
+
+    hook = _get_briefing_hook(completed_count, total_remaining)
+
+    msg = f"☀️ <b>תדריך בוקר</b> — {local_now.strftime('%d/%m')}\n\n"
+    msg += f"{hook}\n\n"
+
+    if completed_count > 0:
+        msg += f"✅ אתמול סיימתם: <b>{completed_count}</b> משימות\n"
+    msg += f"📌 נשאר היום: <b>{total_remaining}</b>\n\n"
+
+    # Personal section (Rule of 3)
+    if my_tasks:
+        top_personal = my_tasks[:3]
+        msg += f"👤 <b>המשימות שלי</b> ({len(my_tasks)})\n"
+        for t in top_personal:
+            msg += _format_task_line(t, now_naive) + "\n"
+        if len(my_tasks) > 3:
+            msg += f"  <i>...ועוד {len(my_tasks) - 3}</i>\n"
+        msg += "\n"
+
+    # Shared section (Rule of 3)
+    if shared_tasks:
+        top_shared = shared_tasks[:3]
+        msg += f"👥 <b>המשימות המשותפות</b> ({len(shared_tasks)})\n"
+        for t in top_shared:
+            msg += _format_task_line(t, now_naive) + "\n"
+        if len(shared_tasks) > 3:
+            msg += f"  <i>...ועוד {len(shared_tasks) - 3}</i>\n"
+        msg += "\n"
+
+    if total_remaining == 0:
+        msg += "🎉 <b>אין משימות פתוחות — יום חופשי!</b>\n"
+
+    msg += "📲 /list לרשימה המלאה"
+    return msg
+
+# Distinct briefing timezones, refreshed at most every _TIMEZONE_CACHE_TTL
+# seconds (or on demand via invalidate_briefing_timezones)
+_TIMEZONE_CACHE_TTL = 3600
+_timezone_cache = {'expires': 0.0, 'zones': []}
+
+def invalidate_briefing_timezones():
+    _timezone_cache['expires'] = 0.0
+
+def _briefing_timezones(session):
+    now = time.monotonic()
+    if now >= _timezone_cache['expires']:
+        _timezone_cache['zones'] = [row[0] for row in session.query(UserPreference.timezone).distinct()]
+        _timezone_cache['expires'] = now + _TIMEZONE_CACHE_TTL
+    return _timezone_cache['zones']
+
+def _due_briefings(session, utc_now, slot_minutes):
+    """Returns [(chat_id, local_now, run_at_utc)] for users whose briefing time
+    falls in the current slot of their own timezone. One indexed range query
+    per timezone — users in other slots are never read."""
+    due = []
+    for tz_name in _briefing_timezones(session):
+        try:
+            tz = zoneinfo.ZoneInfo(tz_name)
+        except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+            logger.warning(f"Skipping unknown briefing timezone '{tz_name}'")
+            continue
+        local_now = utc_now.astimezone(tz)
+        minute_of_day = local_now.hour * 60 + local_now.minute
+        slot_start = minute_of_day - minute_of_day % slot_minutes
+        rows = session.query(UserPreference.chat_id, UserPreference.briefing_minute).filter(
+            UserPreference.timezone == tz_name,
+            UserPreference.briefing_minute >= slot_start,
+            UserPreference.briefing_minute < slot_start + slot_minutes
+        ).order_by(UserPreference.briefing_minute, UserPreference.chat_id).all()
+        slot_begin = local_now.replace(hour=slot_start // 60, minute=slot_start % 60, second=0, microsecond=0)
+        for chat_id, minute in rows:
+            chosen = local_now.replace(hour=minute // 60, minute=minute % 60, second=0, microsecond=0)
+            due.append((chat_id, local_now, chosen, slot_begin))
+
+    # Spread sends evenly across the slot, never earlier than the chosen time
+    slot_seconds = slot_minutes * 60
+    result = []
+    for i, (chat_id, local_now, chosen, slot_begin) in enumerate(due):
+        spread = slot_begin + timedelta(seconds=i * slot_seconds / len(due))
+        result.append((chat_id, local_now, max(chosen, spread).astimezone(timezone.utc)))
+    return result
+
+def _task_order(task):
+    return PRIORITY_CODES.index(task.priority), task.created_at or datetime.min, task.id
+
+def briefing_tick_job():
+    """Runs once per briefing slot. Loads data for the slot's users in a few
+    batched queries (on the read replica, if configured), renders their
+    briefings and enqueues each in the outbox with its spread-out send time."""
+    from src.bot.utils import get_now
+    from src.database.stats import get_completed_counts
+    from src.database.households import get_memberships
+    from src.database.outbox import enqueue
+    from src.database.routing import ReadSession
+    from src.database.read_models import BriefingTask, select_rows
+    from src.scheduler.service import BRIEFING_SLOT_MINUTES
+
+    # Query phase — read-only
+    rendered = []
+    session = ReadSession()
+    try:
+        utc_now = datetime.now(timezone.utc)
+        due = _due_briefings(session, utc_now, BRIEFING_SLOT_MINUTES)
+        if not due:
+            return
+        chat_ids = [chat_id for chat_id, _, _ in due]
+        now_naive = get_now().replace(tzinfo=None)
+
+        # Pending tasks, sorted by priority then age (oldest first within same priority)
+        order = (Task.priority, Task.created_at, Task.id)
+        personal = select_rows(session, BriefingTask,
+            Task.status == 'pending',
+            Task.is_shared == 0,
+            Task.chat_id.in_(chat_ids),
+            order_by=order)
+        # Shared Home tasks of the households these users belong to
+        memberships = get_memberships(session, chat_ids)
+        household_ids = {hid for hids in memberships.values() for hid in hids}
+        household_pending = {}
+        if household_ids:
+            shared = select_rows(session, BriefingTask,
+                Task.status == 'pending',
+                Task.household_id.in_(household_ids),
+                Task.parent_category == 'home',
+                order_by=order)
+            for t in shared:
+                household_pending.setdefault(t.household_id, []).append(t)
+
+        user_personal = {}
+        for t in personal:
+            user_personal.setdefault(t.chat_id, []).append(t)
+
+        # Completions yesterday, from the daily_stats rollups
+        yesterday = (now_naive - timedelta(days=1)).date()
+        user_completed_count, household_completed = get_completed_counts(session, yesterday, chat_ids, household_ids)
+
+        for chat_id, local_now, run_at in due:
+            hids = memberships.get(chat_id, [])
+            shared_pending = [t for hid in hids for t in household_pending.get(hid, [])]
+            if len(hids) > 1:
+                shared_pending.sort(key=_task_order)  # same order as the query
+            completed_count = user_completed_count.get(chat_id, 0) + sum(household_completed.get(hid, 0) for hid in hids)
+            msg = _build_briefing(local_now, now_naive, user_personal.get(chat_id, []), shared_pending, completed_count)
+            if msg is not None:
+                rendered.append((chat_id, local_now, run_at, msg))
+    except Exception as e:
+        logger.error(f"Error in briefing_tick_job: {e}", exc_info=True)
+        return
+    finally:
+        session.close()
+
+    # The slot's sends follow; have connections ready for them
+    warm_pool_job(len(rendered))
+
+    # Write phase — primary
+    session = SessionLocal()
+    try:
+        scheduled = 0
+        for chat_id, local_now, run_at, msg in rendered:
+            # One briefing per user per local day, sent at its spread-out time
+            if enqueue(session, f"briefing:{chat_id}:{local_now.date().isoformat()}", chat_id, msg,
+                       not_before=run_at.replace(tzinfo=None)):
+                scheduled += 1
+        session.commit()
+        logger.info(f"Briefing tick: {scheduled}/{len(due)} briefing(s) queued for this slot")
+    except Exception as e:
+        session.rollback()
+        logger.error(f"Error queueing briefings: {e}", exc_info=True)
+    finally:
+        session.close()
+
+def archive_done_tasks_job():
+    """Nightly hot/cold split: moves long-completed tasks to tasks_archive."""
+    from src.bot.utils import get_now
+    from src.database.archive import archive_done_tasks
+
+    try:
+        moved = archive_done_tasks(
+            timedelta(days=ARCHIVE_AFTER_DAYS),
+            get_now().replace(tzinfo=None),
+            batch_size=ARCHIVE_BATCH_SIZE
+        )
+        logger.info(f"Archive job: moved {moved} done task(s) older than {ARCHIVE_AFTER_DAYS} days")
+    except Exception as e:
+        logger.error(f"Error in archive_done_tasks_job: {e}", exc_info=True)
+
+    from src.database.outbox import prune_sent, utc_now_naive
+    from src.database.cache_bus import prune_events, publish_evict_all, CACHE_EVENTS_RETENTION_HOURS
+    pruned_any = False
+    try:
+        pruned = prune_sent(SessionLocal, utc_now_naive() - timedelta(days=OUTBOX_RETENTION_DAYS))
+        if pruned:
+            pruned_any = True
+            logger.info(f"Archive job: pruned {pruned} delivered outbox message(s)")
+    except Exception as e:
+        logger.error(f"Error pruning the outbox: {e}", exc_info=True)
+
+    try:
+        pruned = prune_events(SessionLocal, utc_now_naive() - timedelta(hours=CACHE_EVENTS_RETENTION_HOURS))
+        if pruned:
+            pruned_any = True
+            logger.info(f"Archive job: pruned {pruned} cache event(s)")
+    except Exception as e:
+        logger.error(f"Error pruning cache events: {e}", exc_info=True)
+
+    # The prunes are bulk deletes the flush hooks never see
+    if pruned_any:
+        try:
+            publish_evict_all(SessionLocal)
+        except Exception as e:
+            logger.error(f"Error publishing the prune invalidation: {e}", exc_info=True)
+
+async def _deliver_outbox(rows):
+    """Sends claimed outbox rows. Returns [(id, outcome, detail)] where outcome
+    is 'sent', 'retry' (detail: (delay_seconds, error, count_attempt)) or 'dead'."""
+    from telegram.error import RetryAfter, Forbidden, BadRequest
+    from src.database.outbox import decode_markup
+    from src.scheduler.service import get_bot
+
+    bot = get_bot()
+    if bot is None:
+        logger.error("Outbox: no bot available (scheduler started without one)")
+        return [(row.id, 'retry', (OUTBOX_BACKOFF_BASE, "bot not ready", False)) for row in rows]
+
+    results = []
+    for i, row in enumerate(rows):
+        try:
+            await bot.send_message(chat_id=row.chat_id, text=row.text, parse_mode=row.parse_mode,
+                                   reply_markup=decode_markup(row.reply_markup))
+            results.append((row.id, 'sent', None))
+        except RetryAfter as e:
+            # Flood control is bot-wide: hold this and every remaining message
+            delay = e.retry_after
+            delay = delay.total_seconds() if isinstance(delay, timedelta) else delay
+            logger.warning(f"Outbox: rate limited, pausing {len(rows) - i} message(s) for {delay}s")
+            results.extend((r.id, 'retry', (delay, e, False)) for r in rows[i:])
+            break
+        except (Forbidden, BadRequest) as e:
+            # Bot blocked, chat gone, malformed message — retrying won't help
+            results.append((row.id, 'dead', e))
+        except Exception as e:
+            attempt = row.attempts + 1
+            if attempt >= OUTBOX_MAX_ATTEMPTS:
+                results.append((row.id, 'dead', e))
+            else:
+                delay = min(OUTBOX_BACKOFF_BASE * 2 ** (attempt - 1), OUTBOX_BACKOFF_MAX)
+                results.append((row.id, 'retry', (delay * random.uniform(0.9, 1.1), e, True)))
+    return results
+
+def dispatch_outbox_job():
+    """Drains due outbox messages: claim a batch, send it, record outcomes.
+    Runs in the thread pool; only the sends go to the bot's event loop."""
+    from src.database.outbox import claim_due, mark_sent, mark_retry, mark_dead, utc_now_naive
+    from src.database.deliveries import record_delivered
+    from src.scheduler.service import run_on_loop
+
+    session = SessionLocal()
+    try:
+        rows = claim_due(session, utc_now_naive(), OUTBOX_BATCH_SIZE, OUTBOX_SEND_LEASE)
+    except Exception as e:
+        session.rollback()
+        logger.error(f"Outbox: could not claim messages: {e}", exc_info=True)
+        return
+    finally:
+        session.close()
+    if not rows:
+        return
+
+    try:
+        results = run_on_loop(_deliver_outbox(rows))
+    except Exception as e:
+        # Leases expire and the rows are retried on a later run
+        logger.error(f"Outbox: delivery run failed: {e}", exc_info=True)
+        return
+
+    now = utc_now_naive()
+    session = SessionLocal()
+    try:
+        for message_id, outcome, detail in results:
+            if outcome == 'sent':
+                mark_sent(session, message_id, now)
+            elif outcome == 'retry':
+                delay, error, count_attempt = detail
+                mark_retry(session, message_id, now + timedelta(seconds=delay), error, count_attempt)
+            else:
+                logger.warning(f"Outbox: message {message_id} dead-lettered: {detail}")
+                mark_dead(session, message_id, detail)
+        record_delivered(session, [message_id for message_id, outcome, _ in results if outcome == 'sent'], now)
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        logger.error(f"Outbox: could not record delivery results: {e}", exc_info=True)
+    finally:
+        session.close()
+    sent = sum(1 for _, outcome, _ in results if outcome == 'sent')
+    logger.info(f"Outbox: {sent}/{len(rows)} message(s) sent")
+
+def warm_pool_job(connections=None):
+    """Pre-opens pool connections ahead of a burst: every briefing slot that
+    has sends (up to one per send), or a POOL_WARMUP_TIMES entry."""
+    from src.database.core import warm_pool, pool_stats
+
+    if connections == 0:
+        return
+    try:
+        started = time.monotonic()
+        opened = warm_pool(connections)
+        logger.info(f"Pool warm-up: {opened} connection(s) ready in "
+                    f"{time.monotonic() - started:.2f}s — {pool_stats()}")
+    except Exception as e:
+        logger.error(f"Error in warm_pool_job: {e}", exc_info=True)
+
+async def poll_cache_bus_job():
+    """Evicts what other instances changed. Runs on the event loop, like the
+    handlers whose caches it touches (the poll itself is a socket read on
+    PostgreSQL, one indexed query on SQLite)."""
+    from src.database.cache_bus import poll
+
+    received = poll()
+    if received:
+        logger.debug(f"Cache bus: applied {received} event(s)")
+
+def replay_offline_writes_job():
+    """Replays writes queued during a DB outage, once the circuit lets calls
+    through again. Runs in the thread pool: the first attempts may still hit
+    a dead database."""
+    from src.database.degraded import db_available, has_queued_writes, replay_queued_writes
+
+    if not has_queued_writes() or not db_available():
+        return
+    try:
+        replay_queued_writes()
+    except Exception as e:
+        logger.error(f"Error in replay_offline_writes_job: {e}", exc_info=True)
+
+def verify_task_index_job():
+    """Checks the cached chats of the task index against the DB (drops any
+    that drifted, e.g. after a bulk statement or a write from elsewhere)."""
+    from src.database.task_index import verify, index_stats
+
+    try:
+        mismatched = verify()
+        logger.info(f"Task index check: {len(mismatched)} chat(s) out of sync — {index_stats()}")
+    except Exception as e:
+        logger.error(f"Error in verify_task_index_job: {e}", exc_info=True)
+
+def _in_active_hours(local_now):
+    start, end = (datetime.strptime(t.strip(), "%H:%M").time() for t in DB_ACTIVE_HOURS.split("-"))
+    now = local_now.time()
+    if start <= end:
+        return start <= now < end
+    return now >= start or now < end  # window crosses midnight
+
+def db_keepalive_job():
+    """Keeps serverless compute awake during active hours; idle overnight."""
+    from src.bot.utils import get_now
+    from src.database.core import ping_db
+
+    try:
+        if _in_active_hours(get_now()):
+            ping_db()
+    except Exception as e:
+        logger.warning(f"DB keepalive ping failed: {e}")
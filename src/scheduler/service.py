@@ -1,118 +1,330 @@
-import logging
-from sqlalchemy import text
-from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
-from src.database.core import engine
-
-logger = logging.getLogger(__name__)
-
-jobstores = {
-    'default': SQLAlchemyJobStore(engine=engine)
-}
-
-scheduler = BackgroundScheduler(
-    jobstores=jobstores,
-    timezone="Asia/Jerusalem",
-    job_defaults={'misfire_grace_time': None, 'coalesce': True}
-)
-
-# Job IDs that were renamed or removed in past updates.
-# Must be cleaned from the persistent store BEFORE scheduler.start(),
-# because APScheduler deserializes all stored jobs on start and crashes
-# with LookupError if the referenced function no longer exists.
-_STALE_JOB_IDS = ['daily_summary']
-
-def _clean_stale_jobs():
-    """Remove ghost jobs from the persistent store via raw SQL.
-
-    Uses SessionLocal (not engine.connect) so that failed queries get an
-    explicit rollback — preventing dirty connections from leaking back into
-    the pool and causing f405 errors in later callers.
-    """
-    from src.database.core import SessionLocal
-    session = SessionLocal()
-    try:
-        for job_id in _STALE_JOB_IDS:
-            result = session.execute(
-                text("DELETE FROM apscheduler_jobs WHERE id = :id"),
-                {"id": job_id}
-            )
-            if result.rowcount:
-                logger.info(f"Cleaned stale job '{job_id}' from persistent store")
-        session.commit()
-    except Exception as e:
-        session.rollback()
-        logger.warning(f"Could not clean stale jobs (table may not exist yet): {e}")
-    finally:
-        session.close()
-
-def start_scheduler():
-    _clean_stale_jobs()
-    scheduler.start()
-
-def add_reminder_job(task_id: int, run_date, chat_id: int):
-    scheduler.add_job(
-        'src.scheduler.jobs:send_reminder_job',
-        'date',
-        run_date=run_date,
-        args=[task_id, chat_id],
-        id=f'reminder_{task_id}',
-        replace_existing=True
-    )
-
-def add_daily_briefing_job():
-    if not scheduler.get_job('daily_briefing'):
-        scheduler.add_job(
-            'src.scheduler.jobs:daily_briefing_job',
-            'cron',
-            hour=9,
-            minute=35,
-            id='daily_briefing',
-            replace_existing=True
-        )
-
-def recover_missed_reminders():
-    """Schedule immediate delivery for reminders missed while the bot was offline.
-
-    Uses scheduler.add_job() (non-blocking) instead of calling send_reminder_job()
-    directly. Direct calls would invoke asyncio.run() on the main thread, blocking
-    startup — the bot would never reach run_polling().
-    """
-    from src.database.core import SessionLocal
-    from src.database.models import Task
-    from src.bot.utils import get_now, to_naive_israel
-    from datetime import datetime, timezone
-
-    now_naive = to_naive_israel(get_now())
-    session = SessionLocal()
-    try:
-        tasks = session.query(Task).filter(
-            Task.status == 'pending',
-            Task.reminder_time != None,
-            Task.reminder_time <= now_naive
-        ).all()
-
-        if not tasks:
-            logger.info("No missed reminders to recover.")
-            return
-
-        missed = [(t.id, t.chat_id) for t in tasks]
-    except Exception as e:
-        logger.error(f"Error querying missed reminders: {e}", exc_info=True)
-        return
-    finally:
-        session.close()
-
-    logger.info(f"Scheduling {len(missed)} missed reminder(s) for background delivery...")
-    for task_id, chat_id in missed:
-        try:
-            scheduler.add_job(
-                'src.scheduler.jobs:send_reminder_job',
-                'date',
-                run_date=datetime.now(timezone.utc),
-                args=[task_id, chat_id],
-                id=f'recover_{task_id}',
-                replace_existing=True
-            )
-        except Exception as e:
-            logger.error(f"  Failed to schedule recovery for task {task_id}: {e}")
+import os
+import asyncio
+import logging
+from sqlalchemy import text
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.executors.asyncio import AsyncIOExecutor
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+from apscheduler.jobstores.memory import MemoryJobStore
+from apscheduler.executors.pool import ThreadPoolExecutor
+from apscheduler.jobstores.base import JobLookupError, ConflictingIdError
+from src.database.core import engine, SCHEDULER_THREADS
+
+logger = logging.getLogger(__name__)
+
+# Briefings are bucketed into slots of this many minutes (must divide 60).
+# Each slot's sends are spread across the slot instead of firing together.
+BRIEFING_SLOT_MINUTES = int(os.getenv("BRIEFING_SLOT_MINUTES", "15"))
+if BRIEFING_SLOT_MINUTES <= 0 or 60 % BRIEFING_SLOT_MINUTES:
+    BRIEFING_SLOT_MINUTES = 15
+
+jobstores = {
+    'default': SQLAlchemyJobStore(engine=engine),
+    # Short-lived jobs that are cheap to lose on restart (e.g. spread-out
+    # briefing sends) — keeps them out of the persistent store
+    'memory': MemoryJobStore(),
+}
+
+# Runs on the bot's event loop (started from the Application's post_init).
+# Jobs that touch the database (reminders, outbox, maintenance) go to the
+# 'threadpool' executor, whose worker threads are counted into the DB pool
+# size (database/core.py): blocking queries never run on the loop the
+# handlers share. Telegram calls go back to the loop through run_on_loop().
+scheduler = AsyncIOScheduler(
+    jobstores=jobstores,
+    executors={
+        'default': AsyncIOExecutor(),
+        'threadpool': ThreadPoolExecutor(SCHEDULER_THREADS),
+    },
+    timezone="Asia/Jerusalem",
+    job_defaults={'misfire_grace_time': None, 'coalesce': True}
+)
+
+# The Application's Bot and event loop, set when the scheduler starts
+_bot = None
+_loop = None
+
+def get_bot():
+    return _bot
+
+def run_on_loop(coroutine):
+    """Runs a coroutine (e.g. Bot calls) on the bot's event loop from a job
+    thread and returns its result."""
+    return asyncio.run_coroutine_threadsafe(coroutine, _loop).result()
+
+# Job IDs that were renamed or removed in past updates.
+# Must be cleaned from the persistent store BEFORE scheduler.start(),
+# because APScheduler deserializes all stored jobs on start and crashes
+# with LookupError if the referenced function no longer exists.
+_STALE_JOB_IDS = ['daily_summary', 'daily_briefing']
+
+def _clean_stale_jobs():
+    """Remove ghost jobs from the persistent store via raw SQL.
+
+    Uses SessionLocal (not engine.connect) so that failed queries get an
+    explicit rollback — preventing dirty connections from leaking back into
+    the pool and causing f405 errors in later callers.
+    """
+    from src.database.core import SessionLocal
+    session = SessionLocal()
+    try:
+        for job_id in _STALE_JOB_IDS:
+            result = session.execute(
+                text("DELETE FROM apscheduler_jobs WHERE id = :id"),
+                {"id": job_id}
+            )
+            if result.rowcount:
+                logger.info(f"Cleaned stale job '{job_id}' from persistent store")
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        logger.warning(f"Could not clean stale jobs (table may not exist yet): {e}")
+    finally:
+        session.close()
+
+def start_scheduler(bot):
+    """Starts the scheduler on the running event loop. Call from the bot's
+    post_init; jobs registered before this are added on start."""
+    global _bot, _loop
+    _bot = bot
+    _loop = asyncio.get_running_loop()
+    _clean_stale_jobs()
+    scheduler.start()
+
+def shutdown_scheduler():
+    if scheduler.running:
+        scheduler.shutdown(wait=False)
+
+def add_reminder_job(task_id: int, run_date, chat_id: int):
+    scheduler.add_job(
+        'src.scheduler.jobs:send_reminder_job',
+        'date',
+        executor='threadpool',
+        run_date=run_date,
+        args=[task_id, chat_id],
+        id=f'reminder_{task_id}',
+        replace_existing=True
+    )
+
+def add_daily_briefing_job():
+    """Registers the briefing tick: once per slot, it picks up only the users
+    whose (per-timezone) briefing time falls in that slot."""
+    scheduler.add_job(
+        'src.scheduler.jobs:briefing_tick_job',
+        'cron',
+        executor='threadpool',
+        minute=f"*/{BRIEFING_SLOT_MINUTES}",
+        id='briefing_tick',
+        replace_existing=True
+    )
+
+def add_archive_job():
+    """Nightly archival of old done tasks, at an off-peak hour (ARCHIVE_TIME, default 03:30)."""
+    hour, minute = (int(x) for x in os.getenv("ARCHIVE_TIME", "03:30").split(":"))
+    scheduler.add_job(
+        'src.scheduler.jobs:archive_done_tasks_job',
+        'cron',
+        executor='threadpool',
+        hour=hour,
+        minute=minute,
+        id='archive_done_tasks',
+        replace_existing=True
+    )
+
+def _parse_times(value):
+    """"HH:MM,HH:MM" -> [(hour, minute), ...]; malformed entries are skipped."""
+    times = []
+    for item in value.split(","):
+        try:
+            hour, minute = (int(x) for x in item.strip().split(":"))
+            times.append((hour, minute))
+        except ValueError:
+            if item.strip():
+                logger.warning(f"Ignoring malformed time '{item}'")
+    return times
+
+def add_pool_jobs():
+    """Pool warm-up before other known load spikes (POOL_WARMUP_TIMES, none by
+    default — briefing slots warm the pool themselves, see briefing_tick_job),
+    and an optional keepalive that stops Neon from suspending the compute
+    during DB_ACTIVE_HOURS."""
+    for hour, minute in _parse_times(os.getenv("POOL_WARMUP_TIMES", "")):
+        scheduler.add_job(
+            'src.scheduler.jobs:warm_pool_job',
+            'cron',
+            executor='threadpool',
+            hour=hour,
+            minute=minute,
+            id=f'warm_pool_{hour:02d}{minute:02d}',
+            jobstore='memory',
+            replace_existing=True
+        )
+
+    if os.getenv("DB_KEEPALIVE", "0") == "1":
+        scheduler.add_job(
+            'src.scheduler.jobs:db_keepalive_job',
+            'interval',
+            executor='threadpool',
+            # Below Neon's default 5-minute autosuspend
+            seconds=int(os.getenv("DB_KEEPALIVE_SECONDS", "240")),
+            id='db_keepalive',
+            jobstore='memory',
+            replace_existing=True
+        )
+
+def add_task_index_job():
+    """Periodic consistency check of the in-memory task index (only when
+    TASK_INDEX_ENABLED)."""
+    from src.database.task_index import TASK_INDEX_ENABLED
+    if not TASK_INDEX_ENABLED:
+        return
+    scheduler.add_job(
+        'src.scheduler.jobs:verify_task_index_job',
+        'interval',
+        executor='threadpool',
+        minutes=int(os.getenv("TASK_INDEX_VERIFY_MINUTES", "30")),
+        id='task_index_verify',
+        jobstore='memory',
+        replace_existing=True
+    )
+
+def add_cache_bus_job():
+    """Subscribes this instance to the cache invalidation bus (only when
+    CACHE_BUS_ENABLED): starts listening now, then applies other instances'
+    events every CACHE_BUS_POLL_SECONDS."""
+    from src.database.cache_bus import CACHE_BUS_ENABLED, CACHE_BUS_POLL_SECONDS, poll
+    if not CACHE_BUS_ENABLED:
+        return
+    poll()
+    scheduler.add_job(
+        'src.scheduler.jobs:poll_cache_bus_job',
+        'interval',
+        seconds=CACHE_BUS_POLL_SECONDS,
+        id='cache_bus_poll',
+        jobstore='memory',
+        max_instances=1,
+        replace_existing=True
+    )
+
+OFFLINE_REPLAY_SECONDS = int(os.getenv("OFFLINE_REPLAY_SECONDS", "5"))
+
+def add_offline_replay_job():
+    """Replays writes queued in degraded mode every OFFLINE_REPLAY_SECONDS
+    (a no-op while nothing is queued). In memory: it must run while the
+    database is down."""
+    scheduler.add_job(
+        'src.scheduler.jobs:replay_offline_writes_job',
+        'interval',
+        seconds=OFFLINE_REPLAY_SECONDS,
+        id='offline_replay',
+        jobstore='memory',
+        executor='threadpool',
+        max_instances=1,
+        replace_existing=True
+    )
+
+OUTBOX_POLL_SECONDS = int(os.getenv("OUTBOX_POLL_SECONDS", "5"))
+
+def add_outbox_job():
+    """Outbox dispatcher: polls for due messages every OUTBOX_POLL_SECONDS
+    (and runs right away when woken by a producer)."""
+    scheduler.add_job(
+        'src.scheduler.jobs:dispatch_outbox_job',
+        'interval',
+        executor='threadpool',
+        seconds=OUTBOX_POLL_SECONDS,
+        id='outbox_dispatch',
+        jobstore='memory',
+        max_instances=1,
+        replace_existing=True
+    )
+
+def wake_outbox_dispatcher():
+    """Runs the dispatcher now instead of at its next poll."""
+    from datetime import datetime, timezone
+    try:
+        scheduler.modify_job('outbox_dispatch', jobstore='memory', next_run_time=datetime.now(timezone.utc))
+    except JobLookupError:
+        pass
+
+# Reminders that come due within this many seconds of each other go out as
+# one digest message per chat (preset times make many land on the same minute)
+REMINDER_DIGEST_SECONDS = int(os.getenv("REMINDER_DIGEST_SECONDS", "15"))
+
+def schedule_reminder_digest(chat_id, delay=None):
+    """Schedules the chat's digest flush, unless one is already pending — the
+    first reminder of a burst opens the window, later ones join it."""
+    from datetime import datetime, timezone, timedelta
+    delay = REMINDER_DIGEST_SECONDS if delay is None else delay
+    try:
+        scheduler.add_job(
+            'src.scheduler.jobs:flush_reminder_digest_job',
+            'date',
+            executor='threadpool',
+            run_date=datetime.now(timezone.utc) + timedelta(seconds=delay),
+            args=[chat_id],
+            id=f'digest_{chat_id}',
+            jobstore='memory'
+        )
+    except ConflictingIdError:
+        pass
+
+def recover_missed_reminders():
+    """Schedule immediate delivery for reminders missed while the bot was offline.
+
+    Uses scheduler.add_job() instead of calling send_reminder_job() directly:
+    the jobs run in the scheduler's thread pool once it starts.
+    """
+    from src.database.core import SessionLocal
+    from src.database.models import Task, ReminderDelivery
+    from src.bot.utils import get_now, to_naive_israel
+    from datetime import datetime, timezone
+    from sqlalchemy import exists
+
+    now_naive = to_naive_israel(get_now())
+    session = SessionLocal()
+    try:
+        # Reminders already in the delivery ledger went out (or are in the outbox)
+        delivered = exists().where(
+            ReminderDelivery.task_id == Task.id,
+            ReminderDelivery.reminder_time == Task.reminder_time
+        )
+        tasks = session.query(Task).filter(
+            Task.status == 'pending',
+            Task.reminder_time != None,
+            Task.reminder_time <= now_naive,
+            ~delivered
+        ).all()
+
+        # Claimed before a restart but never flushed (digest jobs live in memory)
+        unflushed = [row[0] for row in session.query(ReminderDelivery.chat_id).filter(
+            ReminderDelivery.outbox_id.is_(None)
+        ).distinct()]
+        for chat_id in unflushed:
+            schedule_reminder_digest(chat_id, delay=0)
+
+        if not tasks:
+            logger.info("No missed reminders to recover.")
+            return
+
+        missed = [(t.id, t.chat_id) for t in tasks]
+    except Exception as e:
+        logger.error(f"Error querying missed reminders: {e}", exc_info=True)
+        return
+    finally:
+        session.close()
+
+    logger.info(f"Scheduling {len(missed)} missed reminder(s) for background delivery...")
+    for task_id, chat_id in missed:
+        try:
+            scheduler.add_job(
+                'src.scheduler.jobs:send_reminder_job',
+                'date',
+                executor='threadpool',
+                run_date=datetime.now(timezone.utc),
+                args=[task_id, chat_id],
+                id=f'recover_{task_id}',
+                replace_existing=True
+            )
+        except Exception as e:
+            logger.error(f"  Failed to schedule recovery for task {task_id}: {e}")